@@ -1,35 +1,607 @@
+"""
+MoviWeb web application.
+
+:func:`create_app` builds a configured Flask app; nothing is set up at
+import time, so scripts, tests and pre-forking servers only pay for
+what they use::
+
+    gunicorn --preload -w 4 wsgi:app
+
+The per-app objects the views share (data managers, caches, in-memory
+indexes) are built by the factory and kept in ``app.extensions``. None
+of them opens a connection or starts a thread before it is first used,
+and :func:`init_worker` runs in every forked child to drop pooled
+connections and writer threads inherited from the parent, so with
+``--preload`` each worker still sets up its own.
+"""
+import functools
+import hashlib
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import weakref
+from flask import (
+    Flask, Response, abort, current_app, render_template, request,
+    redirect, url_for, flash, g, get_flashed_messages, jsonify, send_file,
+    session, stream_with_context
+)
+from markupsafe import Markup
 from sqlalchemy.exc import IntegrityError
+from werkzeug.local import LocalProxy
 from database import db
 from database.models import User, Movie
-from dotenv import load_dotenv
-from database.sqlite_data_manager import SQLiteDataManager
+from database.sqlite_data_manager import (
+    CATALOGUE, FAVORITES, USERS, SQLiteDataManager, user_scope
+)
+from database.cache import make_cache
+from database.validation import MovieValidationError, validate_movie
+from database.bulk_import import guess_format, import_movies
+from database.export import EXPORTS, FORMATS, MIMETYPES, export_stream
+from database.pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursor,
+    Page,
+    clamp_page_size,
+)
+from database.engine import configure_database, install_pragmas
+from database.async_data_manager import AwaitableDataManager, run_inline
 from urllib.parse import urlparse, urljoin, urlencode
 
-data_manager = SQLiteDataManager()
+basedir = os.path.abspath(os.path.dirname(__file__))
+db_path = os.path.join(basedir, "database", "movies.sqlite3")
 
-load_dotenv()
+# served by /posters/<id> until the poster is cached, see poster()
+POSTER_PLACEHOLDER = os.path.join("img", "poster-placeholder.svg")
 
-app = Flask(__name__)
+# create_app() settings for scripts that only need the database
+SCRIPT_CONFIG = {
+    "CATALOGUE_SNAPSHOT": False,
+    "WRITE_QUEUE": False,
+    "ASYNC_DATA_MANAGER": False,
+    "POSTER_CACHE": False,
+    "RECOMMENDATIONS": False,
+    "AUTOCOMPLETE": False,
+    "METRICS_ENABLED": False,
+}
 
-app.secret_key = os.getenv("SECRET_KEY")
-if not app.secret_key:
-    raise RuntimeError("SECRET_KEY is not set in .env!")
 
-basedir = os.path.abspath(os.path.dirname(__file__))
-db_path = os.path.join(basedir, "database", "movies.sqlite3")
+def _flag(name, default):
+    return os.getenv(name, default) == "1"
+
+
+def settings_from_env():
+    """
+    Read the app settings from the environment (and ``.env``).
+
+    Returns:
+        dict: Config keys named like their environment variables, with
+        the defaults documented in the README.
+    """
+    return {
+        "SECRET_KEY": os.getenv("SECRET_KEY"),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "DATABASE_PROFILE": os.getenv("DATABASE_PROFILE", "default"),
+        "DATABASE_READ_ENGINE": _flag("DATABASE_READ_ENGINE", "0"),
+        "DATABASE_READ_URL": os.getenv("DATABASE_READ_URL"),
+        "EXPLORE_PAGE_SIZE": int(
+            os.getenv("EXPLORE_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+        ),
+        "LEADERBOARD_SIZE": int(os.getenv("LEADERBOARD_SIZE", 5)),
+        "MAX_FAVORITE_CHANGES": int(os.getenv("MAX_FAVORITE_CHANGES", 1000)),
+        "APP_VERSION": os.getenv("APP_VERSION", ""),
+        "RESPONSE_CACHE_SIZE": int(os.getenv("RESPONSE_CACHE_SIZE", 512)),
+        "RESPONSE_CACHE_TTL": float(os.getenv("RESPONSE_CACHE_TTL", 300)),
+        "CARD_CACHE_SIZE": int(os.getenv("CARD_CACHE_SIZE", 4096)),
+        "CATALOGUE_SNAPSHOT": _flag("CATALOGUE_SNAPSHOT", "0"),
+        "CATALOGUE_SNAPSHOT_MAX_AGE": float(
+            os.getenv("CATALOGUE_SNAPSHOT_MAX_AGE", 1)
+        ),
+        "WRITE_QUEUE": _flag("WRITE_QUEUE", "0"),
+        "WRITE_QUEUE_MAX_BATCH": int(os.getenv("WRITE_QUEUE_MAX_BATCH", 64)),
+        "WRITE_QUEUE_MAX_DELAY_MS": float(
+            os.getenv("WRITE_QUEUE_MAX_DELAY_MS", 2)
+        ),
+        "ASYNC_DATA_MANAGER": _flag("ASYNC_DATA_MANAGER", "0"),
+        "POSTER_CACHE": _flag("POSTER_CACHE", "1"),
+        "POSTER_CACHE_DIR": os.getenv(
+            "POSTER_CACHE_DIR", os.path.join(basedir, "cache", "posters")
+        ),
+        "POSTER_CACHE_MAX_MB": int(os.getenv("POSTER_CACHE_MAX_MB", 512)),
+        "RECOMMENDATIONS": _flag("RECOMMENDATIONS", "1"),
+        "RECOMMENDATIONS_MAX_AGE": float(
+            os.getenv("RECOMMENDATIONS_MAX_AGE", 60)
+        ),
+        "AUTOCOMPLETE": _flag("AUTOCOMPLETE", "1"),
+        "AUTOCOMPLETE_MAX_RESULTS": int(
+            os.getenv("AUTOCOMPLETE_MAX_RESULTS", 10)
+        ),
+        "AUTOCOMPLETE_MAX_AGE": float(os.getenv("AUTOCOMPLETE_MAX_AGE", 1)),
+        "METRICS_ENABLED": _flag("METRICS_ENABLED", "1"),
+        "SLOW_QUERY_MS": float(os.getenv("SLOW_QUERY_MS", 250)),
+    }
+
+
+class Services:
+    """
+    Objects the views of one app share, built by :func:`create_app`.
+
+    Attributes:
+        data_manager (SQLiteDataManager): Reads and writes.
+        page_data: Data manager awaited by the async views, see
+            :func:`async_view`.
+        response_cache: Rendered page fragments, see
+            :func:`render_cached`.
+        card_cache: Rendered movie cards, see :func:`movie_card`.
+        poster_cache (PosterCache | None): Local poster copies.
+        recommender (Recommender | None): "Because you liked" rows.
+        title_index (TitleIndex | None): Autocomplete index.
+        metrics (Metrics | None): Request and query metrics.
+        render_version (str | None): Template digest in every ETag,
+            computed on first use.
+    """
+
+    def __init__(self, data_manager, page_data, response_cache, card_cache):
+        self.data_manager = data_manager
+        self.page_data = page_data
+        self.response_cache = response_cache
+        self.card_cache = card_cache
+        self.poster_cache = None
+        self.recommender = None
+        self.title_index = None
+        self.metrics = None
+        self.render_version = None
+
+    def close(self):
+        """
+        Detach the caches from the data manager's signals and stop their
+        threads; the app must not serve requests afterwards.
+        """
+        if self.data_manager.snapshot is not None:
+            self.data_manager.snapshot.disconnect_signals()
+        if self.poster_cache is not None:
+            self.poster_cache.disconnect_signals()
+            self.poster_cache.shutdown(wait=False)
+        if self.recommender is not None:
+            self.recommender.disconnect_signals()
+        if self.title_index is not None:
+            self.title_index.disconnect_signals()
+
+
+def services(app=None):
+    """
+    Return the :class:`Services` of ``app``.
+
+    Args:
+        app (flask.Flask, optional): Defaults to the current app.
+
+    Returns:
+        Services: The app's shared objects.
+    """
+    return (app or current_app).extensions["moviweb"]
+
+
+# The views use these like module globals; each resolves to the object
+# of the app handling the request.
+data_manager = LocalProxy(lambda: services().data_manager)
+page_data = LocalProxy(lambda: services().page_data)
+response_cache = LocalProxy(lambda: services().response_cache)
+card_cache = LocalProxy(lambda: services().card_cache)
+
+# (rule, view, options), (name, function) and (code, handler) added to
+# every app by create_app(), see route()
+_routes = []
+_template_globals = []
+_error_handlers = []
+
+
+def route(rule, **options):
+    """Like ``app.route``, for every app :func:`create_app` builds."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+
+    return decorator
+
+
+def template_global(function):
+    """Like ``app.template_global()``, for every app."""
+    _template_globals.append(function)
+    return function
+
+
+def errorhandler(code):
+    """Like ``app.errorhandler``, for every app."""
+    def decorator(handler):
+        _error_handlers.append((code, handler))
+        return handler
+
+    return decorator
+
+
+def _build_services(app):
+    """Create the data managers, caches and indexes ``app`` is set up for."""
+    config = app.config
+    data_manager = SQLiteDataManager()
+
+    # In-memory copy of the movie table the catalogue pages are ordered
+    # and sliced in, see database/snapshot.py
+    if config["CATALOGUE_SNAPSHOT"]:
+        data_manager.enable_snapshot(
+            max_age=config["CATALOGUE_SNAPSHOT_MAX_AGE"]
+        )
+
+    # Writes committed in groups by a writer thread, see
+    # database/write_queue.py
+    if config["WRITE_QUEUE"]:
+        data_manager.enable_write_queue(
+            app,
+            max_batch=config["WRITE_QUEUE_MAX_BATCH"],
+            max_delay=config["WRITE_QUEUE_MAX_DELAY_MS"] / 1000,
+        )
+
+    # Data manager awaited by the async views. ASYNC_DATA_MANAGER=1
+    # (serve through asgi.py) runs their queries on the server's event
+    # loop; otherwise the views call the synchronous manager inline.
+    if config["ASYNC_DATA_MANAGER"]:
+        from database.async_data_manager import AsyncSQLiteDataManager
+        page_data = AsyncSQLiteDataManager(
+            config["SQLALCHEMY_DATABASE_URI"],
+            config["SQLITE_PRAGMAS"],
+            **config["SQLALCHEMY_ENGINE_OPTIONS"],
+        )
+    else:
+        page_data = AwaitableDataManager(data_manager)
+
+    shared = Services(
+        data_manager,
+        page_data,
+        # Rendered page fragments keyed on the data generations they
+        # were built from, see render_cached().
+        make_cache(
+            config["RESPONSE_CACHE_SIZE"], ttl=config["RESPONSE_CACHE_TTL"]
+        ),
+        # Rendered movie cards, see movie_card()
+        make_cache(config["CARD_CACHE_SIZE"]),
+    )
+
+    # Local poster copies and thumbnails, see database/posters.py
+    if config["POSTER_CACHE"]:
+        from database.posters import PosterCache
+        shared.poster_cache = PosterCache(
+            config["POSTER_CACHE_DIR"],
+            max_bytes=config["POSTER_CACHE_MAX_MB"] * 1024 * 1024,
+        )
+        shared.poster_cache.connect_signals(data_manager)
+
+    def read_detached(statement):
+        # for indexes that reload on their own thread, outside any request
+        with app.app_context():
+            return db.session.execute(statement).all()
+
+    # "Because you liked" rows on /explore, see database/recommendations.py
+    if config["RECOMMENDATIONS"]:
+        from database.recommendations import Recommender
+        shared.recommender = Recommender(
+            read_detached,
+            FAVORITES,
+            max_age=config["RECOMMENDATIONS_MAX_AGE"],
+        )
+        shared.recommender.connect_signals(data_manager)
+
+    # Search box suggestions from an in-memory prefix index, built on a
+    # background thread by the first /autocomplete request, see
+    # database/autocomplete.py
+    if config["AUTOCOMPLETE"]:
+        from database.autocomplete import TitleIndex
+        shared.title_index = TitleIndex(
+            read_detached,
+            CATALOGUE,
+            max_results=config["AUTOCOMPLETE_MAX_RESULTS"],
+            max_age=config["AUTOCOMPLETE_MAX_AGE"],
+        )
+        shared.title_index.connect_signals(data_manager)
+
+    return shared
+
+
+def _install_metrics(app, shared):
+    """Server-Timing headers, slow-query log and /metrics."""
+    from database.metrics import install_metrics
+
+    metrics = install_metrics(app, db, shared.data_manager, shared.page_data)
+    if metrics is not None:
+        response_cache, card_cache = shared.response_cache, shared.card_cache
+        metrics.registry.add_collector(lambda: (
+            ("moviweb_response_cache_hits_total", "counter",
+             "Response cache hits.", response_cache.hits),
+            ("moviweb_response_cache_misses_total", "counter",
+             "Response cache misses.", response_cache.misses),
+            ("moviweb_response_cache_entries", "gauge",
+             "Entries in the response cache.", len(response_cache)),
+            ("moviweb_card_cache_hits_total", "counter",
+             "Movie card cache hits.", card_cache.hits),
+            ("moviweb_card_cache_misses_total", "counter",
+             "Movie card cache misses.", card_cache.misses),
+        ))
+    return metrics
+
+
+def create_app(config=None):
+    """
+    Build and configure the MoviWeb app.
+
+    Reads ``.env`` and the environment (see :func:`settings_from_env`),
+    then applies ``config`` on top. Creates the engines and the shared
+    objects without connecting to the database or starting threads;
+    that happens on first use, i.e. in each worker after a fork.
+
+    Args:
+        config (dict, optional): Config values overriding the
+            environment, e.g. ``{"SQLALCHEMY_DATABASE_URI": ...}`` or
+            :data:`SCRIPT_CONFIG`.
+
+    Returns:
+        flask.Flask: The app, with its :class:`Services` in
+        ``app.extensions["moviweb"]``.
+
+    Raises:
+        RuntimeError: If no ``SECRET_KEY`` is configured.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.update(settings_from_env())
+    app.config.update(config or {})
+    configure_database(app, db_path)
+    if not app.secret_key:
+        raise RuntimeError("SECRET_KEY is not set in .env!")
+
+    db.init_app(app)
+    install_pragmas(app, db)
+
+    shared = app.extensions["moviweb"] = _build_services(app)
+    if app.config["METRICS_ENABLED"]:
+        shared.metrics = _install_metrics(app, shared)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for function in _template_globals:
+        app.add_template_global(function)
+    for code, handler in _error_handlers:
+        app.register_error_handler(code, handler)
+
+    _apps.add(app)
+    return app
+
+
+def warm_up(app):
+    """
+    Do the work of the first requests once, before workers are forked.
+
+    Compiles the templates, configures the mappers, runs the queries of
+    the main pages, so that SQLAlchemy has their SQL compiled, and reads
+    the favourites the recommendations are computed from; forked
+    workers inherit all of it and their first requests cost about what
+    later ones do. The connections used are closed again. Called by
+    ``wsgi.py``; harmless without ``--preload``, where every worker
+    pays it once at start-up instead of on its first requests.
+
+    Args:
+        app (flask.Flask): An app built by :func:`create_app`.
+    """
+    from sqlalchemy.orm import configure_mappers
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    configure_mappers()
+    with app.app_context():
+        shared = services(app)
+        shared.render_version = _render_version(app)
+        try:
+            shared.data_manager.get_version(CATALOGUE, USERS)
+            shared.data_manager.get_top_movies(
+                "week", app.config["LEADERBOARD_SIZE"]
+            )
+            shared.data_manager.get_movie_cards_page(
+                page_size=app.config["EXPLORE_PAGE_SIZE"]
+            )
+            shared.data_manager.get_user_summaries()
+            shared.data_manager.get_user_names()
+            if shared.recommender is not None:
+                # the favourites, read once for all forked workers
+                shared.recommender.load()
+        except Exception as e:
+            # e.g. not migrated yet; the requests will report it
+            app.logger.warning(f"Warm-up queries failed: {e}")
+        finally:
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
 
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+def init_worker(app):
+    """
+    Reset what a forked worker must not share with its parent.
+
+    Runs in every child process for each app :func:`create_app` built
+    that is still alive, so ``gunicorn --preload`` (or any fork after
+    the app was built) needs no extra hook. Pooled connections are
+    dropped without closing them, as they still belong to the parent,
+    and a write queue started in the parent gets a fresh writer thread
+    on first use.
+
+    Args:
+        app (flask.Flask): An app built by :func:`create_app`.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    shared = services(app)
+    engine = getattr(shared.page_data, "sync_engine", None)
+    if engine is not None:
+        engine.dispose(close=False)
+    if shared.data_manager.write_queue is not None:
+        shared.data_manager.write_queue.after_fork()
+
+
+# Apps built by create_app(); held weakly, so discarded apps are neither
+# kept alive nor re-initialised in forked children.
+_apps = weakref.WeakSet()
+
+
+def _after_fork():
+    for app in list(_apps):
+        init_worker(app)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+async def render_cached(key, template, load_context):
+    """
+    Render ``template`` or reuse a cached rendering of it.
+
+    ``key`` must contain every input of the fragment, including the
+    generations from :pymeth:`SQLiteDataManager.get_generations`, so a
+    write to the underlying data automatically produces a new key.
+
+    Args:
+        key (tuple): Hashable cache key.
+        template (str): Fragment template free of per-request state
+            such as flash messages.
+        load_context (callable): Coroutine function returning the
+            template context; only awaited (and only queries the
+            database) on a cache miss.
+
+    Returns:
+        markupsafe.Markup: The rendered fragment.
+    """
+    html = response_cache.get(key)
+    if html is None:
+        html = render_template(template, **await load_context())
+        response_cache.set(key, html)
+    return Markup(html)
+
+
+def _render_version(app):
+    """Digest of the templates and ``APP_VERSION``, part of every ETag."""
+    digest = hashlib.sha256(current_app.config["APP_VERSION"].encode())
+    root = os.path.join(app.root_path, app.template_folder)
+    for folder, dirs, files in sorted(os.walk(root)):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(folder, name), "rb") as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:8]
+
+
+def render_version():
+    """Return :func:`_render_version` of the current app, computed once."""
+    shared = services()
+    if shared.render_version is None:
+        shared.render_version = _render_version(current_app)
+    return shared.render_version
+
+
+def conditional(scopes):
+    """
+    Answer ``If-None-Match`` from the data version before rendering.
+
+    The ETag combines :func:`render_version` with the generations of
+    the data version scopes the page is built from, which every write
+    method bumps, so a matching request is answered with ``304``
+    after a single primary key lookup. Otherwise the view runs with the
+    :class:`Version` in ``g.data_version`` (for its cache keys) and the
+    response gets the ETag and ``Last-Modified``.
+
+    Pages showing flash messages are neither validated nor tagged, as
+    the messages are not part of the data version.
+
+    Args:
+        scopes (callable): Returns the scopes of the current request.
+
+    Returns:
+        callable: Decorator for coroutine views; apply it below
+        :func:`async_view`.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def run(*args, **kwargs):
+            try:
+                version = await page_data.get_version(*scopes())
+            except Exception as e:
+                current_app.logger.error(f"Data version lookup failed: {e}")
+                return await view(*args, **kwargs)
+            g.data_version = version
+            etag = "-".join(
+                map(str, (render_version(), *version.generations))
+            )
+            if ("_flashes" not in session
+                    and request.if_none_match.contains_weak(etag)):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(
+                    await view(*args, **kwargs)
+                )
+                if get_flashed_messages() or response.status_code != 200:
+                    response.cache_control.no_store = True
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = version.updated
+            # the browser may keep a copy but has to revalidate it
+            response.cache_control.no_cache = True
+            return response
+
+        return run
 
-db.init_app(app)
+    return decorator
 
 
-@app.route("/")
-def home():
+def _explore_scopes():
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return (CATALOGUE,)
+    # the recommendations on a user's first page follow everyone's
+    # favourites, not only the user's own
+    recommends = (
+        services().recommender is not None
+        and not request.args.get("q", "").strip()
+        and not (request.args.get("after") or request.args.get("before"))
+    )
+    if recommends:
+        return (CATALOGUE, FAVORITES, user_scope(user_id))
+    return (CATALOGUE, user_scope(user_id))
+
+
+def async_view(view):
     """
-    Render the landing page.
+    Serve an ``async def`` view that awaits :data:`page_data`.
+
+    With the synchronous data manager the coroutine never suspends and
+    is run inline, sparing Flask's per-request event loop; with
+    ``ASYNC_DATA_MANAGER=1`` it is handed to the app's event loop. The
+    choice is made per request, as the data manager belongs to the app.
+
+    Args:
+        view (callable): Coroutine function.
+
+    Returns:
+        callable: Synchronous wrapper.
+    """
+    @functools.wraps(view)
+    def run(*args, **kwargs):
+        if isinstance(services().page_data, AwaitableDataManager):
+            return run_inline(view(*args, **kwargs))
+        return current_app.ensure_sync(view)(*args, **kwargs)
+
+    return run
+
+
+@route("/")
+@async_view
+async def home():
+    """
+    Render the landing page with the most favourited movies of this
+    week and of all time.
 
     Returns:
         flask.Response: The rendered *index.html* page.
@@ -37,62 +609,152 @@ def home():
         message and redirects to :pyfunc:`list_users`.
     """
     try:
-        return render_template("index.html")
+        leaderboards = {}
+        try:
+            for window in ("week", "all"):
+                leaderboards[window] = await page_data.get_top_movies(
+                    window, current_app.config["LEADERBOARD_SIZE"]
+                )
+        except Exception as e:
+            # e.g. not migrated yet; the landing page works without them
+            current_app.logger.warning(f"Leaderboards unavailable: {e}")
+            leaderboards = {}
+        return render_template("index.html", leaderboards=leaderboards)
     except Exception as e:
-        app.logger.error(f"Home page failed: {e}")
+        current_app.logger.error(f"Home page failed: {e}")
         flash("Something went wrong loading the home page.", "danger")
         return redirect(url_for("list_users"))
 
 
-@app.route("/explore")
-def explore_movies():
+async def load_recommendations(user_id):
     """
-    Display the movie catalogue with optional search, sorting and
-    per-user favourite highlighting.
+    Return the "because you liked" rows of a user with their movies.
+
+    Args:
+        user_id (int): User to recommend for.
+
+    Returns:
+        list[tuple[MovieCard, list[MovieCard]]]: ``(liked movie,
+        similar movies)`` pairs from the app's :class:`Recommender`.
+    """
+    rows = services().recommender.because_you_liked(user_id)
+    if not rows:
+        return []
+    movies = await page_data.get_movie_cards(
+        {movie_id for seed, similar in rows for movie_id in (seed, *similar)}
+    )
+    return [
+        (movies[seed], [movies[i] for i in similar if i in movies])
+        for seed, similar in rows if seed in movies
+    ]
+
+
+@route("/explore")
+@async_view
+@conditional(_explore_scopes)
+async def explore_movies():
+    """
+    Display one page of the movie catalogue with optional search,
+    sorting and per-user favourite highlighting.
 
     Query Args:
-        q (str, optional): Case-insensitive substring filter for the
-            movie title.
-        sort_by (str, optional): ``"title"``, ``"rating"`` or ``"year"``.
+        q (str, optional): Words matched as title prefixes.
+        sort_by (str, optional): ``"title"``, ``"rating"``, ``"year"`` or
+            ``"relevance"`` (best search matches first).
         user_id (int, optional): Current user context used to highlight
             favourites.
+        after (str, optional): Opaque cursor of the page to continue after.
+        before (str, optional): Opaque cursor of the page to go back from.
+        per_page (int, optional): Page size, defaults to the
+            ``EXPLORE_PAGE_SIZE`` setting.
+        fuzzy (str, optional): ``"1"`` matches ``q`` by trigram
+            similarity, so misspelt titles are found; returns a single
+            page of the closest titles, most similar first.
 
     Returns:
-        flask.Response: Rendered *explore.html* containing the filtered
-        movie list and the current user's `favorite_movies`.
+        flask.Response: Rendered *explore.html* containing the current
+        page of non-favourite movies, the pagination cursors and, on the
+        first page, the current user's `favorite_movies`; 400 for a
+        malformed cursor.
     """
     try:
         query = request.args.get("q", "").strip().lower()
         sort_by = request.args.get("sort")
         user_id = request.args.get("user_id", type=int)
-        user = User.query.get(user_id) if user_id else None
-
-        movies = data_manager.get_all_movies(query=query, sort_by=sort_by)
-
-        favorite_movies = user.favorites.all() if user else []
-        # restliche Filmliste ohne Duplikate:
-        main_list = [m for m in movies if m not in favorite_movies]
+        per_page = request.args.get("per_page", type=int)
+        # both the keyset pages and the fuzzy matches are bounded
+        page_size = clamp_page_size(
+            per_page or current_app.config["EXPLORE_PAGE_SIZE"]
+        )
+        after = request.args.get("after")
+        before = request.args.get("before")
+        fuzzy = bool(query) and request.args.get("fuzzy") == "1"
+
+        async def load_catalogue():
+            user = await page_data.get_user(user_id) if user_id else None
+            # favourites are listed on top, so the catalogue below skips them
+            if fuzzy:
+                # one page of the closest titles, without further pages
+                page = Page(await page_data.fuzzy_search(
+                    query,
+                    limit=page_size,
+                    user_id=user.id if user else None,
+                    exclude_favorites=user is not None,
+                ), None, None)
+            else:
+                page = await page_data.get_movie_cards_page(
+                    query=query,
+                    sort_by=sort_by,
+                    after=after,
+                    before=before,
+                    page_size=page_size,
+                    user_id=user.id if user else None,
+                    exclude_favorites=user is not None,
+                )
+            favorite_movies = []
+            recommendations = []
+            if user and not (after or before):
+                favorite_movies = await page_data.get_favorite_cards(
+                    user.id, sort_by=sort_by
+                )
+                if services().recommender is not None and not query:
+                    recommendations = await load_recommendations(user.id)
+            return dict(
+                favorite_movies=favorite_movies,
+                recommendations=recommendations,
+                movies=page.items,
+                user=user,
+                search_query=query,
+                fuzzy=fuzzy,
+                selected_sort=sort_by,
+                next_cursor=page.next_cursor,
+                prev_cursor=page.prev_cursor,
+                per_page=per_page,
+            )
 
-        return render_template(
-            "explore.html",
-            favorite_movies=favorite_movies,
-            movies=main_list,
-            user=user,
-            search_query=query,
-            selected_sort=sort_by,
+        key = (
+            "explore", query, sort_by, user_id, after, before, per_page,
+            fuzzy, *g.data_version.generations,
+        )
+        content = await render_cached(
+            key, "partials/explore_content.html", load_catalogue
         )
+        return render_template("explore.html", content=content)
+    except InvalidCursor:
+        abort(400)
     except Exception as e:
-        app.logger.error(f"Explore failed: {e}")
+        current_app.logger.error(f"Explore failed: {e}")
         flash("Something went wrong.", "danger")
-        return render_template(
-            "explore.html",
+        content = render_template(
+            "partials/explore_content.html",
             movies=[],
             favorite_movies=[],
             user=None
         )
+        return render_template("explore.html", content=Markup(content))
 
 
-@app.route("/users/<int:user_id>/add_movie", methods=['GET', 'POST'])
+@route("/users/<int:user_id>/add_movie", methods=['GET', 'POST'])
 def add_movie(user_id):
     """
     Add a new movie for a user or show the add-movie form.
@@ -106,47 +768,27 @@ def add_movie(user_id):
             * **POST** – redirect to *explore* with a success or error
               flash message.
     """
-    user = User.query.get_or_404(user_id)
+    user = db.get_or_404(User, user_id)
 
     if request.method == 'POST':
         try:
-            title = request.form["title"]
-            year = int(request.form["year"])
-            rating = float(request.form["rating"])
-            poster = request.form["poster"]
-
-            if not title:
-                flash("Title is required.", "danger")
-            elif year < 1888 or year > 2100:
-                flash(
-                    "Please enter a valid release year (1888–2100).",
-                    "danger"
-                )
-            elif rating < 0 or rating > 10:
-                flash(
-                    "Rating must be between 0 and 10.",
-                    "danger"
-                )
-            elif not poster.startswith("http"):
-                flash(
-                    "Please enter a valid poster URL.",
-                    "danger"
-                )
-            else:
-                data_manager.add_movie(user_id, title, year, rating, poster)
-                flash(
-                    "Movie added successfully!",
-                    "success"
-                )
-                return redirect(url_for("explore_movies", user_id=user.id))
-
-        except ValueError:
+            title, year, rating, poster = validate_movie(
+                request.form["title"],
+                request.form["year"],
+                request.form["rating"],
+                request.form["poster"],
+            )
+            data_manager.add_movie(user_id, title, year, rating, poster)
             flash(
-                "Year must be a number and rating must be a valid float.",
-                "danger"
+                "Movie added successfully!",
+                "success"
             )
+            return redirect(url_for("explore_movies", user_id=user.id))
+
+        except MovieValidationError as e:
+            flash(str(e), "danger")
         except Exception as e:
-            app.logger.error(f"Add movie failed: {e}")
+            current_app.logger.error(f"Add movie failed: {e}")
             flash(
                 "Something went wrong while adding the movie.",
                 "danger"
@@ -155,7 +797,84 @@ def add_movie(user_id):
     return render_template("add_movie.html", user=user)
 
 
-@app.route("/update/<movie_id>", methods=['GET', 'POST'])
+@route("/users/<int:user_id>/import", methods=["POST"])
+def import_user_movies(user_id):
+    """
+    Bulk import movies for a user from an uploaded CSV or JSON Lines file.
+
+    Form Args:
+        file: The upload, with ``title``, ``year``, ``rating`` and
+            ``poster`` columns (CSV) or keys (one JSON object per line).
+        format (str, optional): ``"csv"`` or ``"jsonl"``; guessed from
+            the file name when omitted.
+
+    Args:
+        user_id (int): Primary key of the user who will own the movies.
+
+    Returns:
+        flask.Response: JSON report with the ``imported`` and
+        ``rejected`` counts and the first rejected rows, or a 400 error
+        if no usable file was sent.
+    """
+    db.get_or_404(User, user_id)
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify(error="No file uploaded."), 400
+    fmt = request.form.get("format") or guess_format(upload.filename)
+    if fmt is None:
+        return jsonify(error="Unknown file format, use csv or jsonl."), 400
+
+    try:
+        report = import_movies(data_manager, user_id, upload.stream, fmt)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Import for user {user_id} failed: {e}")
+        return jsonify(error="Import failed."), 500
+    return jsonify(report.as_dict())
+
+
+@route("/export/<kind>.<fmt>")
+def export_data(kind, fmt):
+    """
+    Stream the catalogue, one user's movies or the favourites table.
+
+    Rows are read in batches and written to the response as they come,
+    so memory use stays flat whatever the table size.
+
+    Args:
+        kind (str): ``"movies"`` or ``"favorites"``.
+        fmt (str): ``"csv"`` or ``"ndjson"``.
+
+    Query Args:
+        user_id (int, optional): Only export this user's rows.
+        gzip (str, optional): ``"1"`` to receive a gzip-compressed file.
+
+    Returns:
+        flask.Response: A streamed file download, or 404 for an unknown
+        export or format.
+    """
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    user_id = request.args.get("user_id", type=int)
+    compress = request.args.get("gzip") == "1"
+
+    filename = f"{kind}.{fmt}"
+    if user_id is not None:
+        filename = f"user{user_id}-{filename}"
+    if compress:
+        filename += ".gz"
+
+    stream = export_stream(kind, fmt, user_id=user_id, compress=compress)
+    return Response(
+        stream_with_context(stream),
+        mimetype="application/gzip" if compress else MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@route("/update/<movie_id>", methods=['GET', 'POST'])
 def update_movie(movie_id):
     """
     Edit an existing movie entry.
@@ -169,55 +888,31 @@ def update_movie(movie_id):
             * **POST** – redirect to *explore* on success, or re-render the
               form with validation errors.
     """
-    movie = Movie.query.get_or_404(movie_id)
+    movie = db.get_or_404(Movie, movie_id)
 
     if request.method == "POST":
         try:
-            title = request.form["title"]
-            year = int(request.form["year"])
-            rating = float(request.form["rating"])
-            poster = request.form["poster"]
-
-            # Validation logic
-            if not title:
-                flash(
-                    "Title is required.",
-                    "danger"
-                )
-            elif year < 1888 or year > 2100:
-                flash(
-                    "Please enter a valid release year (1888–2100).",
-                    "danger"
-                )
-            elif rating < 0 or rating > 10:
-                flash(
-                    "Rating must be between 0 and 10.",
-                    "danger"
-                )
-            elif not poster.startswith("http"):
-                flash(
-                    "Please enter a valid poster URL.",
-                    "danger"
-                )
-            else:
-                data_manager.update_movie(
-                    movie_id, title, year, rating, poster
-                )
-                flash(
-                    "Movie updated successfully!",
-                    "success"
-                )
-                return redirect(url_for(
-                    "explore_movies", user_id=movie.user_id)
-                )
-
-        except ValueError:
+            title, year, rating, poster = validate_movie(
+                request.form["title"],
+                request.form["year"],
+                request.form["rating"],
+                request.form["poster"],
+            )
+            data_manager.update_movie(
+                movie_id, title, year, rating, poster
+            )
             flash(
-                "Year must be a number and rating must be a valid float.",
-                "danger"
+                "Movie updated successfully!",
+                "success"
             )
+            return redirect(url_for(
+                "explore_movies", user_id=movie.user_id)
+            )
+
+        except MovieValidationError as e:
+            flash(str(e), "danger")
         except Exception as e:
-            app.logger.error(f"Error updating movie {movie_id}: {e}")
+            current_app.logger.error(f"Error updating movie {movie_id}: {e}")
             flash(
                 "Failed to update the movie. Please try again.",
                 "danger"
@@ -226,7 +921,7 @@ def update_movie(movie_id):
     return render_template("update_movie.html", movie=movie)
 
 
-@app.route("/delete/<movie_id>")
+@route("/delete/<movie_id>")
 def delete_movie(movie_id):
     """
     Delete a movie and redirect back to *explore*.
@@ -239,37 +934,46 @@ def delete_movie(movie_id):
         depending on success.
     """
     try:
-        movie = Movie.query.get_or_404(movie_id)
+        movie = db.get_or_404(Movie, movie_id)
         success = data_manager.delete_movie(movie_id)
         if success:
             flash(f"'{movie.title}' was deleted successfully!", "success")
         else:
             flash("Movie not found.", "warning")
     except Exception as e:
-        app.logger.error(f"Error deleting movie {movie_id}: {e}")
+        current_app.logger.error(f"Error deleting movie {movie_id}: {e}")
         flash("Could not delete the movie. Please try again.", "danger")
 
     return redirect(url_for("explore_movies"))
 
 
-@app.route("/users")
-def list_users():
+@route("/users")
+@async_view
+@conditional(lambda: (USERS,))
+async def list_users():
     """
-    List all active users.
+    List all active users with their movie and favourite counts.
 
     Returns:
         flask.Response: Rendered *users.html* page.
     """
     try:
-        users = User.query.filter_by(is_active=True).all()
-        return render_template("users.html", users=users)
+        async def load_users():
+            return dict(users=await page_data.get_user_summaries())
+
+        key = ("users", *g.data_version.generations)
+        content = await render_cached(
+            key, "partials/users_content.html", load_users
+        )
+        return render_template("users.html", content=content)
     except Exception as e:
-        app.logger.error(f"Error loading users: {e}")
+        current_app.logger.error(f"Error loading users: {e}")
         flash("Failed to load users.", "danger")
-        return render_template("users.html", users=[])
+        content = render_template("partials/users_content.html", users=[])
+        return render_template("users.html", content=Markup(content))
 
 
-@app.route("/add_user", methods=['GET', 'POST'])
+@route("/add_user", methods=['GET', 'POST'])
 def add_user():
     """
     Create a new user or render the add-user form.
@@ -297,7 +1001,9 @@ def add_user():
                     "danger"
                 )
             except Exception as e:
-                app.logger.error(f"Unexpected error while adding user: {e}")
+                current_app.logger.error(
+                    f"Unexpected error while adding user: {e}"
+                )
                 flash(
                     "An unexpected error occurred. Please try again.",
                     "danger"
@@ -310,25 +1016,47 @@ def add_user():
     return render_template("add_user.html")
 
 
-@app.route("/favorite/<int:movie_id>", methods=["POST"])
+def _wants_json():
+    """Whether the client asked for JSON rather than an HTML page."""
+    best = request.accept_mimetypes.best_match(
+        ["text/html", "application/json"]
+    )
+    return best == "application/json"
+
+
+@route("/favorite/<int:movie_id>", methods=["POST"])
 def toggle_favorite(movie_id):
     """
     Toggle the *favorite* flag for a movie and return to the previous page.
 
+    A request that accepts ``application/json`` (the favourite buttons
+    on */explore* send one) gets the new state instead of a redirect,
+    so the page can update in place.
+
     Args:
         movie_id (int): Primary key of the movie whose favourite status
             should be toggled.
 
     Returns:
         flask.Response: Redirect back to the referrer (including its
-        query string) or to *explore* if no referrer exists.
+        query string) or to *explore* if no referrer exists; or JSON
+        ``{"movie_id", "favorite"}``, 400 without a ``user_id``. 404 if
+        the user or the movie does not exist.
     """
     user_id = request.form.get("user_id", type=int)
     if not user_id:
+        if _wants_json():
+            return jsonify(error="Please choose a user first."), 400
         flash("Please choose a user first.", "warning")
         return redirect(url_for("choose_user", next_page="explore"))
 
     added = data_manager.toggle_favorite(user_id, movie_id)
+    if added is None:
+        if _wants_json():
+            return jsonify(error="User or movie not found."), 404
+        abort(404)
+    if _wants_json():
+        return jsonify(movie_id=movie_id, favorite=added)
     flash(
         "Added to favorites!" if added else "Removed from favorites!",
         "info"
@@ -339,7 +1067,58 @@ def toggle_favorite(movie_id):
         )
 
 
-@app.route("/choose_user")
+@route("/users/<int:user_id>/favorites", methods=["POST"])
+def update_favorites(user_id):
+    """
+    Add and remove many favourites of a user in one transaction.
+
+    JSON Body:
+        add (list[int], optional): Movies to mark as favourite.
+        remove (list[int], optional): Movies to unmark.
+
+    Both lists together may hold up to ``MAX_FAVORITE_CHANGES`` ids and
+    must not share one. Adding an existing or removing a missing
+    favourite is not an error.
+
+    Args:
+        user_id (int): Primary key of the user.
+
+    Returns:
+        flask.Response: JSON with ``changed`` (ids whose favourite row
+        was written) and ``unknown`` (ids that are not movies), or a
+        400 error for a malformed body.
+    """
+    user = data_manager.get_user(user_id)
+    if user is None or not user.is_active:
+        return jsonify(error="User not found."), 404
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error="Expected a JSON object."), 400
+    add, remove = body.get("add", []), body.get("remove", [])
+    if not all(
+        isinstance(ids, list) and all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids
+        )
+        for ids in (add, remove)
+    ):
+        return jsonify(error="add and remove must be lists of ids."), 400
+    if len(add) + len(remove) > current_app.config["MAX_FAVORITE_CHANGES"]:
+        return jsonify(error="Too many changes in one request."), 400
+
+    try:
+        changed = data_manager.set_favorites(user_id, add, remove)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        current_app.logger.error(f"Favourites of user {user_id} failed: {e}")
+        return jsonify(error="Updating favourites failed."), 500
+    return jsonify(
+        changed=sorted(i for i, written in changed.items() if written),
+        unknown=sorted((set(add) | set(remove)) - set(changed)),
+    )
+
+
+@route("/choose_user")
 def choose_user():
     """
     Show a dialog that lets the visitor choose an active user.
@@ -353,7 +1132,7 @@ def choose_user():
     """
     # either 'explore' or 'add'
     next_page = request.args.get("next", "explore")
-    users = User.query.filter_by(is_active=True).all()
+    users = data_manager.get_user_names()
     return render_template(
         "choose_user.html",
         users=users,
@@ -361,7 +1140,7 @@ def choose_user():
     )
 
 
-@app.route("/users/<int:user_id>/deactivate", methods=["POST"])
+@route("/users/<int:user_id>/deactivate", methods=["POST"])
 def deactivate_user(user_id):
     """
     Soft-delete (deactivate) a user.
@@ -373,18 +1152,184 @@ def deactivate_user(user_id):
         flask.Response: Redirect to the user list with a flash message.
     """
     try:
-        user = User.query.get_or_404(user_id)
-        user.is_active = False
-        db.session.commit()
-        flash(f"User '{user.name}' has been deactivated.", "info")
+        user = data_manager.deactivate_user(user_id)
+        if user:
+            flash(f"User '{user.name}' has been deactivated.", "info")
+        else:
+            flash("User not found.", "warning")
     except Exception as e:
-        app.logger.error(f"Failed to deactivate user {user_id}: {e}")
+        current_app.logger.error(f"Failed to deactivate user {user_id}: {e}")
         flash("Something went wrong while deactivating the user.", "danger")
 
     return redirect(url_for("list_users"))
 
 
-@app.errorhandler(404)
+@template_global
+def movie_card(movie, user=None):
+    """
+    Render *partials/movie_card.html* or reuse a cached rendering.
+
+    A card only depends on the movie row, whether it is a favourite and
+    the user whose buttons it shows, so it is keyed on exactly that and
+    stays valid across the catalogue-wide writes that invalidate whole
+    pages: after one edit only that card is rendered again. Outdated
+    versions are never looked up again and age out of the LRU.
+
+    Args:
+        movie (Movie | MovieCard): The movie, with ``is_favorite``
+            loaded for ``user``.
+        user (User, optional): User the favourite button acts for.
+
+    Returns:
+        markupsafe.Markup: The card's HTML.
+    """
+    key = (
+        movie.id, movie.updated_at, movie.is_favorite,
+        user.id if user else None,
+    )
+    html = card_cache.get(key)
+    if html is None:
+        html = current_app.jinja_env.get_template(
+            "partials/movie_card.html"
+        ).render(movie=movie, user=user)
+        card_cache.set(key, html)
+    return Markup(html)
+
+
+@template_global
+def poster_src(movie, width=None):
+    """
+    Return the ``src`` of a movie's poster for templates.
+
+    Args:
+        movie (Movie): Movie whose poster to show.
+        width (int, optional): Displayed width in pixels, served as the
+            nearest thumbnail.
+
+    Returns:
+        str: The poster proxy URL, versioned by the poster URL so it
+        can be cached forever, or the remote URL when the poster cache
+        is disabled.
+    """
+    if services().poster_cache is None or not movie.poster:
+        return movie.poster
+    from database.posters import poster_version
+
+    return url_for(
+        "poster", movie_id=movie.id, w=width, v=poster_version(movie.poster)
+    )
+
+
+@route("/posters/<int:movie_id>")
+def poster(movie_id):
+    """
+    Serve a movie poster from the local cache.
+
+    On a miss the download is queued in the background and a
+    placeholder is served for now; the remote URL is never redirected
+    to. Every response forbids content sniffing and carries a
+    restrictive CSP, as the images come from user-supplied URLs.
+
+    Query Args:
+        w (int, optional): Desired width; the nearest generated
+            thumbnail is served.
+        v (str, optional): Poster version from :func:`poster_src`; when
+            it matches, the response is cacheable forever.
+
+    Returns:
+        flask.Response: The image with an ETag (``304`` if the client's
+        copy is current), or the uncacheable placeholder.
+    """
+    from database.posters import poster_version
+
+    poster_cache = services().poster_cache
+    if poster_cache is None:
+        abort(404)
+    movie = db.session.get(Movie, movie_id)
+    if movie is None or not movie.poster:
+        abort(404)
+
+    cached = poster_cache.lookup(movie.poster, request.args.get("w", type=int))
+    if cached is None:
+        poster_cache.prefetch(movie.poster)
+        response = send_file(
+            os.path.join(current_app.static_folder, POSTER_PLACEHOLDER),
+            mimetype="image/svg+xml",
+        )
+        response.cache_control.no_store = True
+    else:
+        current = request.args.get("v") == poster_version(movie.poster)
+        response = send_file(
+            cached.path,
+            mimetype=cached.mimetype,
+            etag=cached.etag,
+            max_age=31536000 if current else 3600,
+            conditional=True,
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = current
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["Content-Security-Policy"] = (
+        "default-src 'none'; sandbox"
+    )
+    return response
+
+
+@route("/autocomplete")
+@async_view
+async def autocomplete():
+    """
+    Suggest movie titles for what was typed into the search box.
+
+    Answered from the app's :class:`TitleIndex`; while it is still being
+    built (or when ``AUTOCOMPLETE=0``) from the full-text index instead.
+
+    Query Args:
+        q (str): Input so far; matched against the start of title words.
+        limit (int, optional): Number of suggestions, default and
+            maximum ``AUTOCOMPLETE_MAX_RESULTS``.
+
+    Returns:
+        flask.Response: JSON ``{"suggestions": [{"id", "title", "year",
+        "rating"}, ...]}``, best rated first.
+    """
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", type=int)
+    suggestions = None
+    title_index = services().title_index
+    if title_index is not None:
+        suggestions = title_index.complete(query, limit)
+    if suggestions is None:
+        suggestions = []
+        if query.strip():
+            most = current_app.config["AUTOCOMPLETE_MAX_RESULTS"]
+            page = await page_data.get_movie_cards_page(
+                query=query, sort_by="rating",
+                page_size=max(1, min(limit or most, most)),
+            )
+            suggestions = page.items
+    response = jsonify(suggestions=[
+        {"id": movie.id, "title": movie.title, "year": movie.year,
+         "rating": movie.rating}
+        for movie in suggestions
+    ])
+    response.cache_control.max_age = 60
+    return response
+
+
+@route("/cache/stats")
+def cache_stats():
+    """
+    Report hit and miss counters of this worker's response cache.
+
+    Returns:
+        flask.Response: JSON with ``hits``, ``misses``, ``hit_ratio``
+        and ``size``.
+    """
+    return jsonify(response_cache.stats())
+
+
+@errorhandler(404)
 def page_not_found(e):
     """
     Custom 404 error handler.
@@ -398,7 +1343,7 @@ def page_not_found(e):
     return render_template("404.html"), 404
 
 
-@app.errorhandler(500)
+@errorhandler(500)
 def internal_server_error(e):
     """
     Custom 500 error handler.
@@ -413,4 +1358,4 @@ def internal_server_error(e):
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5001)
+    create_app().run(debug=True, host="0.0.0.0", port=5001)
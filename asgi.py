@@ -0,0 +1,172 @@
+"""
+ASGI entry point.
+
+Usage:
+    pip install asgiref uvicorn
+    ASYNC_DATA_MANAGER=1 uvicorn asgi:application --workers 4
+
+Flask stays a WSGI app: every request runs on a thread from a pool of
+``ASGI_THREADS`` (default 32). The async views (``/explore``,
+``/users``) hand their queries to the server's event loop when
+``ASYNC_DATA_MANAGER=1``, where the :class:`AsyncSQLiteDataManager`
+keeps them in flight on one pooled set of connections.
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from app import create_app
+
+# request bodies larger than this are spooled to a temporary file
+MAX_MEMORY_BODY = 64 * 1024
+
+
+def build_environ(scope, body):
+    """
+    Translate an ASGI HTTP scope into a WSGI environ (PEP 3333).
+
+    Args:
+        scope (dict): The ASGI ``http`` connection scope.
+        body: File object holding the complete request body.
+
+    Returns:
+        dict: The WSGI environ.
+    """
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if path.startswith(root_path):
+        path = path[len(root_path):]
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI carries the raw bytes of the path as latin-1 text
+        "SCRIPT_NAME": root_path.encode().decode("latin-1"),
+        "PATH_INFO": path.encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server_name),
+        "SERVER_PORT": str(server_port if server_port is not None else 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+        environ["REMOTE_PORT"] = str(scope["client"][1])
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            name = f"HTTP_{name}"
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+class ThreadPoolWsgiToAsgi:
+    """
+    Serve a WSGI app over ASGI, each request on a thread of ``executor``.
+
+    A request is read completely, then the WSGI app runs through
+    asgiref's ``sync_to_async`` with ``thread_sensitive=False`` on the
+    pool, so requests run concurrently rather than on one shared
+    thread. Coroutines the app awaits through ``async_to_sync`` (as
+    Flask does for async views) run on the server's event loop, and the
+    response is sent chunk by chunk as the app yields it, which keeps
+    streamed exports streaming.
+
+    Args:
+        wsgi_application (callable): The WSGI app.
+        executor (concurrent.futures.Executor): Threads to run it on.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope {scope['type']!r}.")
+        with SpooledTemporaryFile(max_size=MAX_MEMORY_BODY) as body:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body.write(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+            await sync_to_async(
+                self._run, thread_sensitive=False, executor=self.executor
+            )(scope, body, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        # nothing to set up: the app connects and starts threads lazily
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _run(self, scope, body, send):
+        """Call the WSGI app on a pool thread and send its response."""
+        send = async_to_sync(send)
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and start.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            start["message"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+            return write
+
+        def write(data, more_body=True):
+            if not start.get("sent"):
+                send(start["message"])
+                start["sent"] = True
+            if data or not more_body:
+                send({
+                    "type": "http.response.body",
+                    "body": bytes(data),
+                    "more_body": more_body,
+                })
+
+        result = self.wsgi_application(
+            build_environ(scope, body), start_response
+        )
+        try:
+            for chunk in result:
+                write(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        write(b"", more_body=False)
+
+
+application = ThreadPoolWsgiToAsgi(
+    create_app(),
+    ThreadPoolExecutor(
+        max_workers=int(os.getenv("ASGI_THREADS", 32)),
+        thread_name_prefix="wsgi",
+    ),
+)
@@ -0,0 +1,252 @@
+"""
+Compare the synchronous and asynchronous data managers under load.
+
+Usage:
+    pip install aiosqlite greenlet asgiref
+    python -m benchmarks.async_bench /tmp/bench-100k.sqlite3 \\
+        --concurrency 1 8 32 --requests 400
+
+Two comparisons, each at every ``--concurrency`` level:
+
+* ``dm``: :class:`SQLiteDataManager` calls on a thread pool against
+  :class:`AsyncSQLiteDataManager` coroutines on one event loop.
+* ``asgi``: whole ``/explore`` requests through
+  ``asgi.application``, driven in-process without a network server,
+  with ``ASYNC_DATA_MANAGER`` off and on. Each mode runs in a child
+  process because the app reads its configuration at import.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (
+    environment, load_app, percentiles, use_database
+)
+
+ROUTES = (
+    "/explore",
+    "/explore?sort=rating&user_id=2",
+    "/explore?q=dark&sort=relevance",
+)
+
+
+def _dm_calls(dm, heavy_user_id):
+    """``(name, call)`` pairs; the same calls are made on both managers."""
+    return [
+        ("get_movies_page", lambda: dm.get_movies_page(sort_by="rating")),
+        ("get_movies_page[search]",
+         lambda: dm.get_movies_page(query="dark", sort_by="relevance")),
+        ("get_movies_page[user flags]",
+         lambda: dm.get_movies_page(user_id=heavy_user_id)),
+        ("get_favorite_movies",
+         lambda: dm.get_favorite_movies(heavy_user_id)),
+        ("get_generations",
+         lambda: dm.get_generations("catalogue", "users")),
+    ]
+
+
+def _summary(latencies, elapsed):
+    stats = percentiles(latencies)
+    stats["throughput"] = len(latencies) / elapsed
+    return stats
+
+
+def bench_sync(app, dm, call, requests, concurrency):
+    from database import db
+
+    def timed(_):
+        with app.app_context():
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            db.session.remove()
+        return elapsed
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, range(concurrency)))  # warm up the pool
+        started = time.perf_counter()
+        latencies = list(executor.map(timed, range(requests)))
+        return _summary(latencies, time.perf_counter() - started)
+
+
+async def bench_async(call, requests, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with slots:
+            started = time.perf_counter()
+            await call()
+            return time.perf_counter() - started
+
+    await asyncio.gather(*(timed() for _ in range(concurrency)))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed() for _ in range(requests)))
+    return _summary(latencies, time.perf_counter() - started)
+
+
+def run_dm(database, requests, levels):
+    """Benchmark both data managers; return ``{case: {mode: stats}}``."""
+    from database.async_data_manager import AsyncSQLiteDataManager
+    from database.models import Favorite
+
+    from app import services
+
+    app = load_app(database)
+    sync_dm = services(app).data_manager
+    with app.app_context():
+        from database import db
+        heavy_user_id = db.session.execute(
+            db.select(Favorite.user_id).group_by(Favorite.user_id)
+            .order_by(db.func.count().desc()).limit(1)
+        ).scalar()
+
+    results = {}
+    for concurrency in levels:
+        async_dm = AsyncSQLiteDataManager(
+            app.config["SQLALCHEMY_DATABASE_URI"],
+            app.config["SQLITE_PRAGMAS"],
+            pool_size=concurrency,
+            max_overflow=0,
+        )
+        sync_calls = _dm_calls(sync_dm, heavy_user_id)
+        async_calls = _dm_calls(async_dm, heavy_user_id)
+
+        async def run_async():
+            measured = {}
+            for name, call in async_calls:
+                measured[name] = await bench_async(
+                    call, requests, concurrency
+                )
+            await async_dm.dispose()
+            return measured
+
+        async_results = asyncio.run(run_async())
+        for name, call in sync_calls:
+            case = f"dm.{name} x{concurrency}"
+            results[case] = {
+                "sync": bench_sync(app, sync_dm, call, requests, concurrency),
+                "async": async_results[name],
+            }
+    return results
+
+
+async def _asgi_get(application, url):
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [],
+        "server": ("benchmark", 80),
+        "client": ("benchmark", 0),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(scope, receive, send)
+    assert status == [200], (url, status)
+
+
+def run_asgi(requests, levels):
+    """Benchmark the routes in this process's ASYNC_DATA_MANAGER mode."""
+    import asgi
+
+    async def run():
+        results = {}
+        for concurrency in levels:
+            for url in ROUTES:
+                results[f"GET {url} x{concurrency}"] = await bench_async(
+                    lambda: _asgi_get(asgi.application, url),
+                    requests, concurrency,
+                )
+        return results
+
+    return asyncio.run(run())
+
+
+def _asgi_child(database, mode, requests, levels):
+    env = dict(os.environ, ASYNC_DATA_MANAGER=mode)
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.async_bench", database,
+         "--asgi-mode", "--requests", str(requests),
+         "--concurrency", *map(str, levels)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def print_comparison(results):
+    width = max(len(case) for case in results)
+    print(
+        f"{'case':<{width}}  {'sync p50':>9}  {'async p50':>9}  "
+        f"{'sync/s':>8}  {'async/s':>8}"
+    )
+    for case, modes in results.items():
+        sync, async_ = modes["sync"], modes["async"]
+        print(
+            f"{case:<{width}}  {sync['p50']:9.3f}  {async_['p50']:9.3f}  "
+            f"{sync['throughput']:8.0f}  {async_['throughput']:8.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the sync and async data managers."
+    )
+    parser.add_argument("database", help="seeded SQLite file")
+    parser.add_argument("--requests", type=int, default=400,
+                        help="calls per case and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8, 32])
+    parser.add_argument("--only", choices=("dm", "asgi"))
+    parser.add_argument("--output", help="write results to this JSON file")
+    # internal: run the ASGI cases of one mode and print JSON
+    parser.add_argument("--asgi-mode", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.asgi_mode:
+        # asgi.py builds the app
+        use_database(args.database)
+        print(json.dumps(run_asgi(args.requests, args.concurrency)))
+        return
+
+    results = {}
+    if args.only in (None, "dm"):
+        results.update(run_dm(args.database, args.requests, args.concurrency))
+    if args.only in (None, "asgi"):
+        sync = _asgi_child(args.database, "0", args.requests,
+                           args.concurrency)
+        async_ = _asgi_child(args.database, "1", args.requests,
+                             args.concurrency)
+        for case in sync:
+            results[case] = {"sync": sync[case], "async": async_[case]}
+
+    print("latency in ms, throughput in calls per second")
+    print_comparison(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Time every data manager method and route against seeded databases.
+
+Usage:
+    python -m benchmarks.seed --scale 10k --database /tmp/bench-10k.sqlite3
+    python -m benchmarks.seed --scale 100k --database /tmp/bench-100k.sqlite3
+    python -m benchmarks.bench /tmp/bench-10k.sqlite3 \\
+        /tmp/bench-100k.sqlite3 --output bench-results.json
+
+Each database is one scale. Read cases run first, then write cases, so
+the write cases change the database; re-seed before comparing runs.
+Results are saved as JSON and can be compared across commits with
+``python -m benchmarks.compare old.json new.json``.
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import (
+    environment, load_app, percentiles, print_table, time_call
+)
+from database import db
+from database.models import Favorite, Movie, User
+from database.pagination import encode_cursor, sort_key
+
+
+class Context:
+    """
+    Dataset-dependent parameters shared by the cases.
+
+    Picks representative rows once so every case targets the same data
+    at a given scale: a movie in the middle of the catalogue for deep
+    cursors, and the user with the most favourites for the worst case
+    of favourite flagging.
+    """
+
+    def __init__(self):
+        session = db.session
+        self.movie_count = session.execute(
+            db.select(db.func.count()).select_from(Movie)
+        ).scalar()
+        self.user_count = session.execute(
+            db.select(db.func.count()).select_from(User)
+        ).scalar()
+        self.favorite_count = session.execute(
+            db.select(db.func.count()).select_from(Favorite)
+        ).scalar()
+        self.middle_movie = session.execute(
+            db.select(Movie).order_by(Movie.id)
+            .offset(self.movie_count // 2).limit(1)
+        ).scalar_one()
+        self.heavy_user_id = session.execute(
+            db.select(Favorite.user_id)
+            .group_by(Favorite.user_id)
+            .order_by(db.func.count().desc())
+            .limit(1)
+        ).scalar()
+        self.user_id = 1
+        self.search = "dark night"
+        self.counter = itertools.count()
+        db.session.remove()
+
+    def cursor(self, sort_by):
+        """Return a cursor pointing at the middle of the catalogue."""
+        return encode_cursor(sort_by, sort_key(sort_by, self.middle_movie))
+
+    def sizes(self):
+        return {
+            "movies": self.movie_count,
+            "users": self.user_count,
+            "favorites": self.favorite_count,
+        }
+
+
+def datamanager_read_cases(dm, ctx):
+    """Return ``(name, callable)`` pairs for the read-only methods."""
+    cases = [
+        ("dm.get_all_users", lambda: dm.get_all_users()),
+        ("dm.get_user_summaries", lambda: dm.get_user_summaries()),
+        ("dm.get_user_names", lambda: dm.get_user_names()),
+        ("dm.get_user_movies", lambda: dm.get_user_movies(ctx.user_id)),
+        ("dm.get_favorite_movies[heavy user]",
+         lambda: dm.get_favorite_movies(ctx.heavy_user_id)),
+        ("dm.get_favorite_cards[heavy user]",
+         lambda: dm.get_favorite_cards(ctx.heavy_user_id)),
+        ("dm.search_movies", lambda: dm.search_movies(ctx.search)),
+        ("dm.search_movies[relevance]",
+         lambda: dm.search_movies(ctx.search, "relevance")),
+        ("dm.get_generations",
+         lambda: dm.get_generations("catalogue", "users")),
+    ]
+    for sort_by in (None, "title", "year", "rating"):
+        label = sort_by or "id"
+        cursor = ctx.cursor(sort_by)
+        cases += [
+            (f"dm.get_movies_page[{label}]",
+             lambda s=sort_by: dm.get_movies_page(sort_by=s)),
+            (f"dm.get_movies_page[{label}, middle]",
+             lambda s=sort_by, c=cursor: dm.get_movies_page(
+                 sort_by=s, after=c)),
+        ]
+    cases += [
+        ("dm.get_movies_page[search]",
+         lambda: dm.get_movies_page(query=ctx.search)),
+        ("dm.get_movies_page[search, relevance]",
+         lambda: dm.get_movies_page(query=ctx.search, sort_by="relevance")),
+        ("dm.get_movies_page[heavy user flags]",
+         lambda: dm.get_movies_page(
+             user_id=ctx.heavy_user_id, exclude_favorites=True)),
+        ("dm.get_movie_cards_page[rating]",
+         lambda: dm.get_movie_cards_page(sort_by="rating")),
+        ("dm.get_movie_cards_page[heavy user flags]",
+         lambda: dm.get_movie_cards_page(
+             user_id=ctx.heavy_user_id, exclude_favorites=True)),
+    ]
+    return cases
+
+
+def datamanager_full_scan_cases(dm, ctx):
+    """Methods that read the whole catalogue; run with fewer repeats."""
+    return [
+        ("dm.get_all_movies", lambda: dm.get_all_movies()),
+        ("dm.get_all_movies[title]", lambda: dm.get_all_movies(
+            sort_by="title")),
+    ]
+
+
+def datamanager_write_cases(dm, ctx):
+    """Return ``(name, callable)`` pairs for the mutating methods."""
+    movie_id = ctx.middle_movie.id
+    added = []
+
+    def add_movie():
+        movie = dm.add_movie(
+            ctx.user_id, "Benchmark Movie", 2000, 5.0,
+            "https://posters.example.com/bench.jpg",
+        )
+        added.append(movie.id)
+
+    def delete_movie():
+        dm.delete_movie(added.pop() if added else movie_id + 1)
+
+    def add_user():
+        user = dm.add_user(f"bench-{os.getpid()}-{next(ctx.counter)}")
+        dm.deactivate_user(user.id)
+
+    return [
+        ("dm.add_movie", add_movie),
+        ("dm.update_movie", lambda: dm.update_movie(
+            movie_id, "Benchmark Update", 2001, 6.0,
+            "https://posters.example.com/bench.jpg")),
+        ("dm.toggle_favorite", lambda: dm.toggle_favorite(
+            ctx.user_id, movie_id)),
+        ("dm.add_user+deactivate_user", add_user),
+        ("dm.add_movies[1000]", lambda: dm.add_movies(ctx.user_id, [
+            ("Bulk Movie", 2000, 5.0, "https://posters.example.com/b.jpg")
+        ] * 1000)),
+        ("dm.delete_movie", delete_movie),
+    ]
+
+
+def route_read_cases(client, ctx):
+    """Return ``(name, callable)`` pairs for GET routes."""
+    heavy = ctx.heavy_user_id
+    urls = [
+        ("GET /", "/"),
+        ("GET /explore", "/explore"),
+        ("GET /explore?sort=rating", "/explore?sort=rating"),
+        ("GET /explore?sort=title&after=middle",
+         f"/explore?sort=title&after={ctx.cursor('title')}"),
+        ("GET /explore?q", f"/explore?q={ctx.search}&sort=relevance"),
+        ("GET /explore?user_id=heavy", f"/explore?user_id={heavy}"),
+        ("GET /users", "/users"),
+        ("GET /choose_user", "/choose_user"),
+        ("GET /users/<id>/add_movie", f"/users/{ctx.user_id}/add_movie"),
+        ("GET /update/<id>", f"/update/{ctx.middle_movie.id}"),
+        ("GET /export/favorites.csv?user_id=heavy",
+         f"/export/favorites.csv?user_id={heavy}"),
+    ]
+    return [(name, _get(client, url)) for name, url in urls]
+
+
+def route_write_cases(client, ctx):
+    """Return ``(name, callable)`` pairs for POST routes."""
+    movie_id = ctx.middle_movie.id
+
+    def toggle():
+        response = client.post(
+            f"/favorite/{movie_id}", data={"user_id": ctx.user_id}
+        )
+        assert response.status_code == 302, response.status_code
+
+    def update():
+        response = client.post(f"/update/{movie_id}", data={
+            "title": "Benchmark Route Update",
+            "year": "2002",
+            "rating": "7.0",
+            "poster": "https://posters.example.com/bench.jpg",
+        })
+        assert response.status_code == 302, response.status_code
+
+    return [
+        ("POST /favorite/<id>", toggle),
+        ("POST /update/<id>", update),
+    ]
+
+
+def _get(client, url):
+    def request():
+        response = client.get(url)
+        response.get_data()
+        assert response.status_code == 200, (url, response.status_code)
+    return request
+
+
+def _fresh_session(func):
+    # every call starts with an empty identity map, like a new request
+    def call():
+        try:
+            func()
+        finally:
+            db.session.remove()
+    return call
+
+
+def run_database(path, repeat, scan_repeat, only=None, cache=False):
+    """
+    Benchmark one database.
+
+    Args:
+        path (str): Seeded SQLite file.
+        repeat (int): Timed calls per case.
+        scan_repeat (int): Timed calls for full-table cases.
+        only (str, optional): Substring filter on case names.
+        cache (bool): Keep the response cache on.
+
+    Returns:
+        dict: ``sizes`` of the dataset and ``results`` per case.
+    """
+    from app import services
+
+    app = load_app(path, cache=cache)
+    dm = services(app).data_manager
+    results = {}
+
+    with app.app_context():
+        ctx = Context()
+        groups = (
+            (datamanager_read_cases(dm, ctx), repeat),
+            (datamanager_full_scan_cases(dm, ctx), scan_repeat),
+            (route_read_cases(app.test_client(), ctx), repeat),
+            (datamanager_write_cases(dm, ctx), repeat),
+            (route_write_cases(app.test_client(), ctx), repeat),
+        )
+        for cases, count in groups:
+            for name, func in cases:
+                if only and only not in name:
+                    continue
+                samples = time_call(_fresh_session(func), count)
+                results[name] = percentiles(samples)
+        sizes = ctx.sizes()
+    return {"sizes": sizes, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the data manager and routes."
+    )
+    parser.add_argument("databases", nargs="+",
+                        help="seeded SQLite files, one per scale")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--scan-repeat", type=int, default=3)
+    parser.add_argument("--only", help="run cases containing this text")
+    parser.add_argument("--cache", action="store_true",
+                        help="keep the response cache enabled")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "runs": {}}
+    if len(args.databases) == 1:
+        path = args.databases[0]
+        report["runs"][os.path.basename(path)] = run_database(
+            path, args.repeat, args.scan_repeat, args.only, args.cache
+        )
+    else:
+        # the app binds its database at import, so every scale runs in a
+        # fresh interpreter
+        for path in args.databases:
+            report["runs"].update(_run_subprocess(path, args))
+
+    for label, run in report["runs"].items():
+        print(f"\n{label}: {run['sizes']}")
+        print_table(run["results"])
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+def _run_subprocess(path, args):
+    """Benchmark one database in a child process; return its runs."""
+    options = [
+        "--repeat", str(args.repeat), "--scan-repeat", str(args.scan_repeat)
+    ]
+    if args.only:
+        options += ["--only", args.only]
+    if args.cache:
+        options.append("--cache")
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "run.json")
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench", path,
+             *options, "--output", output],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output) as result:
+            return json.load(result)["runs"]
+
+if __name__ == "__main__":
+    main()
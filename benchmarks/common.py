@@ -0,0 +1,131 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The app reads its configuration from the environment when it is
+built, so :func:`load_app` points it at the benchmark database first.
+"""
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+from datetime import datetime, timezone
+
+
+def use_database(database, cache=False):
+    """
+    Point the app's environment settings at a benchmark database.
+
+    Args:
+        database (str): Path of the SQLite file to use.
+        cache (bool): Keep the response cache enabled. Off by default so
+            timings measure the real query and render work.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(database)}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    # timings include the metrics hooks, but not slow-query log output
+    os.environ.setdefault("SLOW_QUERY_MS", "0")
+    if not cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+
+def load_app(database, cache=False):
+    """
+    Build the Flask app configured for a benchmark database.
+
+    Args:
+        database (str): Path of the SQLite file to use.
+        cache (bool): See :func:`use_database`.
+
+    Returns:
+        flask.Flask: The app; :func:`app.services` returns its data
+        manager and caches.
+    """
+    from app import create_app
+
+    use_database(database, cache)
+    return create_app()
+
+
+def percentiles(samples):
+    """
+    Summarise timings in milliseconds.
+
+    Args:
+        samples (list[float]): Durations in seconds.
+
+    Returns:
+        dict: ``n``, ``mean``, ``min``, ``p50``, ``p90``, ``p99`` and
+        ``max``, all in milliseconds except ``n``.
+    """
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pick(fraction):
+        return ordered[min(n - 1, int(round(fraction * (n - 1))))] * 1000
+
+    return {
+        "n": n,
+        "mean": sum(ordered) / n * 1000,
+        "min": ordered[0] * 1000,
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def time_call(func, repeat, warmup=1):
+    """
+    Time ``func`` ``repeat`` times after ``warmup`` untimed calls.
+
+    Args:
+        func (callable): Zero-argument callable.
+        repeat (int): Timed calls.
+        warmup (int): Untimed calls first.
+
+    Returns:
+        list[float]: Durations in seconds.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def environment():
+    """
+    Describe where a benchmark ran, so saved results are comparable.
+
+    Returns:
+        dict: Commit, timestamp, Python, SQLite and platform versions.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def print_table(results):
+    """Print ``{name: percentiles}`` as an aligned table."""
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}}  {'p50':>9}  {'p90':>9}  {'p99':>9}  (ms)")
+    for name, stats in results.items():
+        print(
+            f"{name:<{width}}  {stats['p50']:9.3f}  "
+            f"{stats['p90']:9.3f}  {stats['p99']:9.3f}"
+        )
@@ -0,0 +1,87 @@
+"""
+Compare two saved benchmark results.
+
+Usage:
+    python -m benchmarks.compare before.json after.json
+    python -m benchmarks.compare before.json after.json --fail-above 1.25
+
+Prints the p50 of every case present in both files and the ratio
+``after / before``. With ``--fail-above`` the exit status is 1 when any
+case slowed down by more than that factor, so the comparison can gate
+a CI job.
+"""
+import argparse
+import json
+import sys
+
+# cases faster than this are dominated by noise, never fail on them
+MIN_MILLISECONDS = 0.5
+
+
+def compare(before, after, metric="p50"):
+    """
+    Pair up the cases of two benchmark reports.
+
+    Args:
+        before (dict): Report saved by ``benchmarks.bench``.
+        after (dict): Report to compare against ``before``.
+        metric (str): Percentile to compare.
+
+    Returns:
+        list[tuple[str, str, float, float, float]]: ``(run, case,
+        before, after, ratio)`` for every case present in both.
+    """
+    rows = []
+    for label, run in after["runs"].items():
+        previous = before["runs"].get(label)
+        if previous is None:
+            continue
+        for case, stats in run["results"].items():
+            old = previous["results"].get(case)
+            if old is None:
+                continue
+            ratio = stats[metric] / old[metric] if old[metric] else 1.0
+            rows.append((label, case, old[metric], stats[metric], ratio))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two saved benchmark results."
+    )
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--metric", default="p50",
+                        choices=("mean", "p50", "p90", "p99"))
+    parser.add_argument("--fail-above", type=float,
+                        help="exit 1 if any case's ratio exceeds this")
+    args = parser.parse_args()
+
+    with open(args.before) as before, open(args.after) as after:
+        rows = compare(json.load(before), json.load(after), args.metric)
+    if not rows:
+        sys.exit("No cases in common.")
+
+    width = max(len(case) for _, case, *_ in rows)
+    regressions = []
+    current = None
+    for label, case, old, new, ratio in rows:
+        if label != current:
+            current = label
+            print(f"\n{label} ({args.metric}, ms)")
+        flag = ""
+        if (args.fail_above and ratio > args.fail_above
+                and new >= MIN_MILLISECONDS):
+            regressions.append((label, case))
+            flag = "  REGRESSION"
+        print(f"{case:<{width}}  {old:9.3f}  {new:9.3f}  "
+              f"{ratio:6.2f}x{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than "
+              f"{args.fail_above}x.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measure how long ``/explore`` takes to render and how big it is.
+
+Usage:
+    python -m benchmarks.render_bench /tmp/bench-10k.sqlite3 \\
+        --per-page 20 60 100 --output render.json
+
+The page-level response cache is off (see :func:`load_app`), so every
+request queries and renders the catalogue. Each page size is measured
+without and with a user (whose favourite buttons are rendered), and
+with the movie card cache ``cold`` (emptied before every request, the
+cost of a first visit) and ``warm`` (what a catalogue-wide write
+leaves: the page is rendered again but its cards are reused).
+"""
+import argparse
+import json
+
+from benchmarks.common import (
+    environment, load_app, percentiles, print_table, time_call
+)
+from benchmarks.bench import Context
+
+
+def render_cases(app, client, ctx, page_sizes):
+    """``{name: call}`` of every URL and card cache state."""
+    from app import services
+
+    card_cache = getattr(services(app), "card_cache", None)
+
+    def cold_get(url):
+        def request():
+            card_cache.clear()
+            return client.get(url)
+        return request
+
+    cases = {}
+    for per_page in page_sizes:
+        for user_id in (None, ctx.heavy_user_id):
+            url = f"/explore?sort=rating&per_page={per_page}"
+            if user_id:
+                url += f"&user_id={user_id}"
+            if card_cache is None:
+                # trees without a card cache render every card anyway
+                cases[f"GET {url}"] = lambda url=url: client.get(url)
+                continue
+            cases[f"GET {url} [cold]"] = cold_get(url)
+            cases[f"GET {url} [warm]"] = lambda url=url: client.get(url)
+    return cases
+
+
+def run(database, page_sizes, repeat):
+    """Return ``{case: stats}`` with timings and response ``bytes``."""
+    app = load_app(database)
+    client = app.test_client()
+    with app.app_context():
+        ctx = Context()
+    results = {}
+    cases = render_cases(app, client, ctx, page_sizes)
+    for name, call in cases.items():
+        response = call()
+        assert response.status_code == 200, (name, response.status_code)
+        stats = percentiles(time_call(call, repeat))
+        stats["bytes"] = len(response.data)
+        results[name] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time /explore rendering and report page sizes."
+    )
+    parser.add_argument("database", help="seeded SQLite file")
+    parser.add_argument("--per-page", type=int, nargs="+",
+                        default=[20, 60, 100])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.database, args.per_page, args.repeat)
+    print_table(results)
+    print()
+    for name, stats in results.items():
+        print(f"{name}: {stats['bytes']:,} bytes")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compare the ORM list reads with their card row counterparts.
+
+Usage:
+    python -m benchmarks.rows_bench /tmp/bench-100k.sqlite3
+
+Each case runs the ``Movie``/``User`` entity method a list view used to
+call and the lean method it calls now (e.g. ``get_movies_page`` and
+``get_movie_cards_page``), both on a fresh session per call, as a
+request would. Reports the latency and, measured with ``tracemalloc``,
+the memory the result keeps alive and the peak allocated while building
+it, both per row.
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.bench import Context
+from benchmarks.common import (
+    environment, load_app, percentiles, print_table, time_call
+)
+from database import db
+
+
+def cases(dm, ctx):
+    """``{name: (entity call, row call)}``, each returning a list."""
+    heavy = ctx.heavy_user_id
+    result = {}
+    for size in (24, 200):
+        result[f"catalogue page x{size}"] = (
+            lambda size=size: dm.get_movies_page(
+                sort_by="rating", page_size=size).items,
+            lambda size=size: dm.get_movie_cards_page(
+                sort_by="rating", page_size=size).items,
+        )
+    result["page x200, favourites flagged"] = (
+        lambda: dm.get_movies_page(
+            page_size=200, user_id=heavy, exclude_favorites=True).items,
+        lambda: dm.get_movie_cards_page(
+            page_size=200, user_id=heavy, exclude_favorites=True).items,
+    )
+    result["favourites of the heaviest user"] = (
+        lambda: dm.get_favorite_movies(heavy),
+        lambda: dm.get_favorite_cards(heavy),
+    )
+    result["user picker"] = (
+        dm.get_all_users,
+        dm.get_user_names,
+    )
+    return result
+
+
+def allocations(call):
+    """Return ``(rows, retained bytes, peak bytes)`` of one ``call()``."""
+    db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    result = call()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = max(1, len(result))
+    del result
+    db.session.remove()
+    return rows, retained, peak
+
+
+def run(database, repeat):
+    """Return ``{case: {mode: stats}}`` with latency and bytes per row."""
+    from app import services
+
+    app = load_app(database)
+    dm = services(app).data_manager
+    results = {}
+    with app.app_context():
+        ctx = Context()
+        for name, calls in cases(dm, ctx).items():
+            for mode, call in zip(("orm", "rows"), calls):
+                def fresh(call=call):
+                    call()
+                    db.session.remove()
+
+                stats = percentiles(time_call(fresh, repeat))
+                rows, retained, peak = allocations(call)
+                stats.update(
+                    rows=rows,
+                    retained_per_row=retained / rows,
+                    peak_per_row=peak / rows,
+                )
+                results.setdefault(name, {})[mode] = stats
+    return results
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    print(
+        f"{'case':<{width}}  {'rows':>5}  {'p50 ms orm/rows':>17}  "
+        f"{'retained B/row':>15}  {'peak B/row':>13}"
+    )
+    for name, modes in results.items():
+        orm, rows = modes["orm"], modes["rows"]
+        print(
+            f"{name:<{width}}  {orm['rows']:5d}  "
+            f"{orm['p50']:8.2f}/{rows['p50']:<8.2f}  "
+            f"{orm['retained_per_row']:7.0f}/"
+            f"{rows['retained_per_row']:<7.0f}  "
+            f"{orm['peak_per_row']:6.0f}/{rows['peak_per_row']:<6.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare ORM list reads with card rows."
+    )
+    parser.add_argument("database", help="seeded SQLite file")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.database, args.repeat)
+    print_results(results)
+    print()
+    print_table({
+        f"{name} [{mode}]": stats
+        for name, modes in results.items() for mode, stats in modes.items()
+    })
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
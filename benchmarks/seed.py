@@ -0,0 +1,192 @@
+"""
+Generate a reproducible synthetic MoviWeb database.
+
+Usage:
+    python -m benchmarks.seed --scale 100k --database /tmp/bench-100k.sqlite3
+    python -m benchmarks.seed --movies 50000 --users 2000 \\
+        --favorites 80000 --database /tmp/custom.sqlite3
+
+The same ``--seed`` always produces the same rows. Favourites follow a
+Zipf distribution on both sides: a few blockbusters collect most of
+them and a few heavy users hand out most of them, like real traffic.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.common import load_app
+from database import db
+from database.migrations import upgrade
+from database.models import DataVersion, Favorite, Movie, User
+from database.popularity import rebuild_popularity
+from database.search import pause_search_index, resume_search_index
+from database.sqlite_data_manager import CATALOGUE, USERS
+from database.trigrams import rebuild_trigram_index
+
+# (movies, users, favourites) per preset
+SCALES = {
+    "10k": (10_000, 1_000, 20_000),
+    "100k": (100_000, 10_000, 200_000),
+    "1m": (1_000_000, 100_000, 2_000_000),
+}
+
+ADJECTIVES = (
+    "Dark", "Silent", "Last", "Lost", "Golden", "Broken", "Hidden", "Red",
+    "Eternal", "Wild", "Frozen", "Burning", "Crimson", "Midnight", "Secret",
+    "Little", "Great", "Final", "First", "Forgotten", "Brave", "Strange",
+    "Amélie's", "Café", "Électrique", "Iron", "Blue", "Savage", "Quiet",
+)
+NOUNS = (
+    "Kingdom", "River", "Empire", "Night", "Road", "Horizon", "Storm",
+    "Garden", "Legacy", "Machine", "Station", "Island", "Shadow", "Planet",
+    "Heart", "City", "Dream", "Witness", "Harbor", "Mountain", "Signal",
+    "Voyage", "Frontier", "Mirror", "Circus", "Titanic", "Alien", "Odyssey",
+)
+SUFFIXES = (
+    "", "", "", "", " II", " III", " Returns", " Reloaded", ": Origins",
+)
+
+BATCH = 50_000
+
+
+def _zipf_weights(n, exponent, rng):
+    """Cumulative Zipf weights over a random permutation of 1..n."""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    weights = (1.0 / rank ** exponent for rank in ranks)
+    return list(itertools.accumulate(weights))
+
+
+def _movie_rows(count, users, rng):
+    for number in range(count):
+        title = (
+            f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+            f"{rng.choice(SUFFIXES)}"
+        )
+        if rng.random() < 0.3:
+            title += f" {number}"
+        yield {
+            "title": title,
+            "year": rng.randint(1920, 2025),
+            "rating": round(rng.uniform(1.0, 9.8), 1),
+            "poster": f"https://posters.example.com/{number}.jpg",
+            "user_id": rng.randint(1, users),
+        }
+
+
+def _batches(rows, size):
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def seed(movies, users, favorites, rng, log=print):
+    """
+    Fill an empty, migrated database with synthetic rows.
+
+    Must run inside an app context.
+
+    Args:
+        movies (int): Number of movies.
+        users (int): Number of users; about 5% are deactivated.
+        favorites (int): Favourites to draw; duplicates are dropped, so
+            slightly fewer end up in the table.
+        rng (random.Random): Source of randomness.
+        log (callable): Progress output.
+    """
+    session = db.session
+    started = time.perf_counter()
+
+    session.execute(User.__table__.insert(), [
+        {"name": f"user{number:06d}", "is_active": rng.random() > 0.05}
+        for number in range(1, users + 1)
+    ])
+    session.commit()
+    log(f"  {users} users")
+
+    for batch in _batches(_movie_rows(movies, users, rng), BATCH):
+        indexed_up_to = pause_search_index(session)
+        session.execute(Movie.__table__.insert(), batch)
+        resume_search_index(session, indexed_up_to)
+        session.commit()
+    rebuild_trigram_index(session)
+    session.commit()
+    log(f"  {movies} movies")
+
+    movie_weights = _zipf_weights(movies, 1.1, rng)
+    user_weights = _zipf_weights(users, 0.8, rng)
+    now = datetime.utcnow()
+    max_age = 90 * 86400
+    insert_favorite = Favorite.__table__.insert().prefix_with("OR IGNORE")
+    for offset in range(0, favorites, BATCH):
+        size = min(BATCH, favorites - offset)
+        movie_ids = rng.choices(
+            range(1, movies + 1), cum_weights=movie_weights, k=size
+        )
+        user_ids = rng.choices(
+            range(1, users + 1), cum_weights=user_weights, k=size
+        )
+        session.execute(insert_favorite, [
+            {
+                "user_id": user_id,
+                "movie_id": movie_id,
+                "created": now - timedelta(seconds=rng.randint(0, max_age)),
+            }
+            for user_id, movie_id in zip(user_ids, movie_ids)
+        ])
+        session.commit()
+    stored = session.execute(
+        db.select(db.func.count()).select_from(Favorite)
+    ).scalar()
+    log(f"  {stored} favourites")
+    rebuild_popularity(session)
+    session.commit()
+
+    for scope in (CATALOGUE, USERS):
+        session.merge(DataVersion(scope=scope, generation=1, updated=now))
+    session.commit()
+    session.execute(text("ANALYZE"))
+    session.commit()
+    log(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a reproducible synthetic MoviWeb database."
+    )
+    parser.add_argument("--database", required=True,
+                        help="SQLite file to create")
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--movies", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--favorites", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true",
+                        help="overwrite an existing database file")
+    args = parser.parse_args()
+
+    movies, users, favorites = SCALES[args.scale]
+    movies = args.movies or movies
+    users = args.users or users
+    favorites = args.favorites if args.favorites is not None else favorites
+
+    if os.path.exists(args.database):
+        if not args.force:
+            sys.exit(f"{args.database} exists, pass --force to replace it.")
+        os.remove(args.database)
+
+    with load_app(args.database).app_context():
+        db.create_all()
+        upgrade(db.engine, log=lambda line: None)
+        print(f"Seeding {args.database} (seed {args.seed})")
+        seed(movies, users, favorites, random.Random(args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Compare the single database file with per-user sharded layouts.
+
+Usage:
+    python -m benchmarks.shard_bench /tmp/bench-10k.sqlite3 \\
+        --shards 4 8 --processes 1 4 8 --requests 800
+
+The database is copied to a temporary directory and split into every
+``--shards`` count with :func:`database.sharding.shard_database`, so the
+input file is left untouched. The write cases of ``write_bench`` run in
+``--processes`` forked writers at once, each with its own data manager,
+like the workers of a pre-forking server: the single file has one write
+lock for all of them, a layout one per shard. Processes rather than
+threads, because in one interpreter the writes' Python work serialises
+on the GIL before SQLite's lock is ever contended.
+
+The ``beside a long write`` case adds a process that holds the write
+lock of user 1's file (the single file, or that user's shard) for
+``--hold-ms`` at a time, half of the time, as a bulk import or a slow
+transaction would; the writers then toggle favourites of the users of
+the other shards. The read cases,
+which the layouts answer by scatter-gather over all shards, are timed
+one call at a time. Reports throughput for writes and latency for
+reads.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import (
+    environment, load_app, percentiles, print_table, time_call
+)
+from benchmarks.write_bench import CASES, _call
+
+SINGLE = "single"
+LONG_WRITE = "toggle_favorite beside a long write"
+
+
+def read_calls(dm, heavy_user_id):
+    """``{name: call}`` of the read cases."""
+    return {
+        "get_movie_cards_page": lambda: dm.get_movie_cards_page(
+            sort_by="rating"),
+        "get_movie_cards_page excluding favourites":
+            lambda: dm.get_movie_cards_page(
+                sort_by="rating", user_id=heavy_user_id,
+                exclude_favorites=True),
+        "get_favorite_cards": lambda: dm.get_favorite_cards(
+            heavy_user_id, "title"),
+        "get_user_summaries": dm.get_user_summaries,
+        "get_top_movies": lambda: dm.get_top_movies("all", 10),
+        "fuzzy_search": lambda: dm.fuzzy_search("dark nite"),
+    }
+
+
+def open_manager(target, profile):
+    """
+    Return ``(data manager, app)`` for the single file or a layout.
+
+    ``app`` is ``None`` for a layout, which needs no app context.
+    """
+    from database.engine import load_profile
+    from database.sharding import ShardedSQLiteDataManager
+
+    from app import services
+
+    if os.path.isfile(target):
+        app = load_app(target)
+        return services(app).data_manager, app
+    settings = load_profile(profile)
+    return ShardedSQLiteDataManager(
+        target, settings["pragmas"], **settings["pool"]
+    ), None
+
+
+def _writer(target, profile, case, count, ids, seed, ready, output):
+    """Body of one writer process; puts its latencies on ``output``."""
+    from database import db
+
+    dm, app = open_manager(target, profile)
+    call = _call(dm, case, *ids, random.Random(seed))
+    latencies = []
+    with app.app_context() if app else contextlib.nullcontext():
+        call()  # connect before the clock starts
+        ready.wait()
+        for _ in range(count):
+            started = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - started)
+            if app:
+                db.session.remove()
+    output.put(latencies)
+
+
+def _hold_lock(path, hold, stop):
+    """Body of the blocking process: hold the write lock of ``path``."""
+    connection = sqlite3.connect(path, isolation_level=None, timeout=60)
+    while not stop.is_set():
+        connection.execute("BEGIN IMMEDIATE")
+        time.sleep(hold)
+        connection.execute("COMMIT")
+        time.sleep(hold)
+    connection.close()
+
+
+def write(target, profile, case, requests, processes, ids, blocked=None,
+          hold=0.02):
+    """
+    Run ``requests`` writes spread over ``processes`` writers.
+
+    Args:
+        blocked (str, optional): File whose write lock another process
+            holds for ``hold`` seconds at a time while the writers run.
+    """
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+    blocker = None
+    if blocked:
+        blocker = context.Process(
+            target=_hold_lock, args=(blocked, hold, stop)
+        )
+        blocker.start()
+    ready = context.Barrier(processes + 1)
+    output = context.SimpleQueue()
+    workers = [
+        context.Process(target=_writer, args=(
+            target, profile, case, requests // processes, ids, seed,
+            ready, output,
+        ))
+        for seed in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    ready.wait()
+    started = time.perf_counter()
+    latencies = [output.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for worker in filter(None, [*workers, blocker]):
+        worker.join()
+        if worker.exitcode:
+            raise RuntimeError(f"A {case} writer failed.")
+    latencies = [value for values in latencies for value in values]
+    stats = percentiles(latencies)
+    stats["throughput"] = len(latencies) / elapsed
+    return stats
+
+
+def run(database, layouts, requests, levels, repeat, profile, hold):
+    """
+    Benchmark the copy and every layout.
+
+    Returns:
+        dict: ``{"writes": {case: {processes: {mode: stats}}},
+        "reads": {case: {mode: stats}}}``; modes are ``"single"`` and
+        ``"<n> shards"``.
+    """
+    from sqlalchemy import create_engine
+
+    from benchmarks.bench import Context
+    from database import db
+    from database.models import Movie, User
+    from database.sharding import SHARD_FILE, shard_database, shard_of_user
+
+    workdir = tempfile.mkdtemp(prefix="shard-bench-")
+    try:
+        single = os.path.join(workdir, "single.sqlite3")
+        shutil.copyfile(database, single)
+        # mode -> (data manager target, file holding user 1, shards)
+        targets = {SINGLE: (single, single, 1)}
+        source = create_engine(f"sqlite:///{single}")
+        for shards in layouts:
+            directory = os.path.join(workdir, f"shards-{shards}")
+            shard_database(source, directory, shards, log=lambda line: None)
+            targets[f"{shards} shards"] = (
+                directory,
+                os.path.join(
+                    directory, SHARD_FILE.format(shard_of_user(1, shards))
+                ),
+                shards,
+            )
+        source.dispose()
+
+        _, app = open_manager(single, profile)
+        with app.app_context():
+            heavy_user_id = Context().heavy_user_id
+            ids = (
+                db.session.execute(db.select(User.id)).scalars().all(),
+                db.session.execute(
+                    db.select(Movie.id).limit(5000)).scalars().all(),
+            )
+            db.session.remove()
+
+        results = {"writes": {}, "reads": {}}
+        for mode, (target, blocked, shards) in targets.items():
+            dm, app = open_manager(target, profile)
+            with app.app_context() if app else contextlib.nullcontext():
+                for name, call in read_calls(dm, heavy_user_id).items():
+                    def fresh(call=call):
+                        call()
+                        if app:
+                            db.session.remove()
+
+                    results["reads"].setdefault(name, {})[mode] = \
+                        percentiles(time_call(fresh, repeat))
+            if app:
+                with app.app_context():
+                    for engine in db.engines.values():
+                        engine.dispose()
+            else:
+                dm.close()
+            for case in CASES:
+                for level in levels:
+                    results["writes"].setdefault(case, {}).setdefault(
+                        level, {})[mode] = write(
+                            target, profile, case, requests, level, ids)
+            # users whose shard the blocker does not hold
+            user_ids, movie_ids = ids
+            home = shard_of_user(1, shards)
+            others = (
+                user_ids if mode == SINGLE else
+                [u for u in user_ids if shard_of_user(u, shards) != home]
+            )
+            for level in levels:
+                results["writes"].setdefault(LONG_WRITE, {}).setdefault(
+                    level, {})[mode] = write(
+                        target, profile, "toggle_favorite", requests,
+                        level, (others, movie_ids), blocked, hold)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results):
+    writes = results["writes"]
+    modes = list(next(iter(next(iter(writes.values())).values())))
+    width = max(len(case) for case in writes) + 9
+    print("writes per second (p99 ms)")
+    print(f"{'case':<{width}}" + "".join(f"{mode:>18}" for mode in modes))
+    for case, levels in writes.items():
+        for level, stats in levels.items():
+            print(f"{case + ' x' + str(level) + ' proc':<{width}}" + "".join(
+                f"{stats[mode]['throughput']:9.0f} ({stats[mode]['p99']:5.1f})"
+                for mode in modes
+            ))
+    print()
+    print_table({
+        f"{name} [{mode}]": stats
+        for name, by_mode in results["reads"].items()
+        for mode, stats in by_mode.items()
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare a single database file with sharded layouts."
+    )
+    parser.add_argument("database", help="seeded SQLite file (copied)")
+    parser.add_argument("--shards", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--requests", type=int, default=800,
+                        help="writes per case and concurrency level")
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=[1, 4, 8], help="writer processes")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="timed calls per read case")
+    parser.add_argument("--hold-ms", type=float, default=20,
+                        help="lock hold time of the long write case")
+    parser.add_argument("--profile", default="production",
+                        help="DATABASE_PROFILE to run with")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PROFILE"] = args.profile
+    # only the data managers are measured
+    for feature in ("POSTER_CACHE", "RECOMMENDATIONS", "AUTOCOMPLETE",
+                    "CATALOGUE_SNAPSHOT", "WRITE_QUEUE"):
+        os.environ[feature] = "0"
+    results = run(args.database, args.shards, args.requests,
+                  args.processes, args.repeat, args.profile,
+                  args.hold_ms / 1000)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
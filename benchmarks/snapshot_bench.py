@@ -0,0 +1,125 @@
+"""
+Compare the in-memory catalogue snapshot with SQLite and ORM objects.
+
+Usage:
+    python -m benchmarks.snapshot_bench /tmp/bench-100k.sqlite3
+
+Prints the memory taken by the whole movie table as ORM instances, as
+plain rows and as a :class:`CatalogueSnapshot` (measured with
+``tracemalloc``, plus the snapshot's own per-column estimate), then
+times the ``/explore`` pages (``get_movie_cards_page``) from SQLite and
+from the snapshot, with the generation checked on every read and with
+it skipped.
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.bench import Context
+from benchmarks.common import (
+    environment, load_app, percentiles, print_table, time_call
+)
+from database import db
+from database.models import Movie
+from database.sqlite_data_manager import SQLiteDataManager
+
+
+
+def page_cases(ctx):
+    """``get_movie_cards_page`` arguments per case."""
+    return {
+        "first page by title": dict(sort_by="title"),
+        "middle page by rating": dict(
+            sort_by="rating", after=ctx.cursor("rating")
+        ),
+        "search by relevance": dict(query=ctx.search, sort_by="relevance"),
+        "search by year": dict(query=ctx.search, sort_by="year"),
+        "heavy user, favourites excluded": dict(
+            user_id=ctx.heavy_user_id, exclude_favorites=True
+        ),
+    }
+
+
+def allocated(build):
+    """Bytes still allocated by ``build()``'s result, and the result."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def memory():
+    sizes = {}
+    sizes["ORM objects"], movies = allocated(
+        lambda: db.session.execute(db.select(Movie)).scalars().all()
+    )
+    del movies
+    db.session.expunge_all()
+    sizes["rows"], rows = allocated(
+        lambda: db.session.execute(db.select(Movie.__table__)).all()
+    )
+    del rows
+
+    def build():
+        snapshot = SQLiteDataManager().enable_snapshot()
+        snapshot.load()
+        return snapshot
+
+    sizes["snapshot"], snapshot = allocated(build)
+    return sizes, snapshot.memory_report()
+
+
+def timings(repeat):
+    ctx = Context()
+    sql = SQLiteDataManager()
+    checked = SQLiteDataManager()
+    checked.enable_snapshot()
+    cached = SQLiteDataManager()
+    cached.enable_snapshot(max_age=float("inf"))
+    results = {}
+    for name, kwargs in page_cases(ctx).items():
+        for mode, dm in (("sql", sql), ("snapshot", checked),
+                         ("snapshot, max_age=inf", cached)):
+            call = lambda dm=dm: dm.get_movie_cards_page(**kwargs)
+            results[f"{name} [{mode}]"] = percentiles(time_call(call, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the catalogue snapshot against SQLite."
+    )
+    parser.add_argument("database", help="seeded SQLite file")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    app = load_app(args.database)
+    with app.app_context():
+        sizes, report = memory()
+        results = timings(args.repeat)
+
+    print("memory of the whole movie table (MiB):")
+    for name, size in sizes.items():
+        print(f"  {name:<12} {size / 2**20:8.1f}")
+    print("snapshot columns (MiB):")
+    for name, size in report.items():
+        print(f"  {name:<12} {size / 2**20:8.1f}")
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "memory": sizes,
+                 "columns": report, "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
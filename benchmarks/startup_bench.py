@@ -0,0 +1,146 @@
+"""
+Measure how long a new worker takes to serve its first request.
+
+Usage:
+    python -m benchmarks.startup_bench /tmp/bench-10k.sqlite3 --runs 10
+
+Every run starts a fresh interpreter, which times importing :mod:`app`,
+:func:`app.create_app` and the first and second request of each
+``--route`` through the test client. Three cases are reported:
+
+* ``cold``: the worker imports and builds the app itself, as without
+  ``gunicorn --preload``;
+* ``preload``: the app is built once and the requests are served by a
+  forked child;
+* ``warm``: like ``preload``, after :func:`app.warm_up`, as a worker
+  of ``gunicorn --preload wsgi:app`` does.
+
+``process`` is the wall time of the whole run as seen from outside,
+interpreter start-up and shutdown included.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import environment, percentiles, print_table
+
+CASES = ("cold", "preload", "warm")
+ROUTES = ("/", "/explore", "/users")
+
+
+def _requests(app, routes):
+    timings = {}
+    client = app.test_client()
+    for route in routes:
+        for attempt in ("first", "second"):
+            started = time.perf_counter()
+            response = client.get(route)
+            timings[f"{route} {attempt}"] = time.perf_counter() - started
+            assert response.status_code == 200, (route, response.status_code)
+    return timings
+
+
+def measure(routes, case):
+    """Time one start-up in this (fresh) process; return ``{step: s}``."""
+    started = time.perf_counter()
+    from app import create_app, warm_up
+    imported = time.perf_counter()
+    app = create_app()
+    timings = {
+        "import": imported - started,
+        "create_app": time.perf_counter() - imported,
+    }
+    if case == "warm":
+        started = time.perf_counter()
+        warm_up(app)
+        timings["warm_up"] = time.perf_counter() - started
+    if case == "cold":
+        timings.update(_requests(app, routes))
+        return timings
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        status = 1
+        try:
+            with os.fdopen(write, "w") as output:
+                json.dump(_requests(app, routes), output)
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write)
+    with os.fdopen(read) as output:
+        served = output.read()
+    _, status = os.waitpid(pid, 0)
+    if status:
+        raise RuntimeError("The forked worker failed.")
+    timings.update(json.loads(served))
+    return timings
+
+
+def run(database, runs, routes):
+    """Start ``runs`` processes per case; return ``{case: {step: stats}}``."""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.abspath(database)}",
+        SECRET_KEY=os.getenv("SECRET_KEY", "benchmark"),
+        SLOW_QUERY_MS=os.getenv("SLOW_QUERY_MS", "0"),
+    )
+    results = {}
+    for case in CASES:
+        samples = {}
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.startup_bench", database,
+                 "--measure", case, "--route", *routes],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            samples.setdefault("process", []).append(
+                time.perf_counter() - started
+            )
+            for step, elapsed in json.loads(output).items():
+                samples.setdefault(step, []).append(elapsed)
+        results[case] = {
+            step: percentiles(values) for step, values in samples.items()
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure import, app creation and first requests."
+    )
+    parser.add_argument("database", help="seeded SQLite file")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="processes started per case")
+    parser.add_argument("--route", nargs="+", default=list(ROUTES),
+                        help="URLs requested, in order")
+    parser.add_argument("--output", help="write results to this JSON file")
+    # internal: time one start-up in this process and print JSON
+    parser.add_argument("--measure", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.route, args.measure)))
+        return
+
+    results = run(args.database, args.runs, args.route)
+    for case, steps in results.items():
+        print(f"\n{case}")
+        print_table(steps)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Compare direct commits with the group commit write queue.
+
+Usage:
+    python -m benchmarks.write_bench /tmp/bench-10k.sqlite3 \\
+        --concurrency 1 8 32 --requests 800
+
+Each write case runs on a thread pool at every ``--concurrency`` level,
+first with every call committing on its own, then through
+:class:`GroupCommitWriter`. Reports latency, throughput and, for the
+queue, the average number of writes per commit. Both modes commit
+every write before the call returns, so the comparison is at equal
+durability. The database is modified; re-seed before comparing runs.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import environment, load_app, percentiles
+
+CASES = ("toggle_favorite", "add_movie")
+
+
+def _call(dm, case, user_ids, movie_ids, rng):
+    if case == "toggle_favorite":
+        return lambda: dm.toggle_favorite(
+            rng.choice(user_ids), rng.choice(movie_ids)
+        )
+    return lambda: dm.add_movie(
+        rng.choice(user_ids), f"Benchmark {rng.random():.8f}", 2000, 5.0,
+        None,
+    )
+
+
+def bench(app, call, requests, concurrency):
+    from database import db
+
+    def timed(_):
+        with app.app_context():
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            db.session.remove()
+        return elapsed
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, range(concurrency)))  # warm up the pool
+        started = time.perf_counter()
+        latencies = list(executor.map(timed, range(requests)))
+        stats = percentiles(latencies)
+        stats["throughput"] = requests / (time.perf_counter() - started)
+        return stats
+
+
+def run(database, requests, levels, max_batch, max_delay):
+    """Benchmark both modes; return ``{case: {level: {mode: stats}}}``."""
+    from database import db
+    from database.models import Movie, User
+
+    from app import services
+
+    app = load_app(database)
+    dm = services(app).data_manager
+    with app.app_context():
+        user_ids = db.session.execute(db.select(User.id)).scalars().all()
+        movie_ids = db.session.execute(
+            db.select(Movie.id).limit(5000)
+        ).scalars().all()
+    rng = random.Random(42)
+
+    results = {}
+    for mode in ("direct", "queue"):
+        writer = None
+        if mode == "queue":
+            writer = dm.enable_write_queue(app, max_batch, max_delay)
+        for case in CASES:
+            call = _call(dm, case, user_ids, movie_ids, rng)
+            for level in levels:
+                groups = writer.groups if writer else 0
+                committed = writer.committed if writer else 0
+                stats = bench(app, call, requests, level)
+                if writer:
+                    stats["per_commit"] = (writer.committed - committed) / max(
+                        1, writer.groups - groups
+                    )
+                results.setdefault(case, {}).setdefault(level, {})[
+                    mode] = stats
+        if writer:
+            writer.close()
+            dm.write_queue = None
+    return results
+
+
+def print_results(results):
+    print(f"{'case':<28} {'direct/s':>9} {'queue/s':>9} {'speedup':>8} "
+          f"{'p50 ms':>15} {'p99 ms':>15} {'per commit':>10}")
+    for case, levels in results.items():
+        for level, modes in levels.items():
+            direct, queued = modes["direct"], modes["queue"]
+            print(
+                f"{case + ' x' + str(level):<28} "
+                f"{direct['throughput']:9.0f} {queued['throughput']:9.0f} "
+                f"{queued['throughput'] / direct['throughput']:7.1f}x "
+                f"{direct['p50']:7.2f}/{queued['p50']:<7.2f} "
+                f"{direct['p99']:7.2f}/{queued['p99']:<7.2f} "
+                f"{queued['per_commit']:10.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare direct commits with the write queue."
+    )
+    parser.add_argument("database", help="seeded SQLite file (modified)")
+    parser.add_argument("--requests", type=int, default=800,
+                        help="writes per case and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8, 32])
+    parser.add_argument("--profile", default="production",
+                        help="DATABASE_PROFILE to run with")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=2)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PROFILE"] = args.profile
+    # only the writes themselves are measured
+    for feature in ("POSTER_CACHE", "RECOMMENDATIONS", "AUTOCOMPLETE"):
+        os.environ.setdefault(feature, "0")
+    results = run(args.database, args.requests, args.concurrency,
+                  args.max_batch, args.max_delay_ms / 1000)
+
+    print("throughput in writes per second, latency direct/queue")
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results},
+                output, indent=2,
+            )
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Asynchronous data manager on SQLAlchemy's asyncio extension.
+
+Runs the same statements as :class:`SQLiteDataManager` (see
+:mod:`database.queries`) through an ``AsyncSession`` on the
+``aiosqlite`` driver, so a coroutine waiting on SQLite gives the event
+loop back to other requests instead of blocking a worker thread.
+
+The optional dependencies are imported on first use::
+
+    pip install aiosqlite greenlet asgiref
+"""
+import asyncio
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from sqlalchemy import delete, event, select, update
+
+from .datamanager_interface import DataManagerInterface
+from .engine import _pragma_hook
+from .models import Favorite, Movie, User
+from . import queries, signals, trigrams
+from .records import MovieCard, RankedMovie, UserName, UserSummary
+from .sqlite_data_manager import CATALOGUE, FAVORITES, USERS, user_scope
+
+
+def async_url(url):
+    """
+    Turn a synchronous SQLite URL into its ``aiosqlite`` equivalent.
+
+    Args:
+        url (str): e.g. ``sqlite:///movies.sqlite3``.
+
+    Returns:
+        str: e.g. ``sqlite+aiosqlite:///movies.sqlite3``.
+
+    Raises:
+        ValueError: If ``url`` is not a SQLite URL.
+    """
+    scheme = urlsplit(url).scheme
+    if scheme.split("+")[0] != "sqlite":
+        raise ValueError(f"Not a SQLite URL: {url!r}.")
+    return "sqlite+aiosqlite" + url[len(scheme):]
+
+
+class AsyncSQLiteDataManager(DataManagerInterface):
+    """
+    Coroutine implementation of :class:`DataManagerInterface`.
+
+    Every method is a coroutine with the same arguments and results as
+    its :class:`SQLiteDataManager` counterpart. Returned ORM objects are
+    detached and fully loaded; relationships are not lazy-loadable.
+    An instance must only be used from one event loop.
+
+    Args:
+        url (str): Synchronous or ``aiosqlite`` SQLite URL.
+        pragmas (dict, optional): Connection pragmas, as in the engine
+            profiles of :mod:`database.engine`.
+        **engine_options: Passed to ``create_async_engine``.
+
+    Raises:
+        RuntimeError: If ``aiosqlite`` or ``greenlet`` is not installed.
+    """
+
+    def __init__(self, url, pragmas=None, **engine_options):
+        try:
+            import aiosqlite  # noqa: F401
+            import greenlet  # noqa: F401
+            from sqlalchemy.ext.asyncio import (
+                async_sessionmaker,
+                create_async_engine,
+            )
+        except ImportError as e:
+            raise RuntimeError(
+                "The async data manager needs aiosqlite and greenlet: "
+                "pip install aiosqlite greenlet"
+            ) from e
+
+        self.engine = create_async_engine(async_url(url), **engine_options)
+        if pragmas:
+            event.listen(
+                self.engine.sync_engine,
+                "connect",
+                _pragma_hook(pragmas, read_only=False),
+            )
+        self._sessionmaker = async_sessionmaker(
+            self.engine, expire_on_commit=False
+        )
+        self._loop = None
+
+    @property
+    def sync_engine(self):
+        """The ``Engine`` the async engine proxies, for event hooks."""
+        return self.engine.sync_engine
+
+    async def dispose(self):
+        """Close all pooled connections."""
+        await self.engine.dispose()
+
+    def _bind_loop(self):
+        # Pooled aiosqlite connections belong to the loop that opened
+        # them; sharing them with another loop deadlocks on contention.
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError(
+                "AsyncSQLiteDataManager is bound to another event loop; "
+                "serve the app through asgi.py to use it."
+            )
+
+    def _session(self):
+        self._bind_loop()
+        return self._sessionmaker()
+
+    def _transaction(self):
+        self._bind_loop()
+        return self._sessionmaker.begin()
+
+    async def _read(self, statement):
+        async with self._session() as session:
+            return (await session.execute(statement)).all()
+
+    async def _read_objects(self, statement):
+        async with self._session() as session:
+            return (await session.execute(statement)).scalars().all()
+
+    @staticmethod
+    async def _bump(session, *scopes, step=1):
+        for statement in queries.bump_generations(scopes, step=step):
+            await session.execute(statement)
+
+    async def get_generations(self, *scopes):
+        """Return the current generation of each scope."""
+        rows = await self._read(queries.generations(scopes))
+        generations = dict(rows)
+        return tuple(generations.get(scope, 0) for scope in scopes)
+
+    async def get_version(self, *scopes):
+        """Return the generations and last change time of ``scopes``."""
+        return queries.to_version(
+            scopes, await self._read(queries.versions(scopes))
+        )
+
+    async def get_all_users(self):
+        """Return every user in the system."""
+        return await self._read_objects(select(User))
+
+    async def get_user(self, user_id):
+        """Return one user by primary key, ``None`` if not found."""
+        async with self._session() as session:
+            return await session.get(User, user_id)
+
+    async def get_user_summaries(self):
+        """Return every active user with their movie and favourite counts."""
+        rows = await self._read(queries.user_summaries())
+        return [UserSummary(*row) for row in rows]
+
+    async def get_user_names(self):
+        """Return the id and name of every active user, for pickers."""
+        rows = await self._read(queries.user_names())
+        return [UserName(*row) for row in rows]
+
+    async def get_movies(self, movie_ids):
+        """Return the movies with the given ids as ``{id: movie}``."""
+        movies = await self._read_objects(queries.movies_by_id(movie_ids))
+        return {movie.id: movie for movie in movies}
+
+    async def get_movie_cards(self, movie_ids, user_id=None):
+        """Return the card columns of movies as ``{id: MovieCard}``."""
+        rows = await self._read(
+            queries.movies_by_id(movie_ids, user_id, cards=True)
+        )
+        return {row.id: row for row in map(MovieCard._make, rows)}
+
+    async def get_user_movies(self, user_id):
+        """Return all movies that belong to a user, ordered by id."""
+        return await self._read_objects(
+            select(Movie).where(Movie.user_id == user_id).order_by(Movie.id)
+        )
+
+    async def fuzzy_search(self, query, limit=20, user_id=None,
+                           exclude_favorites=False):
+        """Find movies whose titles resemble ``query``, typos included."""
+        grams = trigrams.trigrams(query)
+        if not grams:
+            return []
+        postings = dict(await self._read(trigrams.frequencies(grams)))
+        rows = await self._read(trigrams.candidates(
+            grams, postings,
+            exclude_user_id=user_id if exclude_favorites else None,
+        ))
+        ids = trigrams.rank(query, rows, limit)
+        movies = {
+            movie.id: movie for movie in
+            await self._read_objects(queries.movies_by_id(ids, user_id))
+        }
+        return [movies[movie_id] for movie_id in ids if movie_id in movies]
+
+    async def get_favorite_movies(self, user_id, sort_by=None):
+        """Return every movie the user marked as favourite."""
+        return await self._read_objects(
+            queries.favorite_movies(user_id, sort_by)
+        )
+
+    async def get_favorite_cards(self, user_id, sort_by=None):
+        """Return the card columns of every favourite of a user."""
+        rows = await self._read(
+            queries.favorite_movies(user_id, sort_by, cards=True)
+        )
+        return [MovieCard._make(row) for row in rows]
+
+    async def get_movies_page(self, query=None, sort_by=None, after=None,
+                              before=None, page_size=None, user_id=None,
+                              exclude_favorites=False):
+        """Return one keyset-paginated page of the movie catalogue."""
+        page_query = queries.movies_page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites,
+        )
+        rows = await self._read(page_query.statement)
+        return queries.build_page(page_query, rows)
+
+    async def get_movie_cards_page(self, query=None, sort_by=None,
+                                   after=None, before=None, page_size=None,
+                                   user_id=None, exclude_favorites=False):
+        """Return one page of the catalogue as :class:`MovieCard` rows."""
+        page_query = queries.movies_page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites, cards=True,
+        )
+        rows = await self._read(page_query.statement)
+        return queries.build_page(page_query, rows)
+
+    async def add_user(self, name):
+        """Create and persist a new user."""
+        async with self._transaction() as session:
+            user = User(name=name)
+            session.add(user)
+            await self._bump(session, USERS)
+        signals.user_added.send(self, user=user)
+        return user
+
+    async def deactivate_user(self, user_id):
+        """Soft-delete a user; ``None`` if not found."""
+        async with self._transaction() as session:
+            user = await session.get(User, user_id)
+            if user:
+                user.is_active = False
+                await self._bump(session, USERS, user_scope(user_id))
+        if user:
+            signals.user_deactivated.send(self, user_id=user_id)
+        return user
+
+    async def add_movie(self, user_id, title, year, rating, poster):
+        """Insert a new movie record."""
+        async with self._transaction() as session:
+            movie = Movie(
+                title=title,
+                year=year,
+                rating=rating,
+                poster=poster,
+                user_id=user_id,
+            )
+            session.add(movie)
+            await session.flush()
+            for statement in trigrams.add_postings(movie.id, title):
+                await session.execute(statement)
+            await self._bump(session, CATALOGUE, USERS)
+        signals.movie_added.send(self, movie=movie)
+        return movie
+
+    async def update_movie(self, movie_id, title, year, rating, poster):
+        """Update an existing movie; ``None`` if not found."""
+        async with self._transaction() as session:
+            old_title = await session.scalar(
+                select(Movie.title).where(Movie.id == movie_id)
+            )
+            if old_title is not None and old_title != title:
+                await session.execute(
+                    trigrams.remove_postings(movie_id, old_title)
+                )
+                for statement in trigrams.add_postings(movie_id, title):
+                    await session.execute(statement)
+            result = await session.execute(
+                update(Movie)
+                .where(Movie.id == movie_id)
+                .values(title=title, year=year, rating=rating, poster=poster)
+                .returning(Movie)
+            )
+            movie = result.scalar_one_or_none()
+            if movie:
+                await self._bump(session, CATALOGUE)
+        if movie:
+            signals.movie_updated.send(self, movie=movie)
+        return movie
+
+    async def delete_movie(self, movie_id):
+        """Delete a movie and its favourites; ``False`` if not found."""
+        async with self._transaction() as session:
+            # favourites first, the ORM cascade needs a lazy load here
+            await session.execute(
+                delete(Favorite).where(Favorite.movie_id == movie_id)
+            )
+            title = await session.scalar(
+                delete(Movie).where(Movie.id == movie_id)
+                .returning(Movie.title)
+            )
+            if title is None:
+                return False
+            await session.execute(queries.forget_popularity(movie_id))
+            await session.execute(trigrams.remove_postings(movie_id, title))
+            await self._bump(session, CATALOGUE, USERS, FAVORITES)
+        signals.movie_deleted.send(self, movie_id=movie_id)
+        return True
+
+    async def get_top_movies(self, window="week", limit=10):
+        """Return the most favourited movies as ``RankedMovie`` pairs."""
+        rows = await self._read(queries.top_movies(window, limit))
+        return [RankedMovie(movie, favorites) for movie, favorites in rows]
+
+    @staticmethod
+    async def _set_favorite(session, user_id, movie_id, favorite):
+        if favorite:
+            statement = queries.add_favorite(
+                user_id, movie_id, datetime.utcnow()
+            )
+        else:
+            statement = queries.remove_favorite(user_id, movie_id)
+        created = (await session.execute(statement)).first()
+        if created is None:
+            return False
+        for step_statement in queries.count_favorite(
+            movie_id, created[0], 1 if favorite else -1
+        ):
+            await session.execute(step_statement)
+        return True
+
+    async def toggle_favorite(self, user_id, movie_id):
+        """
+        Flip a favourite; ``True`` if it is one afterwards, ``None`` for
+        an unknown user or movie.
+        """
+        async with self._transaction() as session:
+            added = not await self._set_favorite(
+                session, user_id, movie_id, False
+            )
+            changed = not added or await self._set_favorite(
+                session, user_id, movie_id, True
+            )
+            if not changed and not await session.scalar(
+                queries.has_favorite(user_id, movie_id)
+            ):
+                return None
+            if changed:
+                await self._bump(
+                    session, USERS, FAVORITES, user_scope(user_id)
+                )
+        if changed:
+            signals.favorite_toggled.send(
+                self, user_id=user_id, movie_id=movie_id, added=added
+            )
+        return added
+
+    async def set_favorites(self, user_id, add=(), remove=()):
+        """Add and remove many favourites of a user in one transaction."""
+        add, remove = set(add), set(remove)
+        if add & remove:
+            raise ValueError("A movie cannot be both added and removed.")
+        changed = {}
+        async with self._transaction() as session:
+            known = set(await session.scalars(
+                queries.existing_movie_ids(add | remove)
+            ))
+            for movie_ids, favorite in ((add, True), (remove, False)):
+                for movie_id in sorted(movie_ids & known):
+                    changed[movie_id] = await self._set_favorite(
+                        session, user_id, movie_id, favorite
+                    )
+            written = [
+                movie_id for movie_id, done in changed.items() if done
+            ]
+            if written:
+                # one generation per signal sent below
+                await self._bump(
+                    session, USERS, FAVORITES, user_scope(user_id),
+                    step=len(written),
+                )
+        for movie_id in written:
+            signals.favorite_toggled.send(
+                self, user_id=user_id, movie_id=movie_id,
+                added=movie_id in add,
+            )
+        return changed
+
+
+def run_inline(coroutine):
+    """
+    Run a coroutine that never suspends, without an event loop.
+
+    Coroutines that only await :class:`AwaitableDataManager` methods
+    complete on their first step, so a view written as ``async def``
+    can be served by a plain WSGI worker at no extra cost.
+
+    Args:
+        coroutine: The coroutine to run.
+
+    Returns:
+        The coroutine's return value.
+
+    Raises:
+        RuntimeError: If the coroutine awaited real asynchronous I/O.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("Coroutine suspended; it needs an event loop.")
+
+
+class AwaitableDataManager:
+    """
+    Expose a synchronous data manager through coroutine methods.
+
+    Lets async views ``await`` the same calls whether the
+    :class:`AsyncSQLiteDataManager` is enabled or not. The wrapped
+    method runs inline: under Flask an async view already executes on
+    its own worker thread.
+
+    Args:
+        data_manager (SQLiteDataManager): Manager to delegate to.
+    """
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+
+    def __getattr__(self, name):
+        method = getattr(self.data_manager, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
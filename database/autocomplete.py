@@ -0,0 +1,315 @@
+"""
+Title autocomplete from an in-memory prefix index.
+
+Every title is normalised like the search index (lower case, no
+accents, words joined by single spaces) and stored once per word it
+contains, as the suffix starting at that word::
+
+    "Frozen Heart: Origins" -> "frozen heart origins", "heart origins",
+                               "origins"
+
+The ``(suffix, movie_id)`` pairs are kept in one sorted list, so the
+titles with a word starting with ``"heart o"`` are the contiguous range
+between two bisections. Short prefixes match a large part of the
+catalogue, so the best ``max_results`` movies of every prefix matching
+more than ``scan_limit`` entries are ranked once at load and kept up to
+date by the writes; any other prefix ranks its (small) range on the
+fly.
+
+The index is built on a background thread the first time it is asked
+for; until then :meth:`TitleIndex.complete` returns ``None`` and the
+caller falls back to SQL. Writes of this process arrive through
+:mod:`database.signals` and are applied in place. Writes of other
+processes are noticed through the catalogue generation, checked at
+most every ``max_age`` seconds, and trigger a rebuild in the
+background while the old index keeps answering.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from . import queries, signals
+from .records import Suggestion
+from .search import fold
+
+log = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# sorts after every character a normalised title can contain
+_END = "\U0010ffff"
+
+
+def normalize(text):
+    """Fold ``text`` and join its words with single spaces."""
+    return " ".join(_TOKEN.findall(fold(text or "")))
+
+
+def suffixes(title):
+    """Return the normalised ``title`` from each of its words on."""
+    words = normalize(title).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class TitleIndex:
+    """
+    Sorted suffix index over movie titles, ranked by rating.
+
+    Args:
+        read (callable): Executes a ``select()`` and returns its rows;
+            called from a background thread, so it must not depend on
+            the caller's app context.
+        scope (str): data_version scope bumped by every movie write.
+        max_results (int): Largest ``limit`` :meth:`complete` serves.
+        scan_limit (int): Prefixes matching more entries than this are
+            ranked ahead of time.
+        max_age (float): Seconds between checks for writes made by
+            other processes.
+    """
+
+    def __init__(self, read, scope, max_results=10, scan_limit=500,
+                 max_age=1):
+        self._read = read
+        self.scope = scope
+        self.max_results = max_results
+        self.scan_limit = scan_limit
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loader = None
+        self._checked = 0.0
+        # None until the first load finished
+        self.generation = None
+        self.movies = {}
+        self.entries = []
+        self._top = {}
+
+    # -- loading ---------------------------------------------------------
+
+    def _current_generation(self):
+        rows = self._read(queries.generations((self.scope,)))
+        return rows[0][1] if rows else 0
+
+    def _best(self, entries, lo, hi, movies, limit):
+        ids = {movie_id for _, movie_id in entries[lo:hi]}
+        return heapq.nlargest(limit, ids, key=lambda i: (movies[i][2], -i))
+
+    def _rank_prefixes(self, entries, movies):
+        # split each large range by one more character, until the
+        # ranges are small enough to rank per request
+        top = {}
+        ranges = [(0, len(entries), 0)]
+        while ranges:
+            lo, hi, length = ranges.pop()
+            length += 1
+            while lo < hi:
+                prefix = entries[lo][0][:length]
+                if len(prefix) < length:
+                    lo += 1
+                    continue
+                end = bisect_left(entries, (prefix + _END,), lo, hi)
+                if end - lo > self.scan_limit:
+                    top[prefix] = self._best(
+                        entries, lo, end, movies, self.max_results
+                    )
+                    ranges.append((lo, end, length))
+                lo = end
+        return top
+
+    def load(self):
+        """Build the index from the movie table and swap it in."""
+        started = time.perf_counter()
+        generation = self._current_generation()
+        movies, entries = {}, []
+        for movie_id, title, year, rating, _, _ in self._read(
+                queries.movie_rows()):
+            movies[movie_id] = (title, year, rating)
+            entries.extend((suffix, movie_id) for suffix in suffixes(title))
+        entries.sort()
+        top = self._rank_prefixes(entries, movies)
+        with self._lock:
+            self.movies, self.entries, self._top = movies, entries, top
+            self.generation = generation
+            self._checked = time.monotonic()
+        log.info(
+            "Title index: %d movies, %d entries in %.0f ms", len(movies),
+            len(entries), (time.perf_counter() - started) * 1000,
+        )
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except Exception as e:
+            log.warning("Title index load failed: %s", e)
+        finally:
+            with self._lock:
+                self._loader = None
+
+    def load_in_background(self):
+        """Start a (re)build unless one is already running."""
+        with self._lock:
+            if self._loader is None:
+                self._loader = threading.Thread(
+                    target=self._load_quietly, name="title-index",
+                    daemon=True,
+                )
+                self._loader.start()
+            return self._loader
+
+    # -- incremental updates ---------------------------------------------
+
+    def _ranked(self, suffix):
+        # prefixes of suffix with a ranked list; a prefix only has one
+        # if all shorter ones have
+        prefixes = []
+        for length in range(1, len(suffix) + 1):
+            if suffix[:length] not in self._top:
+                break
+            prefixes.append(suffix[:length])
+        return prefixes
+
+    def _insert(self, movie_id, title, year, rating):
+        movies = self.movies
+        movies[movie_id] = (title, year, rating)
+        for suffix in suffixes(title):
+            insort(self.entries, (suffix, movie_id))
+            for prefix in self._ranked(suffix):
+                candidates = set(self._top[prefix])
+                candidates.add(movie_id)
+                self._top[prefix] = heapq.nlargest(
+                    self.max_results, candidates,
+                    key=lambda i: (movies[i][2], -i),
+                )
+
+    def _remove(self, movie_id):
+        found = self.movies.pop(movie_id, None)
+        if found is None:
+            return
+        prefixes = set()
+        for suffix in suffixes(found[0]):
+            position = bisect_left(self.entries, (suffix, movie_id))
+            if self.entries[position:position + 1] == [(suffix, movie_id)]:
+                del self.entries[position]
+            prefixes.update(self._ranked(suffix))
+        for prefix in prefixes:
+            if movie_id in self._top[prefix]:
+                # a lower ranked movie may move up: rank the range
+                lo = bisect_left(self.entries, (prefix,))
+                hi = bisect_left(self.entries, (prefix + _END,), lo)
+                best = self._best(
+                    self.entries, lo, hi, self.movies, self.max_results
+                )
+                if best:
+                    self._top[prefix] = best
+                else:
+                    del self._top[prefix]
+
+    def _update(self, movie):
+        self._remove(movie.id)
+        self._insert(movie.id, movie.title, movie.year, movie.rating)
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if self.generation is None:
+                return
+            try:
+                change(*args)
+            except Exception as e:
+                log.warning("Title index update failed: %s", e)
+                # the next read starts a rebuild
+                self.generation = -1
+                self._checked = 0.0
+                return
+            # one bump per signalled write; writes of other processes
+            # leave the database ahead and trigger a rebuild
+            self.generation += 1
+
+    def _receivers(self):
+        return (
+            (signals.movie_added, self._on_added),
+            (signals.movies_imported, self._on_imported),
+            (signals.movie_updated, self._on_updated),
+            (signals.movie_deleted, self._on_deleted),
+        )
+
+    def connect_signals(self, sender):
+        """
+        Follow the movie writes of ``sender``.
+
+        Args:
+            sender: The data manager whose signals update the index;
+                held weakly, like the receivers.
+        """
+        for signal, receiver in self._receivers():
+            signal.connect(receiver, sender=sender)
+
+    def disconnect_signals(self):
+        """Stop following the data manager's writes."""
+        for signal, receiver in self._receivers():
+            signal.disconnect(receiver)
+
+    def _on_added(self, sender, movie, **extra):
+        self._apply(
+            self._insert, movie.id, movie.title, movie.year, movie.rating
+        )
+
+    def _on_imported(self, sender, **extra):
+        # too many rows to patch in, rebuild on the next read
+        with self._lock:
+            if self.generation is not None:
+                self.generation = -1
+                self._checked = 0.0
+
+    def _on_updated(self, sender, movie, **extra):
+        self._apply(self._update, movie)
+
+    def _on_deleted(self, sender, movie_id, **extra):
+        self._apply(self._remove, movie_id)
+
+    # -- reads -----------------------------------------------------------
+
+    def complete(self, prefix, limit=None):
+        """
+        Return the best rated movies with a title word starting with
+        ``prefix``.
+
+        Never waits for a build: the first call only starts it, and a
+        rebuild after outside writes runs while the current index keeps
+        answering.
+
+        Args:
+            prefix (str): What the user typed so far; case, accents and
+                punctuation are ignored, and several words must follow
+                each other in the title.
+            limit (int, optional): Suggestions to return, at most
+                ``max_results`` (the default).
+
+        Returns:
+            list[Suggestion] | None: Best rating first, ties going to
+            the newer movie; ``None`` while the index is not built yet.
+        """
+        limit = max(1, min(limit or self.max_results, self.max_results))
+        key = normalize(prefix)
+        with self._lock:
+            if self.generation is None:
+                self.load_in_background()
+                return None
+            now = time.monotonic()
+            if now - self._checked >= self.max_age:
+                self._checked = now
+                if self._current_generation() != self.generation:
+                    self.load_in_background()
+            if not key:
+                return []
+            best = self._top.get(key)
+            if best is not None:
+                best = best[:limit]
+            else:
+                lo = bisect_left(self.entries, (key,))
+                hi = bisect_left(self.entries, (key + _END,), lo)
+                best = self._best(self.entries, lo, hi, self.movies, limit)
+            return [Suggestion(i, *self.movies[i]) for i in best]
+
+    def __len__(self):
+        return len(self.movies)
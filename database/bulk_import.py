@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+
+from .validation import MovieValidationError, validate_movie
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("title", "year", "rating", "poster")
+
+# rejected rows beyond this are only counted, not listed
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportReport:
+    """
+    Outcome of a bulk import.
+
+    Attributes:
+        imported (int): Rows inserted.
+        rejected (int): Rows that failed parsing or validation.
+        errors (list[tuple[int, str]]): ``(line number, reason)`` for the
+            first :data:`MAX_REPORTED_ERRORS` rejected rows.
+    """
+    imported: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, reason))
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": [
+                {"line": line, "reason": reason}
+                for line, reason in self.errors
+            ],
+        }
+
+
+def guess_format(filename):
+    """
+    Derive the import format from a file name.
+
+    Args:
+        filename (str): Name of the uploaded or local file.
+
+    Returns:
+        str | None: ``"csv"``, ``"jsonl"`` or ``None`` if unknown.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+def _records(stream, fmt):
+    """Yield ``(line number, dict | None)``; ``None`` marks a bad line."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def read_movies(stream, fmt, report):
+    """
+    Stream valid ``(title, year, rating, poster)`` rows from a file.
+
+    Rows go through :func:`validate_movie`, the same rules as the add
+    and edit forms; rejected rows are recorded in ``report`` and
+    skipped.
+
+    Args:
+        stream: Binary or text file object.
+        fmt (str): ``"csv"`` or ``"jsonl"``.
+        report (ImportReport): Collects rejected rows.
+
+    Yields:
+        tuple[str, int, float, str]: Validated movie fields.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    for line, record in _records(stream, fmt):
+        if record is None:
+            report.reject(line, "Not a valid JSON object.")
+            continue
+        try:
+            yield validate_movie(
+                *(_text(record.get(name)) for name in FIELDS)
+            )
+        except MovieValidationError as e:
+            report.reject(line, str(e))
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def import_movies(data_manager, user_id, stream, fmt, batch_size=5000):
+    """
+    Validate and bulk insert movies from a CSV or JSON Lines file.
+
+    The file is read lazily and inserted in batches, so memory use does
+    not depend on its size.
+
+    Args:
+        data_manager (SQLiteDataManager): Data manager to write through.
+        user_id (int): Owner of the imported movies.
+        stream: File object opened in text or binary mode.
+        fmt (str): ``"csv"`` or ``"jsonl"``.
+        batch_size (int): Rows per ``executemany`` batch.
+
+    Returns:
+        ImportReport: Inserted and rejected row counts.
+
+    Raises:
+        ValueError: If ``fmt`` is not a supported format.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format {fmt!r}.")
+    report = ImportReport()
+    report.imported = data_manager.add_movies(
+        user_id, read_movies(stream, fmt, report), batch_size=batch_size
+    )
+    return report
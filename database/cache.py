@@ -0,0 +1,127 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class CacheBackend(ABC):
+    """
+    Minimal key/value cache interface.
+
+    Keys must embed the data generations they were computed from (see
+    :meth:`SQLiteDataManager.get_generations`), so entries never need
+    explicit invalidation: after a write the old keys are simply never
+    asked for again and age out. That keeps a shared backend (e.g.
+    Redis) a drop-in replacement for the in-process one.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def stats(self):
+        """
+        Return hit/miss counters for monitoring.
+
+        Returns:
+            dict: ``hits``, ``misses``, ``hit_ratio`` and ``size``.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+
+class NullCache(CacheBackend):
+    """Backend that stores nothing, used when caching is disabled."""
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    Thread-safe, size-bounded in-process cache with optional expiry.
+
+    Args:
+        maxsize (int): Maximum number of entries; the least recently
+            used one is evicted beyond that.
+        ttl (float, optional): Seconds an entry stays valid, ``None``
+            for no expiry.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_cache(maxsize, ttl=None):
+    """
+    Build the cache backend for the given settings.
+
+    Args:
+        maxsize (int): Entry limit, ``0`` disables caching.
+        ttl (float, optional): Entry lifetime in seconds.
+
+    Returns:
+        CacheBackend: An :class:`LRUCache` or a :class:`NullCache`.
+    """
+    if maxsize <= 0:
+        return NullCache()
+    return LRUCache(maxsize=maxsize, ttl=ttl)
@@ -3,18 +3,79 @@ from abc import ABC, abstractmethod
 
 class DataManagerInterface(ABC):
 
+    @abstractmethod
+    def get_generations(self, *scopes):
+        pass
+
+    @abstractmethod
+    def get_version(self, *scopes):
+        pass
+
     @abstractmethod
     def get_all_users(self):
         pass
 
+    @abstractmethod
+    def get_user(self, user_id):
+        pass
+
+    @abstractmethod
+    def get_user_summaries(self):
+        pass
+
+    @abstractmethod
+    def get_user_names(self):
+        pass
+
+    @abstractmethod
+    def get_movies(self, movie_ids):
+        pass
+
+    @abstractmethod
+    def get_movie_cards(self, movie_ids, user_id=None):
+        pass
+
     @abstractmethod
     def get_user_movies(self, user_id):
         pass
 
+    @abstractmethod
+    def get_favorite_movies(self, user_id, sort_by=None):
+        pass
+
+    @abstractmethod
+    def get_favorite_cards(self, user_id, sort_by=None):
+        pass
+
+    @abstractmethod
+    def get_movies_page(self, query=None, sort_by=None, after=None,
+                        before=None, page_size=None, user_id=None,
+                        exclude_favorites=False):
+        pass
+
+    @abstractmethod
+    def get_movie_cards_page(self, query=None, sort_by=None, after=None,
+                             before=None, page_size=None, user_id=None,
+                             exclude_favorites=False):
+        pass
+
+    @abstractmethod
+    def fuzzy_search(self, query, limit=20, user_id=None,
+                     exclude_favorites=False):
+        pass
+
+    @abstractmethod
+    def get_top_movies(self, window="week", limit=10):
+        pass
+
     @abstractmethod
     def add_user(self, name):
         pass
 
+    @abstractmethod
+    def deactivate_user(self, user_id):
+        pass
+
     @abstractmethod
     def add_movie(self, user_id, title, year, rating, poster):
         pass
@@ -26,3 +87,11 @@ class DataManagerInterface(ABC):
     @abstractmethod
     def delete_movie(self, movie_id):
         pass
+
+    @abstractmethod
+    def toggle_favorite(self, user_id, movie_id):
+        pass
+
+    @abstractmethod
+    def set_favorites(self, user_id, add=(), remove=()):
+        pass
@@ -0,0 +1,166 @@
+"""
+SQLite engine profiles.
+
+A profile bundles the connection pragmas and pool settings the app
+runs with and is picked through ``DATABASE_PROFILE`` in ``.env``:
+
+* ``default`` – SQLite's own defaults (rollback journal), fine for a
+  single development server.
+* ``production`` – WAL journal so readers never wait for the writer,
+  ``synchronous=NORMAL``, a busy timeout instead of immediate
+  "database is locked" errors, memory-mapped I/O, a larger page cache
+  and an explicitly sized pool for concurrent workers.
+
+Individual values can be overridden with ``SQLITE_<PRAGMA>`` (e.g.
+``SQLITE_BUSY_TIMEOUT=10000``) and ``DATABASE_POOL_SIZE`` /
+``DATABASE_MAX_OVERFLOW``. Setting ``DATABASE_READ_ENGINE=1`` adds a
+second, read-only engine that the data manager uses for its read
+methods, so page reads never queue behind the write pool. Reads made
+while writing always go through the session's own connection.
+"""
+import os
+
+from sqlalchemy import event
+
+READ_BIND = "read"
+
+PROFILES = {
+    "default": {
+        "pragmas": {},
+        "pool": {},
+    },
+    "production": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "mmap_size": 256 * 1024 * 1024,
+            # negative values are KiB, i.e. 64 MiB per connection
+            "cache_size": -64 * 1024,
+            "temp_store": "MEMORY",
+        },
+        "pool": {
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_timeout": 30,
+            "pool_pre_ping": False,
+        },
+    },
+}
+
+
+def load_profile(name=None):
+    """
+    Resolve an engine profile and apply ``.env`` overrides.
+
+    Args:
+        name (str, optional): Profile name, defaults to the
+            ``DATABASE_PROFILE`` environment variable or ``"default"``.
+
+    Returns:
+        dict: ``{"pragmas": {...}, "pool": {...}}`` for the profile.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    name = name or os.getenv("DATABASE_PROFILE", "default")
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown DATABASE_PROFILE {name!r}, "
+            f"expected one of {', '.join(PROFILES)}."
+        )
+    profile = PROFILES[name]
+    pragmas = dict(profile["pragmas"])
+    pool = dict(profile["pool"])
+
+    for pragma in PROFILES["production"]["pragmas"]:
+        value = os.getenv(f"SQLITE_{pragma.upper()}")
+        if value is not None:
+            pragmas[pragma] = value
+    for option in ("pool_size", "max_overflow"):
+        value = os.getenv(f"DATABASE_{option.upper()}")
+        if value is not None:
+            pool[option] = int(value)
+
+    return {"pragmas": pragmas, "pool": pool}
+
+
+def configure_database(app, default_path):
+    """
+    Fill in the Flask-SQLAlchemy settings for the selected profile.
+
+    Must run before ``db.init_app(app)`` and after the app's config is
+    complete: ``DATABASE_PROFILE``, ``DATABASE_READ_ENGINE`` and
+    ``DATABASE_READ_URL`` are read from ``app.config``, and engine
+    settings already there (e.g. a ``SQLALCHEMY_DATABASE_URI`` passed
+    to ``create_app``) are kept. The read engine opens
+    ``DATABASE_READ_URL`` or, by default, the main database.
+
+    Args:
+        app (flask.Flask): Application to configure.
+        default_path (str): SQLite file used when neither
+            ``SQLALCHEMY_DATABASE_URI`` nor ``DATABASE_URL`` is set.
+    """
+    config = app.config
+    profile = load_profile(config.get("DATABASE_PROFILE"))
+    uri = config.setdefault(
+        "SQLALCHEMY_DATABASE_URI",
+        os.getenv("DATABASE_URL", f"sqlite:///{default_path}"),
+    )
+    config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", dict(profile["pool"]))
+    config.setdefault("SQLITE_PRAGMAS", profile["pragmas"])
+
+    if config.get("DATABASE_READ_ENGINE"):
+        config.setdefault("SQLALCHEMY_BINDS", {}).setdefault(READ_BIND, {
+            "url": config.get("DATABASE_READ_URL") or uri,
+            **config["SQLALCHEMY_ENGINE_OPTIONS"],
+        })
+
+
+def _pragma_hook(pragmas, read_only):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = 1")
+        cursor.close()
+
+    return set_pragmas
+
+
+def install_pragmas(app, db):
+    """
+    Register connect-time hooks that apply the profile's pragmas.
+
+    Must run after ``db.init_app(app)`` and before the first query.
+
+    Args:
+        app (flask.Flask): Configured application.
+        db (flask_sqlalchemy.SQLAlchemy): The extension instance.
+    """
+    pragmas = app.config.get("SQLITE_PRAGMAS", {})
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            event.listen(
+                engine,
+                "connect",
+                _pragma_hook(pragmas, read_only=bind_key == READ_BIND),
+            )
+
+
+def read_bind_arguments(db):
+    """
+    Return ``bind_arguments`` that send a query to the read engine.
+
+    Args:
+        db (flask_sqlalchemy.SQLAlchemy): The extension instance.
+
+    Returns:
+        dict | None: Arguments for ``Session.execute``, or ``None``
+        when no read engine is configured.
+    """
+    engine = db.engines.get(READ_BIND)
+    return {"bind": engine} if engine is not None else None
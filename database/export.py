@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from .engine import READ_BIND
+from .models import db, Movie, Favorite
+
+FORMATS = ("csv", "ndjson")
+
+# kind -> (table, primary-key ordered columns)
+EXPORTS = {
+    "movies": (
+        Movie.__table__,
+        ("id", "title", "year", "rating", "poster", "user_id"),
+    ),
+    "favorites": (
+        Favorite.__table__,
+        ("user_id", "movie_id", "created"),
+    ),
+}
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def iter_rows(kind, user_id=None, batch_size=1000):
+    """
+    Stream the rows of an export from the database in batches.
+
+    Uses a Core ``SELECT`` with ``stream_results`` and fetches
+    ``batch_size`` rows at a time, so only one batch is ever held in
+    memory no matter how large the table is.
+
+    Args:
+        kind (str): ``"movies"`` or ``"favorites"``.
+        user_id (int, optional): Restrict to one user's rows.
+        batch_size (int): Rows per fetch.
+
+    Yields:
+        list[sqlalchemy.Row]: One batch of rows.
+    """
+    table, columns = EXPORTS[kind]
+    statement = db.select(*(table.c[name] for name in columns))
+    if user_id is not None:
+        statement = statement.where(table.c.user_id == user_id)
+    statement = statement.order_by(*table.primary_key.columns)
+
+    engine = db.engines.get(READ_BIND, db.engine)
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(statement)
+        yield from result.partitions()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def encode_csv(columns, batches):
+    """Yield the CSV header, then one text chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(columns, batches):
+    """Yield one text chunk of JSON objects, one per line, per batch."""
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+            for row in batch
+        )
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a byte stream into gzip format on the fly.
+
+    Args:
+        chunks (Iterable[bytes]): Uncompressed data.
+
+    Yields:
+        bytes: gzip-framed compressed data.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(kind, fmt, user_id=None, compress=False, batch_size=1000):
+    """
+    Build a lazily evaluated byte stream of an export.
+
+    Args:
+        kind (str): ``"movies"`` or ``"favorites"``.
+        fmt (str): ``"csv"`` or ``"ndjson"``.
+        user_id (int, optional): Restrict to one user's rows.
+        compress (bool): gzip the output.
+        batch_size (int): Rows fetched per database round trip.
+
+    Returns:
+        Iterator[bytes]: The encoded export; nothing is read from the
+        database until it is iterated.
+
+    Raises:
+        ValueError: If ``kind`` or ``fmt`` is unknown.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export {kind!r}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}.")
+
+    _, columns = EXPORTS[kind]
+    encode = encode_csv if fmt == "csv" else encode_ndjson
+    batches = iter_rows(kind, user_id=user_id, batch_size=batch_size)
+    chunks = (text.encode() for text in encode(columns, batches))
+    return gzip_chunks(chunks) if compress else chunks
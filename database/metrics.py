@@ -0,0 +1,437 @@
+"""
+Request, SQL and data manager instrumentation.
+
+:func:`install_metrics` wires up:
+
+* SQLAlchemy ``before/after_cursor_execute`` hooks that count every
+  statement, add up its time and log statements slower than
+  ``SLOW_QUERY_MS`` to the ``moviweb.sql.slow`` logger,
+* Flask request and template signals that turn the per-request totals
+  into a ``Server-Timing`` header (visible in the browser dev tools),
+* a wrapper around the data manager's public methods that counts calls,
+  errors and time per method,
+* a ``/metrics`` endpoint in the Prometheus text format.
+
+Everything is plain counters behind one lock, cheap enough to leave on
+in production. Metrics are per process; with several gunicorn workers
+each one reports its own numbers, which Prometheus sums per instance.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, before_render_template, request, template_rendered
+from sqlalchemy import event
+
+slow_query_log = logging.getLogger("moviweb.sql.slow")
+
+# seconds; covers cached fragments (~1ms) up to pathological pages
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """Totals collected while one request is being handled."""
+
+    __slots__ = (
+        "started", "queries", "sql_seconds", "template_seconds",
+        "template_depth", "template_started",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+
+    def server_timing(self):
+        """
+        Format the totals as a ``Server-Timing`` header value.
+
+        Returns:
+            str: ``db``, ``tpl`` and ``total`` durations in milliseconds.
+        """
+        total = time.perf_counter() - self.started
+        return (
+            f'db;dur={self.sql_seconds * 1000:.2f};'
+            f'desc="{self.queries} queries", '
+            f"tpl;dur={self.template_seconds * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def _labels(names, values):
+    return ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+
+
+def _escape(value):
+    return (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): ``# HELP`` text.
+        labelnames (tuple[str, ...]): Label names, in order.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Bucketed distribution with labels.
+
+    Args:
+        name (str): Metric name, without the ``_bucket``/``_sum``/
+            ``_count`` suffixes.
+        documentation (str): ``# HELP`` text.
+        labelnames (tuple[str, ...]): Label names, in order.
+        buckets (tuple[float, ...]): Sorted upper bounds.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {
+                labels: list(counts) for labels, counts in self._values.items()
+            }
+        for labels, counts in sorted(values.items()):
+            base = _labels(self.labelnames, labels)
+            prefix = f"{base}," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket = f'{prefix}le="{bound}"'
+                yield f"{self.name}_bucket", bucket, cumulative
+            cumulative += counts[len(self.buckets)]
+            yield f"{self.name}_bucket", f'{prefix}le="+Inf"', cumulative
+            yield f"{self.name}_sum", base, counts[-1]
+            yield f"{self.name}_count", base, cumulative
+
+
+class Registry:
+    """
+    Holds the metrics of this process and renders them for scraping.
+
+    Besides :class:`Counter` and :class:`Histogram` objects it accepts
+    collectors: callables returning ``(name, kind, help, value)`` tuples
+    read at scrape time, for numbers that already live elsewhere such as
+    the response cache's hit counters.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The scrape body.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                series = f"{name}{{{labels}}}" if labels else name
+                lines.append(f"{series} {value}")
+        for collect in self._collectors:
+            for name, kind, documentation, value in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """The metrics the app records, created on one :class:`Registry`."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        self.request_seconds = self.registry.histogram(
+            "moviweb_request_duration_seconds",
+            "Time spent handling a request.",
+            ("route", "method"),
+        )
+        self.requests = self.registry.counter(
+            "moviweb_requests_total",
+            "Requests handled, by response status.",
+            ("route", "method", "status"),
+        )
+        self.queries = self.registry.counter(
+            "moviweb_sql_queries_total",
+            "SQL statements executed.",
+        )
+        self.sql_seconds = self.registry.counter(
+            "moviweb_sql_seconds_total",
+            "Time spent executing SQL statements.",
+        )
+        self.slow_queries = self.registry.counter(
+            "moviweb_sql_slow_queries_total",
+            "SQL statements slower than SLOW_QUERY_MS.",
+        )
+        self.dm_calls = self.registry.counter(
+            "moviweb_datamanager_calls_total",
+            "Data manager method calls.",
+            ("method",),
+        )
+        self.dm_errors = self.registry.counter(
+            "moviweb_datamanager_errors_total",
+            "Data manager method calls that raised.",
+            ("method",),
+        )
+        self.dm_seconds = self.registry.counter(
+            "moviweb_datamanager_seconds_total",
+            "Time spent in data manager methods.",
+            ("method",),
+        )
+
+
+def instrument_engine(engine, metrics, slow_seconds):
+    """
+    Count and time every statement executed on ``engine``.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine to hook.
+        metrics (Metrics): Where to record totals.
+        slow_seconds (float | None): Log statements taking longer than
+            this; ``None`` disables the slow-query log.
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        metrics.queries.inc()
+        metrics.sql_seconds.inc(amount=elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+        if slow_seconds is not None and elapsed >= slow_seconds:
+            metrics.slow_queries.inc()
+            slow_query_log.warning(
+                "%.1fms %s", elapsed * 1000, " ".join(statement.split())
+            )
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def instrument_data_manager(data_manager, metrics):
+    """
+    Wrap the public methods of a data manager instance with counters.
+
+    Args:
+        data_manager: Instance to instrument in place.
+        metrics (Metrics): Where to record calls, errors and time.
+    """
+    for name in dir(type(data_manager)):
+        if name.startswith("_"):
+            continue
+        method = getattr(data_manager, name)
+        if callable(method):
+            setattr(data_manager, name, _timed(name, method, metrics))
+
+
+def _timed(name, method, metrics):
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def coroutine_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                metrics.dm_errors.inc(name)
+                raise
+            finally:
+                metrics.dm_calls.inc(name)
+                metrics.dm_seconds.inc(
+                    name, amount=time.perf_counter() - started
+                )
+
+        return coroutine_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            metrics.dm_errors.inc(name)
+            raise
+        finally:
+            metrics.dm_calls.inc(name)
+            metrics.dm_seconds.inc(
+                name, amount=time.perf_counter() - started
+            )
+
+    return wrapper
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is not None:
+        if not stats.template_depth:
+            stats.template_started = time.perf_counter()
+        stats.template_depth += 1
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is not None and stats.template_depth:
+        stats.template_depth -= 1
+        if not stats.template_depth:
+            stats.template_seconds += (
+                time.perf_counter() - stats.template_started
+            )
+
+
+def install_metrics(app, db, *data_managers, metrics=None):
+    """
+    Instrument the app, its engines and its data managers.
+
+    Controlled by the app's ``METRICS_ENABLED`` (default ``True``) and
+    ``SLOW_QUERY_MS`` (default ``250``, ``0`` disables the slow-query
+    log) settings. Must run after ``db.init_app(app)``.
+
+    Args:
+        app (flask.Flask): Application to instrument.
+        db (flask_sqlalchemy.SQLAlchemy): The extension instance.
+        *data_managers: Data managers whose public methods get
+            counters. The engine of one exposing ``sync_engine`` (see
+            :class:`AsyncSQLiteDataManager`) is hooked as well.
+        metrics (Metrics, optional): Recorder to use, a new one by
+            default.
+
+    Returns:
+        Metrics | None: The recorder, or ``None`` when disabled.
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return None
+
+    metrics = metrics or Metrics()
+    slow_ms = float(app.config.get("SLOW_QUERY_MS", 250))
+    slow_seconds = slow_ms / 1000 if slow_ms > 0 else None
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine, metrics, slow_seconds)
+    for data_manager in data_managers:
+        instrument_data_manager(data_manager, metrics)
+        engine = getattr(data_manager, "sync_engine", None)
+        if engine is not None:
+            instrument_engine(engine, metrics, slow_seconds)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_timer():
+        request.environ["moviweb.stats"] = _current.set(RequestStats())
+
+    @app.after_request
+    def record_request(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        response.headers["Server-Timing"] = stats.server_timing()
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        metrics.request_seconds.observe(
+            time.perf_counter() - stats.started, route, request.method
+        )
+        metrics.requests.inc(route, request.method, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def stop_request_timer(exc):
+        token = request.environ.pop("moviweb.stats", None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        """
+        Expose this worker's metrics for Prometheus to scrape.
+
+        Returns:
+            flask.Response: The text exposition format.
+        """
+        return Response(metrics.registry.render(), content_type=CONTENT_TYPE)
+
+    return metrics
@@ -0,0 +1,126 @@
+"""
+Numbered schema migrations for existing databases.
+
+``db.create_all()`` only creates missing tables, so anything that has to
+change a deployed database (indexes, virtual tables, new columns) is
+added here as the next numbered step. The applied version is stored in
+SQLite's ``PRAGMA user_version``. Every step must be idempotent, so a
+step that was interrupted halfway can simply be run again.
+"""
+from sqlalchemy import text
+
+from .models import DataVersion, MoviePopularity, MovieTrigram
+from .popularity import rebuild_popularity
+from .search import create_search_index, rebuild_search_index
+from .trigrams import rebuild_trigram_index
+
+
+def _search_index(connection):
+    rebuild_search_index(connection)
+
+
+def _hot_path_indexes(connection):
+    statements = (
+        # keyset pagination on every sort mode, id as tiebreaker
+        "CREATE INDEX IF NOT EXISTS ix_movie_title_id ON movie (title, id)",
+        "CREATE INDEX IF NOT EXISTS ix_movie_year_id ON movie (year, id)",
+        "CREATE INDEX IF NOT EXISTS ix_movie_rating_id ON movie (rating, id)",
+        # per-user movie lists and counts
+        "CREATE INDEX IF NOT EXISTS ix_movie_user_id ON movie (user_id)",
+        # favourites of a movie; (user_id, movie_id) is already the PK
+        "CREATE INDEX IF NOT EXISTS ix_favorite_movie_id "
+        "ON favorite (movie_id)",
+        # active users only, the soft-deleted ones are never listed
+        'CREATE INDEX IF NOT EXISTS ix_user_active ON "user" (id) '
+        "WHERE is_active = 1",
+    )
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def _analyze(connection):
+    connection.execute(text("ANALYZE"))
+
+
+def _data_version(connection):
+    DataVersion.__table__.create(connection, checkfirst=True)
+
+
+def _pausable_search_trigger(connection):
+    # recreate the insert trigger with its search_index_paused guard
+    connection.execute(text("DROP TRIGGER IF EXISTS movie_fts_ai"))
+    create_search_index(connection)
+
+
+def _movie_updated_at(connection):
+    columns = connection.execute(text("PRAGMA table_info(movie)")).all()
+    if "updated_at" not in {column[1] for column in columns}:
+        connection.execute(
+            text("ALTER TABLE movie ADD COLUMN updated_at DATETIME")
+        )
+
+
+def _movie_popularity(connection):
+    MoviePopularity.__table__.create(connection, checkfirst=True)
+    rebuild_popularity(connection)
+
+
+def _trigram_index(connection):
+    MovieTrigram.__table__.create(connection, checkfirst=True)
+    rebuild_trigram_index(connection)
+
+
+# (version, description, step) in the order they are applied
+MIGRATIONS = (
+    (1, "full-text title index", _search_index),
+    (2, "hot-path indexes", _hot_path_indexes),
+    (3, "planner statistics", _analyze),
+    (4, "cache generation counters", _data_version),
+    (5, "bulk-import friendly search trigger", _pausable_search_trigger),
+    (6, "movie modification time", _movie_updated_at),
+    (7, "materialised favourite counts", _movie_popularity),
+    (8, "trigram index for fuzzy title search", _trigram_index),
+)
+
+
+def get_schema_version(connection):
+    """
+    Return the migration version the database is at.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Open connection.
+
+    Returns:
+        int: ``0`` for a database no migration has touched.
+    """
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def upgrade(engine, log=print):
+    """
+    Apply every migration newer than the database's schema version.
+
+    Each migration runs in its own transaction together with the
+    version bump, so a failure leaves the database at the last
+    completed step.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine of the database.
+        log (callable): Receives one progress line per applied step.
+
+    Returns:
+        int: The schema version after the upgrade.
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            step(connection)
+            # PRAGMA arguments cannot be bound parameters
+            connection.execute(text(f"PRAGMA user_version = {int(number)}"))
+        log(f"Applied migration {number}: {description}")
+        version = number
+    return version
@@ -1,5 +1,7 @@
 from . import db  # this comes from database/__init__.py
 from datetime import datetime
+from sqlalchemy import false
+from sqlalchemy.orm import query_expression
 
 
 class Movie(db.Model):
@@ -14,7 +16,20 @@ class Movie(db.Model):
         poster (str): Poster image URL.
         favorite (bool): Global favourite flag (legacy).
         user_id (int): Foreign key to the owning :class:`User`.
+        updated_at (datetime): Time of the last insert or update; part
+            of the rendered card's cache key. ``None`` for rows that
+            predate the column and were never edited since.
+        is_favorite (bool): Whether the movie is a favourite of the user
+            a query was made for; only populated by data manager methods
+            that take a ``user_id``, ``False`` otherwise.
     """
+    __table_args__ = (
+        db.Index("ix_movie_title_id", "title", "id"),
+        db.Index("ix_movie_year_id", "year", "id"),
+        db.Index("ix_movie_rating_id", "rating", "id"),
+        db.Index("ix_movie_user_id", "user_id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     year = db.Column(db.Integer, nullable=False)
@@ -23,6 +38,11 @@ class Movie(db.Model):
     favorite = db.Column(db.Boolean, default=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    is_favorite = query_expression(default_expr=false())
 
     def __repr__(self):
         """Return a concise string representation for debugging."""
@@ -39,6 +59,12 @@ class User(db.Model):
         is_active (bool): Soft-delete flag.
         movies (list[Movie]): Relationship to the user's movies.
     """
+    __table_args__ = (
+        db.Index(
+            "ix_user_active", "id", sqlite_where=db.text("is_active = 1")
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     is_active = db.Column(db.Boolean, default=True)
@@ -59,6 +85,10 @@ class Favorite(db.Model):
         created (datetime): Timestamp when the movie was marked as favourite.
     """
     __tablename__ = "favorite"
+    __table_args__ = (
+        db.Index("ix_favorite_movie_id", "movie_id"),
+    )
+
     user_id = db.Column(
         db.Integer, db.ForeignKey("user.id"),  primary_key=True
     )
@@ -70,9 +100,83 @@ class Favorite(db.Model):
     )
 
 
+class MoviePopularity(db.Model):
+    """
+    Materialised favourite count of a movie, all time or for one week.
+
+    Kept up to date by the data managers in the same transaction as the
+    favourite it counts, so the leaderboards are read off the rank index
+    instead of aggregating the favourite table; ``manage.py
+    rebuild-popularity`` recomputes it if it ever drifts.
+
+    Attributes:
+        week (int): Part of the composite PK; the week the favourites
+            were added in (see :func:`database.popularity.week_of`) or
+            ``-1`` for the all-time count.
+        movie_id (int): FK → :class:`Movie.id`, part of the composite PK.
+        favorites (int): Favourites of the movie counted in ``week``.
+    """
+    __tablename__ = "movie_popularity"
+    __table_args__ = (
+        db.Index(
+            "ix_movie_popularity_rank", "week", "favorites", "movie_id"
+        ),
+    )
+
+    week = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(
+        db.Integer, db.ForeignKey("movie.id"), primary_key=True
+    )
+    favorites = db.Column(db.Integer, nullable=False, default=0)
+
+
+class MovieTrigram(db.Model):
+    """
+    Posting of the trigram index behind fuzzy title search.
+
+    One row per distinct trigram of a title, see
+    :func:`database.trigrams.trigrams`. The data managers write the
+    rows together with the movie; ``manage.py rebuild-trigram-index``
+    recomputes them from the movie table.
+
+    Attributes:
+        trigram (str): Three characters of a normalised title word,
+            part of the composite PK.
+        movie_id (int): FK → :class:`Movie.id`, part of the composite PK.
+    """
+    __tablename__ = "movie_trigram"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    trigram = db.Column(db.String(3), primary_key=True)
+    movie_id = db.Column(
+        db.Integer, db.ForeignKey("movie.id"), primary_key=True
+    )
+
+
 User.favorites = db.relationship(
     "Movie",
     secondary="favorite",
     backref="favorited_by",
     lazy="dynamic",
 )
+
+
+class DataVersion(db.Model):
+    """
+    Generation counter for one slice of the data, used to invalidate
+    caches across worker processes.
+
+    Every mutating data manager method bumps the scopes it affects in
+    the same transaction as the change itself.
+
+    Attributes:
+        scope (str): Primary key, ``"catalogue"``, ``"users"``,
+            ``"favorites"`` for all favourites or ``"user:<id>"`` for
+            one user's favourites.
+        generation (int): Incremented on every change to the scope.
+        updated (datetime): Time of the last change.
+    """
+    __tablename__ = "data_version"
+    scope = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,205 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from sqlalchemy import tuple_
+
+from .models import Movie
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 200
+
+# sort mode -> (column, descending). ``id`` is always appended as the
+# tiebreaker in the same direction, so the ordering is total and a
+# ``(value, id)`` pair identifies a unique position in it.
+SORT_COLUMNS = {
+    "title": (Movie.title, False),
+    "year": (Movie.year, True),
+    "rating": (Movie.rating, True),
+}
+
+# Ranks full-text matches by their bm25 score (lower is better). The
+# column is per query, so callers pass it in as ``score``.
+RELEVANCE = "relevance"
+
+# sort mode -> type of the value in front of the id in a keyset position
+KEY_TYPES = {
+    "title": str,
+    "year": int,
+    "rating": (int, float),
+    RELEVANCE: (int, float),
+}
+# range of SQLite's integers; larger Python ints cannot be bound
+_MIN_INT, _MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+Page = namedtuple("Page", ["items", "next_cursor", "prev_cursor"])
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor token that is not a keyset position."""
+
+
+def normalize_sort(sort_by, searching=False):
+    """
+    Map a user-supplied sort mode to a known one.
+
+    Args:
+        sort_by (str | None): Requested sort mode.
+        searching (bool): Whether a full-text search is active, which
+            makes ``"relevance"`` available.
+
+    Returns:
+        str | None: ``sort_by`` if it is a known mode, else ``None``
+        (plain ``id`` order).
+    """
+    if sort_by == RELEVANCE:
+        return RELEVANCE if searching else None
+    return sort_by if sort_by in SORT_COLUMNS else None
+
+
+def clamp_page_size(page_size):
+    """
+    Keep a requested page size within ``1..MAX_PAGE_SIZE``.
+
+    Args:
+        page_size (int | None): Requested page size.
+
+    Returns:
+        int: A usable page size.
+    """
+    if not page_size or page_size < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def sort_key(sort_by, movie, score=None):
+    """
+    Return the keyset position of ``movie`` under ``sort_by``.
+
+    Args:
+        sort_by (str | None): Normalised sort mode.
+        movie (Movie): Row to take the key from.
+        score (float, optional): Search score of the row, required for
+            ``"relevance"``.
+
+    Returns:
+        list: ``[value, id]`` or ``[id]`` for the default ordering.
+    """
+    if sort_by is None:
+        return [movie.id]
+    if sort_by == RELEVANCE:
+        return [score, movie.id]
+    column, _ = SORT_COLUMNS[sort_by]
+    return [getattr(movie, column.key), movie.id]
+
+
+def encode_cursor(sort_by, key):
+    """
+    Serialise a keyset position into an opaque URL-safe token.
+
+    Args:
+        sort_by (str | None): Sort mode the key belongs to.
+        key (list): Position as returned by :func:`sort_key`.
+
+    Returns:
+        str: The cursor token.
+    """
+    raw = json.dumps([sort_by, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _is_value(value, types):
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    return not isinstance(value, int) or _MIN_INT <= value <= _MAX_INT
+
+
+def decode_cursor(token, sort_by):
+    """
+    Parse a cursor token produced by :func:`encode_cursor`.
+
+    Tokens issued for a different sort mode are ignored so a stale link
+    simply restarts at the first page.
+
+    Args:
+        token (str | None): Cursor from the query string.
+        sort_by (str | None): Sort mode of the current request.
+
+    Returns:
+        list | None: The decoded key, or ``None``.
+
+    Raises:
+        InvalidCursor: If the token is malformed, or its key does not
+            have the number and types of values of ``sort_by``'s
+            position, e.g. after being edited by hand.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidCursor(f"Malformed cursor {token!r}.") from e
+    if cursor_sort != sort_by:
+        return None
+    types = [int] if sort_by is None else [KEY_TYPES[sort_by], int]
+    if not (
+        isinstance(key, list) and len(key) == len(types)
+        and all(map(_is_value, key, types))
+    ):
+        raise InvalidCursor(f"Cursor {token!r} is not a {sort_by} position.")
+    return key
+
+
+def keyset_columns(sort_by, score=None):
+    """
+    Return the ordering columns and direction for a sort mode.
+
+    Args:
+        sort_by (str | None): Normalised sort mode.
+        score (sqlalchemy.ColumnElement, optional): Search score column,
+            required for ``"relevance"``.
+
+    Returns:
+        tuple[list, bool]: Columns (value then ``id``) and whether the
+        natural order is descending.
+    """
+    if sort_by is None:
+        return [Movie.id], False
+    if sort_by == RELEVANCE:
+        return [score, Movie.id], False
+    column, descending = SORT_COLUMNS[sort_by]
+    return [column, Movie.id], descending
+
+
+def apply_keyset(statement, sort_by, key, backwards=False, score=None):
+    """
+    Restrict and order ``statement`` to the rows after (or before) ``key``.
+
+    Args:
+        statement (sqlalchemy.Select): Base catalogue query.
+        sort_by (str | None): Normalised sort mode.
+        key (list | None): Position to seek from; ``None`` starts at the
+            first (or, when ``backwards``, the last) row.
+        backwards (bool): Walk the ordering in reverse, used for the
+            previous page. Callers must reverse the fetched rows.
+        score (sqlalchemy.ColumnElement, optional): Search score column,
+            required for ``"relevance"``.
+
+    Returns:
+        sqlalchemy.Select: The seek query.
+    """
+    columns, descending = keyset_columns(sort_by, score)
+    reverse = descending != backwards
+
+    if key is not None:
+        position = tuple_(*columns)
+        bound = tuple_(*key)
+        statement = statement.where(
+            position < bound if reverse else position > bound
+        )
+
+    return statement.order_by(
+        *[c.desc() if reverse else c.asc() for c in columns]
+    )
@@ -0,0 +1,96 @@
+"""
+Most favourited movies, this week and of all time.
+
+Favourite counts are materialised in :class:`MoviePopularity`: one row
+per movie for the all-time count (``week = ALL_TIME``) and one per
+movie and week for the favourites added that week. The data managers
+add or subtract one in the transaction that toggles a favourite and
+drop a movie's rows when it is deleted, so a leaderboard is the first
+rows of ``ix_movie_popularity_rank`` for one bucket, whatever the size
+of the favourite table.
+
+Weeks start on Monday (UTC) and are numbered from the first Monday of
+1970. A removed favourite is subtracted from the week it was added in,
+so "this week" counts the favourites added this week that still exist.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+ALL_TIME = -1
+# leaderboard windows accepted by get_top_movies
+WINDOWS = ("week", "all")
+
+_EPOCH = date(1970, 1, 5)
+
+# Same numbering as week_of(); whole days since _EPOCH, so it is exact
+_WEEK_SQL = (
+    "CAST(julianday(date(created)) - julianday('1970-01-05') AS INTEGER) / 7"
+)
+
+
+def week_of(moment):
+    """
+    Return the number of the week ``moment`` falls in.
+
+    Args:
+        moment (datetime): A UTC timestamp, e.g. ``Favorite.created``.
+
+    Returns:
+        int: Weeks since Monday 1970-01-05.
+    """
+    return (moment.date() - _EPOCH).days // 7
+
+
+def bucket(window, now=None):
+    """
+    Return the ``MoviePopularity.week`` a leaderboard window reads.
+
+    Args:
+        window (str): ``"week"`` for the current week, ``"all"`` for all
+            time.
+        now (datetime, optional): Current UTC time.
+
+    Returns:
+        int: The bucket.
+
+    Raises:
+        ValueError: If ``window`` is not one of :data:`WINDOWS`.
+    """
+    if window == "all":
+        return ALL_TIME
+    if window == "week":
+        return week_of(now or datetime.utcnow())
+    raise ValueError(f"Unknown leaderboard window: {window!r}")
+
+
+def rebuild_popularity(connection, movies_only=True):
+    """
+    Recompute every count from the favourite table.
+
+    Args:
+        connection: SQLAlchemy connection or session to execute on.
+        movies_only (bool): Skip favourites of movies that are not in
+            the movie table. ``False`` counts them all, for a shard
+            whose favourites may point at movies of other shards (see
+            :mod:`database.sharding`).
+
+    Returns:
+        int: Favourites counted.
+    """
+    join = "JOIN movie m ON m.id = f.movie_id " if movies_only else ""
+    connection.execute(text("DELETE FROM movie_popularity"))
+    connection.execute(text(
+        "INSERT INTO movie_popularity (week, movie_id, favorites) "
+        f"SELECT {ALL_TIME}, f.movie_id, count(*) FROM favorite f "
+        f"{join}GROUP BY f.movie_id"
+    ))
+    connection.execute(text(
+        "INSERT INTO movie_popularity (week, movie_id, favorites) "
+        f"SELECT {_WEEK_SQL} AS week, f.movie_id, count(*) FROM favorite f "
+        f"{join}WHERE f.created IS NOT NULL GROUP BY week, f.movie_id"
+    ))
+    return connection.execute(text(
+        f"SELECT coalesce(sum(favorites), 0) FROM movie_popularity "
+        f"WHERE week = {ALL_TIME}"
+    )).scalar()
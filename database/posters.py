@@ -0,0 +1,504 @@
+"""
+Local poster cache with thumbnails.
+
+Posters are downloaded once, in the background, when a movie is added
+or its poster changes, and stored content-addressed on disk::
+
+    <directory>/urls/ab/<sha256 of the url>     -> "<digest> <mimetype>"
+    <directory>/blobs/cd/<digest>               original image
+    <directory>/blobs/cd/<digest>-320.jpg       thumbnail per width
+
+The digest is the SHA-256 of the image bytes, so identical posters are
+stored once and double as ETags. Thumbnails need Pillow (optional);
+without it the original is served for every width. The directory is
+kept under ``max_bytes`` by evicting the least recently served images.
+
+The download itself goes through a ``fetcher`` callable, so tests and
+offline setups can point it at a local stand-in server or skip the
+network entirely. Poster URLs are user input: :class:`HTTPFetcher`
+only connects to public addresses, for redirects too, so a poster
+cannot make the server request its own network, and only raster
+images whose bytes match their type are stored, as the app serves them
+from its own origin (an SVG could carry scripts).
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from . import signals
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (320, 640)
+MAX_POSTER_BYTES = 5 * 1024 * 1024
+# failed downloads are not retried before this many seconds
+RETRY_AFTER = 3600
+# a served image's mtime is refreshed (for LRU eviction) at most this often
+TOUCH_INTERVAL = 86400
+# eviction trims the cache to this fraction of max_bytes
+EVICT_TO = 0.9
+
+CachedPoster = namedtuple("CachedPoster", "path etag mimetype")
+
+# the only image types stored and served, by their leading bytes
+RASTER_SIGNATURES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/gif": (b"GIF87a", b"GIF89a"),
+    "image/webp": (b"RIFF",),
+}
+
+
+class PosterFetchError(Exception):
+    """Raised when a poster cannot be downloaded or is not an image."""
+
+
+def url_key(url):
+    """Return the stable, filesystem-safe key of a poster URL."""
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def poster_version(url):
+    """Short token that changes whenever the poster URL does."""
+    return url_key(url)[:12]
+
+
+def sniff_image(data):
+    """
+    Identify a raster image by its leading bytes.
+
+    Args:
+        data (bytes): The image.
+
+    Returns:
+        str | None: Its mimetype, one of :data:`RASTER_SIGNATURES`, or
+        ``None`` for anything else, SVG included.
+    """
+    for mimetype, signatures in RASTER_SIGNATURES.items():
+        if data.startswith(signatures):
+            if mimetype == "image/webp" and data[8:12] != b"WEBP":
+                continue
+            return mimetype
+    return None
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                    source_address=None):
+    """
+    ``socket.create_connection`` refusing hosts that are not public.
+
+    The host is resolved once and the connection goes to a checked
+    address, so a DNS answer changing in between cannot slip through.
+
+    Raises:
+        PosterFetchError: If any address of the host is private,
+            loopback, link-local, reserved or otherwise not global.
+    """
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise PosterFetchError(f"Cannot resolve {host}: {e}") from e
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise PosterFetchError(f"{host} is not a public address ({ip}).")
+    family, kind, proto, _, sockaddr = infos[0]
+    sock = socket.socket(family, kind, proto)
+    try:
+        if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(timeout)
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(sockaddr)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    # certificates are still checked against the host name
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req)
+
+
+class HTTPFetcher:
+    """
+    Download posters over HTTP(S) with ``urllib``.
+
+    Only public addresses are connected to, including every redirect
+    target; environment proxies are not used, as they would connect on
+    the fetcher's behalf.
+
+    Args:
+        timeout (float): Seconds per request.
+        max_bytes (int): Larger responses are rejected.
+        public_only (bool): ``False`` allows private and loopback hosts,
+            e.g. a local stand-in server.
+    """
+
+    def __init__(self, timeout=10, max_bytes=MAX_POSTER_BYTES,
+                 public_only=True):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        if public_only:
+            self._opener = urllib.request.build_opener(
+                urllib.request.ProxyHandler({}),
+                _PublicHTTPHandler,
+                _PublicHTTPSHandler,
+            )
+        else:
+            self._opener = urllib.request.build_opener()
+
+    def __call__(self, url):
+        """
+        Fetch one image.
+
+        Args:
+            url (str): ``http`` or ``https`` URL.
+
+        Returns:
+            tuple[bytes, str]: The body and its mimetype, as sniffed
+            from the bytes.
+
+        Raises:
+            PosterFetchError: On other schemes, hosts that are not
+                public, network errors, responses that are not JPEG,
+                PNG, GIF or WebP images, or oversized bodies.
+        """
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise PosterFetchError(f"Unsupported poster URL {url!r}.")
+        request = urllib.request.Request(
+            url, headers={"User-Agent": "MoviWeb poster cache"}
+        )
+        try:
+            with self._opener.open(request, timeout=self.timeout) as r:
+                mimetype = r.headers.get_content_type()
+                if mimetype not in RASTER_SIGNATURES:
+                    raise PosterFetchError(
+                        f"{url} is {mimetype}, not a raster image."
+                    )
+                data = r.read(self.max_bytes + 1)
+        except (OSError, ValueError) as e:
+            raise PosterFetchError(f"Could not fetch {url}: {e}") from e
+        if len(data) > self.max_bytes:
+            raise PosterFetchError(f"{url} is larger than {self.max_bytes}.")
+        sniffed = sniff_image(data)
+        if sniffed is None:
+            raise PosterFetchError(f"{url} is not a {mimetype} image.")
+        return data, sniffed
+
+
+class PosterCache:
+    """
+    Content-addressed on-disk poster store.
+
+    Args:
+        directory (str): Root of the cache; created if missing.
+        max_bytes (int): Size budget for stored images.
+        fetcher (callable, optional): ``fetcher(url) -> (bytes,
+            mimetype)``, raising :class:`PosterFetchError`; defaults to
+            :class:`HTTPFetcher`.
+        widths (tuple[int, ...]): Thumbnail widths to generate.
+        workers (int): Background download threads.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024,
+                 fetcher=None, widths=THUMBNAIL_WIDTHS, workers=2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher or HTTPFetcher()
+        self.widths = tuple(sorted(widths))
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="posters"
+        )
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._failed = {}
+        self._size = None
+        for name in ("urls", "blobs"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    # -- paths -----------------------------------------------------------
+
+    def _url_path(self, url):
+        key = url_key(url)
+        return os.path.join(self.directory, "urls", key[:2], key)
+
+    def _blob_path(self, digest, width=None):
+        name = f"{digest}-{width}.jpg" if width else digest
+        return os.path.join(self.directory, "blobs", digest[:2], name)
+
+    def _write(self, path, data):
+        # atomic, so readers and other workers never see partial files
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    # -- lookups ---------------------------------------------------------
+
+    def snap_width(self, width):
+        """
+        Map a requested width onto a generated thumbnail width.
+
+        Args:
+            width (int | None): Requested width in pixels.
+
+        Returns:
+            int | None: The smallest configured width not below
+            ``width`` (the largest if none is), or ``None`` for the
+            original.
+        """
+        if not width or not self.widths:
+            return None
+        for candidate in self.widths:
+            if candidate >= width:
+                return candidate
+        return self.widths[-1]
+
+    def lookup(self, url, width=None):
+        """
+        Find the cached image of a poster without touching the network.
+
+        Args:
+            url (str): Poster URL.
+            width (int, optional): Desired thumbnail width.
+
+        Returns:
+            CachedPoster | None: The thumbnail, or the original when no
+            thumbnail of that width exists; ``None`` if not cached or
+            not a raster image.
+        """
+        try:
+            with open(self._url_path(url)) as f:
+                digest, mimetype = f.read().split()
+        except (OSError, ValueError):
+            return None
+        if mimetype not in RASTER_SIGNATURES:
+            # stored before only raster images were accepted
+            return None
+
+        width = self.snap_width(width)
+        if width:
+            path = self._blob_path(digest, width)
+            if os.path.exists(path):
+                self._touch(path)
+                return CachedPoster(path, f"{digest}-{width}", "image/jpeg")
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            # evicted; the next prefetch downloads it again
+            return None
+        self._touch(path)
+        return CachedPoster(path, digest, mimetype)
+
+    def _touch(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            pass
+
+    # -- downloads -------------------------------------------------------
+
+    def fetch(self, url):
+        """
+        Download a poster, store it and generate its thumbnails.
+
+        Args:
+            url (str): Poster URL.
+
+        Returns:
+            CachedPoster: The stored original.
+
+        Raises:
+            PosterFetchError: If the download fails or is not a raster
+                image.
+        """
+        data, _ = self.fetcher(url)
+        mimetype = sniff_image(data)
+        if mimetype is None:
+            raise PosterFetchError(f"{url} is not a raster image.")
+        digest = hashlib.sha256(data).hexdigest()
+        written = 0
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+            written += len(data)
+            for width, thumbnail in self._thumbnails(data):
+                self._write(self._blob_path(digest, width), thumbnail)
+                written += len(thumbnail)
+        self._write(self._url_path(url), f"{digest} {mimetype}".encode())
+        self._account(written)
+        return CachedPoster(path, digest, mimetype)
+
+    def _thumbnails(self, data):
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except (OSError, ValueError) as e:
+            log.warning("Cannot read poster image: %s", e)
+            return
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for width in self.widths:
+            if width >= image.width:
+                continue
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, "JPEG", quality=82, optimize=True)
+            yield width, buffer.getvalue()
+
+    def prefetch(self, url):
+        """
+        Download a poster in the background unless cached or pending.
+
+        Failed URLs are not retried for :data:`RETRY_AFTER` seconds.
+
+        Args:
+            url (str): Poster URL.
+
+        Returns:
+            concurrent.futures.Future | None: The download, or ``None``
+            when nothing had to be done.
+        """
+        if not url or self.lookup(url) is not None:
+            return None
+        with self._lock:
+            if url in self._pending:
+                return self._pending[url]
+            failed_at = self._failed.get(url)
+            if failed_at and time.monotonic() - failed_at < RETRY_AFTER:
+                return None
+            future = self._executor.submit(self._prefetch, url)
+            self._pending[url] = future
+            return future
+
+    def _prefetch(self, url):
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            log.warning("Poster prefetch failed: %s", e)
+            with self._lock:
+                self._failed[url] = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    # -- eviction --------------------------------------------------------
+
+    def _blob_files(self):
+        root = os.path.join(self.directory, "blobs")
+        for shard in os.scandir(root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.startswith(".tmp"):
+                    yield entry
+
+    def size(self):
+        """Return the bytes currently stored in images."""
+        return sum(entry.stat().st_size for entry in self._blob_files())
+
+    def _account(self, written):
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += written
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently served images until the cache is
+        below :data:`EVICT_TO` of ``max_bytes``.
+
+        URL entries pointing at a deleted image become cache misses.
+
+        Returns:
+            int: Bytes freed.
+        """
+        files = [(entry.stat(), entry.path) for entry in self._blob_files()]
+        files.sort(key=lambda item: item[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in files)
+        target = self.max_bytes * EVICT_TO
+        freed = 0
+        for stat, path in files:
+            if size - freed <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            freed += stat.st_size
+        with self._lock:
+            self._size = size - freed
+        return freed
+
+    # -- wiring ----------------------------------------------------------
+
+    def connect_signals(self, sender):
+        """
+        Prefetch the poster of every movie ``sender`` adds or updates.
+
+        The receivers are held weakly and only see ``sender``'s
+        signals, so other data managers' writes never reach this cache.
+
+        Args:
+            sender: The data manager whose writes are followed.
+        """
+        signals.movie_added.connect(self._on_movie_changed, sender=sender)
+        signals.movie_updated.connect(self._on_movie_changed, sender=sender)
+
+    def disconnect_signals(self):
+        """Stop following the data manager's writes."""
+        signals.movie_added.disconnect(self._on_movie_changed)
+        signals.movie_updated.disconnect(self._on_movie_changed)
+
+    def _on_movie_changed(self, sender, movie, **extra):
+        self.prefetch(movie.poster)
+
+    def shutdown(self, wait=True):
+        """Stop the download threads."""
+        self._executor.shutdown(wait=wait)
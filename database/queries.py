@@ -0,0 +1,485 @@
+"""
+Statements shared by the synchronous and asynchronous data managers.
+
+Each function only builds a ``select()``/``insert()``; executing it is
+left to the caller's session, so both data managers issue exactly the
+same SQL.
+"""
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import delete, exists, false, func, literal, select, true
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import with_expression
+
+from .models import DataVersion, Favorite, Movie, MoviePopularity, User
+from .pagination import (
+    RELEVANCE,
+    Page,
+    apply_keyset,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+    normalize_sort,
+    sort_key,
+)
+from .popularity import ALL_TIME, bucket, week_of
+from .records import MovieCard, Version
+from .search import filter_by_title, search_matches
+
+# A page query and what is needed to turn its rows into a Page.
+PageQuery = namedtuple(
+    "PageQuery", "statement sort_by page_size after_key backwards cards"
+)
+
+
+def bump_generations(scopes, now=None, step=1):
+    """
+    Build the upserts that increment the generation of ``scopes``.
+
+    Args:
+        scopes (Iterable[str]): Scopes affected by a pending change.
+        now (datetime, optional): Timestamp to record.
+        step (int): Increment.
+
+    Returns:
+        list[sqlalchemy.Insert]: One ``INSERT ... ON CONFLICT`` each.
+    """
+    now = now or datetime.utcnow()
+    return [
+        insert(DataVersion)
+        .values(scope=scope, generation=step, updated=now)
+        .on_conflict_do_update(
+            index_elements=[DataVersion.scope],
+            set_={"generation": DataVersion.generation + step,
+                  "updated": now},
+        )
+        for scope in scopes
+    ]
+
+
+def generations(scopes):
+    """Select ``(scope, generation)`` of the given scopes."""
+    return (
+        select(DataVersion.scope, DataVersion.generation)
+        .where(DataVersion.scope.in_(scopes))
+    )
+
+
+def versions(scopes):
+    """Select ``(scope, generation, updated)`` of the given scopes."""
+    return (
+        select(DataVersion.scope, DataVersion.generation, DataVersion.updated)
+        .where(DataVersion.scope.in_(scopes))
+    )
+
+
+def to_version(scopes, rows):
+    """
+    Combine :func:`versions` rows into a :class:`Version`.
+
+    Args:
+        scopes (tuple[str, ...]): The scopes that were queried.
+        rows (Iterable[tuple]): ``(scope, generation, updated)`` rows.
+
+    Returns:
+        Version: Generations in the order of ``scopes`` (``0`` for a
+        scope never written) and the latest ``updated`` among them.
+    """
+    found = {scope: (generation, updated) for scope, generation, updated
+             in rows}
+    generations = tuple(found.get(scope, (0, None))[0] for scope in scopes)
+    stamps = [updated for _, updated in found.values() if updated]
+    return Version(generations, max(stamps) if stamps else None)
+
+
+def is_favorite_of(user_id):
+    """
+    Build the ``is_favorite`` flag of ``user_id`` for a movie query.
+
+    A correlated EXISTS probe on the favorite primary key, so flagging
+    costs one index lookup per row.
+    """
+    return exists().where(
+        Favorite.user_id == user_id, Favorite.movie_id == Movie.id
+    )
+
+
+def id_in(movie_ids, column=Movie.id):
+    """
+    Build ``column IN (...)`` with the ids bound as one JSON array.
+
+    A single parameter however many ids there are, so the statement
+    stays cacheable and never hits SQLite's variable limit.
+    """
+    ids = func.json_each(json.dumps(sorted(movie_ids)))
+    return column.in_(select(ids.table_valued("value").c.value))
+
+
+def favorite_flag(user_id=None, favorite_ids=None):
+    """
+    Build the ``is_favorite`` flag for a movie query, if there is one.
+
+    Args:
+        user_id (int, optional): Look the flag up in this user's
+            favourites, see :func:`is_favorite_of`.
+        favorite_ids (Iterable[int], optional): Flag these movies
+            instead, for a movie table whose favourites are kept
+            elsewhere (see :mod:`database.sharding`). Wins over
+            ``user_id``.
+
+    Returns:
+        sqlalchemy.ColumnElement | None: ``None`` without either.
+    """
+    if favorite_ids is not None:
+        return id_in(favorite_ids)
+    return is_favorite_of(user_id) if user_id is not None else None
+
+
+def card_columns(is_favorite):
+    """Return the :class:`MovieCard` columns with the given flag."""
+    return (
+        Movie.id, Movie.title, Movie.year, Movie.rating, Movie.poster,
+        Movie.updated_at, is_favorite.label("is_favorite"),
+    )
+
+
+def movies_by_id(movie_ids, user_id=None, cards=False, favorite_ids=None):
+    """
+    Select the movies with the given primary keys.
+
+    Args:
+        movie_ids (Iterable[int]): Primary keys.
+        user_id (int, optional): Set ``is_favorite`` for this user.
+        cards (bool): Select the :class:`MovieCard` columns instead of
+            ``Movie`` entities.
+        favorite_ids (Iterable[int], optional): Set ``is_favorite`` on
+            these movies instead, see :func:`favorite_flag`.
+    """
+    is_favorite = favorite_flag(user_id, favorite_ids)
+    if cards:
+        statement = select(*card_columns(
+            false() if is_favorite is None else is_favorite
+        ))
+    else:
+        statement = select(Movie)
+        if is_favorite is not None:
+            statement = statement.options(
+                with_expression(Movie.is_favorite, is_favorite)
+            )
+    return statement.where(Movie.id.in_(list(movie_ids)))
+
+
+def favorite_pairs():
+    """Select ``(user_id, movie_id)`` of every favourite, oldest first."""
+    return (
+        select(Favorite.user_id, Favorite.movie_id)
+        .order_by(Favorite.created, Favorite.user_id, Favorite.movie_id)
+    )
+
+
+def add_favorite(user_id, movie_id, created, guard=True):
+    """
+    Build an insert of a favourite that is a no-op if it exists.
+
+    Returns ``created`` when a row was inserted and nothing when the
+    favourite was already there, so concurrent adds never raise an
+    ``IntegrityError``.
+
+    Args:
+        guard (bool): Insert only if the user and the movie exist, as
+            ``INSERT ... SELECT ... WHERE EXISTS``; SQLite does not
+            enforce the foreign keys. Off when they live in another
+            database and were checked there.
+    """
+    if not guard:
+        statement = insert(Favorite).values(
+            user_id=user_id, movie_id=movie_id, created=created
+        )
+    else:
+        statement = insert(Favorite).from_select(
+            ["user_id", "movie_id", "created"],
+            select(
+                literal(user_id), literal(movie_id),
+                literal(created, Favorite.created.type),
+            ).where(
+                exists().where(User.id == user_id),
+                exists().where(Movie.id == movie_id),
+            ),
+        )
+    return statement.on_conflict_do_nothing().returning(Favorite.created)
+
+
+def remove_favorite(user_id, movie_id):
+    """Build the delete of a favourite, returning its ``created``."""
+    return (
+        delete(Favorite)
+        .where(Favorite.user_id == user_id, Favorite.movie_id == movie_id)
+        .returning(Favorite.created)
+    )
+
+
+def existing_movie_ids(movie_ids):
+    """Select which of ``movie_ids`` are movies."""
+    return select(Movie.id).where(Movie.id.in_(list(movie_ids)))
+
+
+def has_favorite(user_id, movie_id):
+    """Select whether the user has the movie as a favourite."""
+    return select(
+        exists().where(
+            Favorite.user_id == user_id, Favorite.movie_id == movie_id
+        )
+    )
+
+
+def count_favorite(movie_id, created, step):
+    """
+    Build the upserts adding ``step`` to a movie's favourite counts.
+
+    Args:
+        movie_id (int): The favourited movie.
+        created (datetime): When the favourite was added; picks the
+            weekly bucket.
+        step (int): ``1`` for an added favourite, ``-1`` for a removed
+            one.
+
+    Returns:
+        list[sqlalchemy.Insert]: One ``INSERT ... ON CONFLICT`` for the
+        all-time and one for the weekly count.
+    """
+    weeks = [ALL_TIME] if created is None else [ALL_TIME, week_of(created)]
+    return [
+        insert(MoviePopularity)
+        .values(week=week, movie_id=movie_id, favorites=max(step, 0))
+        .on_conflict_do_update(
+            index_elements=[MoviePopularity.week, MoviePopularity.movie_id],
+            set_={"favorites": MoviePopularity.favorites + step},
+        )
+        for week in weeks
+    ]
+
+
+def forget_popularity(movie_id):
+    """Delete every favourite count of a movie."""
+    return delete(MoviePopularity).where(MoviePopularity.movie_id == movie_id)
+
+
+def top_movies(window, limit, now=None):
+    """
+    Select ``(Movie, favourites)`` of the most favourited movies.
+
+    Walks ``ix_movie_popularity_rank`` backwards from the top of one
+    bucket, so the cost depends on ``limit`` only. Ties go to the newer
+    movie.
+
+    Args:
+        window (str): ``"week"`` or ``"all"``, see
+            :func:`database.popularity.bucket`.
+        limit (int): Movies to select.
+        now (datetime, optional): Current UTC time.
+    """
+    return (
+        select(Movie, MoviePopularity.favorites)
+        .join(MoviePopularity, MoviePopularity.movie_id == Movie.id)
+        .where(
+            MoviePopularity.week == bucket(window, now),
+            MoviePopularity.favorites > 0,
+        )
+        .order_by(
+            MoviePopularity.favorites.desc(), MoviePopularity.movie_id.desc()
+        )
+        .limit(limit)
+    )
+
+
+def movie_rows(after_id=0):
+    """Select the :class:`MovieRow` columns of movies past ``after_id``."""
+    return (
+        select(
+            Movie.id, Movie.title, Movie.year, Movie.rating, Movie.poster,
+            Movie.user_id,
+        )
+        .where(Movie.id > after_id)
+        .order_by(Movie.id)
+    )
+
+
+def snapshot_rows(after_id=0, movie_id=None):
+    """
+    Select the :class:`MovieRow` columns and ``updated_at`` of movies.
+
+    Args:
+        after_id (int): Only movies past this id, in id order.
+        movie_id (int, optional): Only this movie.
+    """
+    statement = select(
+        Movie.id, Movie.title, Movie.year, Movie.rating, Movie.poster,
+        Movie.user_id, Movie.updated_at,
+    )
+    if movie_id is not None:
+        return statement.where(Movie.id == movie_id)
+    return statement.where(Movie.id > after_id).order_by(Movie.id)
+
+
+def favorite_ids(user_id):
+    """Select the ids of the user's favourite movies."""
+    return select(Favorite.movie_id).where(Favorite.user_id == user_id)
+
+
+def user_summaries():
+    """
+    Select ``(id, name, movie count, favourite count)`` of active users.
+
+    Both counts are aggregated per user in subqueries and joined in a
+    single statement, so no ``Movie`` rows are loaded.
+    """
+    movie_counts = (
+        select(Movie.user_id, func.count().label("total"))
+        .group_by(Movie.user_id)
+        .subquery()
+    )
+    favorite_counts = (
+        select(Favorite.user_id, func.count().label("total"))
+        .group_by(Favorite.user_id)
+        .subquery()
+    )
+    return (
+        select(
+            User.id,
+            User.name,
+            func.coalesce(movie_counts.c.total, 0),
+            func.coalesce(favorite_counts.c.total, 0),
+        )
+        .outerjoin(movie_counts, movie_counts.c.user_id == User.id)
+        .outerjoin(favorite_counts, favorite_counts.c.user_id == User.id)
+        # plain "is_active = 1" so the partial index applies
+        .where(User.is_active)
+        .order_by(User.id)
+    )
+
+
+def favorite_movies(user_id, sort_by=None, cards=False):
+    """
+    Select a user's favourite movies with ``is_favorite`` set.
+
+    With ``cards`` the :class:`MovieCard` columns are selected instead
+    of ``Movie`` entities.
+    """
+    if cards:
+        statement = select(*card_columns(true()))
+    else:
+        statement = select(Movie).options(
+            with_expression(Movie.is_favorite, true())
+        )
+    statement = (
+        statement
+        .join(Favorite, Favorite.movie_id == Movie.id)
+        .where(Favorite.user_id == user_id)
+    )
+    return apply_keyset(statement, normalize_sort(sort_by), None)
+
+
+def user_names():
+    """Select ``(id, name)`` of the active users, ordered by id."""
+    return (
+        select(User.id, User.name)
+        .where(User.is_active)
+        .order_by(User.id)
+    )
+
+
+def movies_page(query=None, sort_by=None, after=None, before=None,
+                page_size=None, user_id=None, exclude_favorites=False,
+                cards=False, favorite_ids=None):
+    """
+    Build the keyset query for one page of the catalogue.
+
+    Arguments are those of
+    :meth:`SQLiteDataManager.get_movies_page`; with ``cards`` the page
+    holds :class:`MovieCard` rows instead of ``Movie`` entities.
+    ``favorite_ids`` flags (or excludes) these movies instead of
+    ``user_id``'s favourites, see :func:`favorite_flag`.
+
+    Returns:
+        PageQuery: The statement, fetching one row more than
+        ``page_size`` to detect a further page, and the resolved
+        paging parameters for :func:`build_page`.
+    """
+    matches = search_matches(query) if query else None
+    sort_by = normalize_sort(sort_by, searching=matches is not None)
+    page_size = clamp_page_size(page_size)
+    after_key = decode_cursor(after, sort_by)
+    before_key = None if after_key else decode_cursor(before, sort_by)
+    backwards = before_key is not None
+
+    is_favorite = favorite_flag(user_id, favorite_ids)
+    if cards:
+        columns = card_columns(
+            false() if is_favorite is None else is_favorite
+        )
+    else:
+        columns = (Movie,)
+    if matches is not None:
+        score = matches.c.score
+        # the score comes last, see build_page()
+        statement = select(*columns, score).join(
+            matches, matches.c.movie_id == Movie.id
+        )
+    else:
+        score = None
+        statement = select(*columns)
+        if query:
+            statement = filter_by_title(statement, query)
+    if is_favorite is not None:
+        if not cards:
+            statement = statement.options(
+                with_expression(Movie.is_favorite, is_favorite)
+            )
+        if exclude_favorites:
+            statement = statement.where(~is_favorite)
+    statement = apply_keyset(
+        statement, sort_by, before_key if backwards else after_key,
+        backwards=backwards, score=score,
+    ).limit(page_size + 1)
+    return PageQuery(
+        statement, sort_by, page_size, after_key, backwards, cards
+    )
+
+
+def build_page(page_query, rows):
+    """
+    Turn the rows of a :func:`movies_page` query into a :class:`Page`.
+
+    Args:
+        page_query (PageQuery): The executed query.
+        rows (list[sqlalchemy.Row]): All rows it returned.
+
+    Returns:
+        Page: The items and the cursors of the neighbouring pages.
+    """
+    sort_by, page_size = page_query.sort_by, page_query.page_size
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if page_query.backwards:
+        rows.reverse()
+    if page_query.cards:
+        size = len(MovieCard._fields)
+        items = [MovieCard._make(row[:size]) for row in rows]
+    else:
+        items = [row[0] for row in rows]
+
+    if page_query.backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, page_query.after_key is not None
+
+    def cursor_at(index):
+        score_value = rows[index][-1] if sort_by == RELEVANCE else None
+        key = sort_key(sort_by, items[index], score_value)
+        return encode_cursor(sort_by, key)
+
+    next_cursor = cursor_at(-1) if rows and has_next else None
+    prev_cursor = cursor_at(0) if rows and has_prev else None
+    return Page(items, next_cursor, prev_cursor)
@@ -0,0 +1,378 @@
+"""
+"Users who favourited this also favourited" recommendations.
+
+Item-item cosine similarity over the favourites, i.e. the sparse
+user x movie matrix held as two adjacency maps::
+
+    user_movies[user_id]  -> {movie_id: None, ...}   (oldest first)
+    movie_users[movie_id] -> {user_id, ...}
+
+    similarity(a, b) = |users(a) & users(b)| / sqrt(|users(a)| |users(b)|)
+
+The co-occurrence row of a movie (``{other: shared users}``) and its
+top-K neighbours are computed the first time the movie is asked for
+and kept in a bounded LRU, next to a reverse index from each movie to
+the cached rows counting it. :func:`database.signals.favorite_toggled`
+then updates the cached rows in place: the counts between the toggled
+movie and the user's other favourites change by one, and every cached
+top-K list containing the movie (found through the reverse index) gets
+its score refreshed (a full re-rank only when it dropped out), so
+serving a neighbour list stays a dictionary lookup.
+
+The favourites are read once, by the first read or by
+:func:`app.warm_up` before workers are forked. Later reloads, after
+writes of other processes, run on a background thread and swap the new
+maps in while the current ones keep answering; toggles signalled during
+the rebuild are replayed onto the new maps.
+
+Users with more than ``max_user_favorites`` favourites are left out of
+the co-occurrence counts; they like nearly everything, which says
+little about any pair and costs quadratic work.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from . import queries, signals
+
+log = logging.getLogger(__name__)
+
+
+class _Row:
+    """Cached co-occurrence counts and top-K neighbours of one movie."""
+
+    __slots__ = ("counts", "top")
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.top = []
+
+
+class Recommender:
+    """
+    In-process item-item recommender over the favourite table.
+
+    Args:
+        read (callable): Executes a ``select()`` and returns its rows;
+            called from a background thread too, so it must not depend
+            on the caller's app context.
+        scope (str): data_version scope bumped by every favourite write.
+        top_k (int): Neighbours kept per movie.
+        max_user_favorites (int): Users above this are not counted.
+        max_rows (int): Co-occurrence rows kept in memory.
+        max_age (float): Seconds between checks for writes made by
+            other processes, which start a reload in the background.
+    """
+
+    def __init__(self, read, scope, top_k=20, max_user_favorites=500,
+                 max_rows=10000, max_age=60):
+        self._read = read
+        self.scope = scope
+        self.top_k = top_k
+        self.max_user_favorites = max_user_favorites
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        # held for a whole load, so loads never overlap
+        self._load_lock = threading.Lock()
+        self._loader = None
+        # writes signalled while a load runs, replayed onto its result
+        self._pending = None
+        self.generation = None
+        self._checked = 0.0
+        self.user_movies = {}
+        self.movie_users = {}
+        self._rows = OrderedDict()
+        # movie -> ids of the cached rows whose counts include it
+        self._counted_in = {}
+
+    # -- loading ---------------------------------------------------------
+
+    def _current_generation(self):
+        rows = self._read(queries.generations((self.scope,)))
+        return rows[0][1] if rows else 0
+
+    def load(self):
+        """
+        Read every favourite and swap the result in.
+
+        The favourites are read without holding the lock, so reads are
+        answered from the previous maps meanwhile.
+        """
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        with self._lock:
+            self._pending = []
+        try:
+            # read first: a write racing the load only causes a reload
+            generation = self._current_generation()
+            user_movies, movie_users = {}, {}
+            for user_id, movie_id in self._read(queries.favorite_pairs()):
+                user_movies.setdefault(user_id, {})[movie_id] = None
+                movie_users.setdefault(movie_id, set()).add(user_id)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self.user_movies, self.movie_users = user_movies, movie_users
+            self._rows.clear()
+            self._counted_in.clear()
+            self.generation = generation + len(pending)
+            self._checked = time.monotonic()
+            try:
+                # whether or not the read saw them, applying the writes
+                # again leaves the same maps; no rows are cached to patch
+                for change, args in pending:
+                    change(*args)
+            except Exception as e:
+                log.warning("Recommender replay failed: %s", e)
+                # out of step with the database: the next check reloads
+                self.generation = -1
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except Exception as e:
+            log.warning("Recommender load failed: %s", e)
+        finally:
+            with self._lock:
+                self._loader = None
+
+    def load_in_background(self):
+        """Start a reload unless one is already running."""
+        with self._lock:
+            if self._loader is None:
+                self._loader = threading.Thread(
+                    target=self._load_quietly, name="recommender",
+                    daemon=True,
+                )
+                self._loader.start()
+            return self._loader
+
+    def _ensure_loaded(self):
+        if self.generation is None:
+            # nothing to answer from yet: the first read waits for it
+            with self._load_lock:
+                if self.generation is None:
+                    self._load()
+            return
+        now = time.monotonic()
+        if now - self._checked >= self.max_age:
+            self._checked = now
+            if self._current_generation() != self.generation:
+                self.load_in_background()
+
+    # -- similarity ------------------------------------------------------
+
+    def _counted(self, user_id):
+        return len(self.user_movies.get(user_id, ())) <= (
+            self.max_user_favorites
+        )
+
+    def _score(self, movie_id, other_id, shared):
+        norm = len(self.movie_users.get(movie_id, ())) * len(
+            self.movie_users.get(other_id, ())
+        )
+        return shared / math.sqrt(norm) if norm else 0.0
+
+    def _rank(self, movie_id, row):
+        row.top = heapq.nlargest(
+            self.top_k,
+            ((self._score(movie_id, other, shared), other)
+             for other, shared in row.counts.items() if shared > 0),
+        )
+
+    def _row(self, movie_id):
+        row = self._rows.get(movie_id)
+        if row is not None:
+            self._rows.move_to_end(movie_id)
+            return row
+        counts = {}
+        for user_id in self.movie_users.get(movie_id, ()):
+            if not self._counted(user_id):
+                continue
+            for other in self.user_movies[user_id]:
+                counts[other] = counts.get(other, 0) + 1
+        counts.pop(movie_id, None)
+        row = self._rows[movie_id] = _Row(counts)
+        for other in counts:
+            self._counted_in.setdefault(other, set()).add(movie_id)
+        self._rank(movie_id, row)
+        while len(self._rows) > self.max_rows:
+            self._drop_row(next(iter(self._rows)))
+        return row
+
+    def _drop_row(self, movie_id):
+        row = self._rows.pop(movie_id, None)
+        if row is None:
+            return
+        for other in row.counts:
+            rows = self._counted_in.get(other)
+            if rows is not None:
+                rows.discard(movie_id)
+                if not rows:
+                    del self._counted_in[other]
+
+    def _add_count(self, movie_id, row, other, step):
+        if other not in row.counts:
+            row.counts[other] = 0
+            self._counted_in.setdefault(other, set()).add(movie_id)
+        row.counts[other] += step
+
+    def neighbours(self, movie_id):
+        """
+        Return the movies most similar to ``movie_id``.
+
+        Args:
+            movie_id (int): The movie.
+
+        Returns:
+            list[tuple[float, int]]: Up to ``top_k`` ``(similarity,
+            movie_id)`` pairs, best first.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._row(movie_id).top)
+
+    def because_you_liked(self, user_id, seeds=3, limit=6):
+        """
+        Pick recommendation rows for a user.
+
+        Each of the user's ``seeds`` most recently added favourites
+        contributes its best neighbours that the user has not
+        favourited yet and no earlier row already shows.
+
+        Args:
+            user_id (int): The user.
+            seeds (int): Rows to return at most.
+            limit (int): Movies per row.
+
+        Returns:
+            list[tuple[int, list[int]]]: ``(seed movie id, recommended
+            movie ids)``; rows without recommendations are left out.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            liked = self.user_movies.get(user_id, {})
+            shown = set(liked)
+            rows = []
+            for seed in reversed(list(liked)[-seeds:]):
+                picked = []
+                for _, other in self._row(seed).top:
+                    if other not in shown:
+                        picked.append(other)
+                        shown.add(other)
+                        if len(picked) == limit:
+                            break
+                if picked:
+                    rows.append((seed, picked))
+            return rows
+
+    # -- incremental updates ---------------------------------------------
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((change, args))
+            if self.generation is None:
+                return
+            try:
+                change(*args)
+            except Exception as e:
+                log.warning("Recommender update failed: %s", e)
+                self.generation = None
+                return
+            # one bump per signalled write; written elsewhere too, the
+            # database is ahead and the next read past max_age reloads
+            self.generation += 1
+
+    def _rescore(self, movie_id, row, changed):
+        # refresh one entry of a top-K list, re-ranking only when a
+        # movie outside the list might now belong in it
+        shared = row.counts.get(changed, 0)
+        entry = (self._score(movie_id, changed, shared), changed)
+        top = [item for item in row.top if item[1] != changed]
+        was_in = len(top) < len(row.top)
+        full = len(row.top) == self.top_k
+        if was_in and full and (shared <= 0 or entry < top[-1]):
+            self._rank(movie_id, row)
+            return
+        if shared > 0 and not (full and not was_in and entry <= top[-1]):
+            top.append(entry)
+            top.sort(reverse=True)
+            del top[self.top_k:]
+            row.top = top
+        elif was_in:
+            row.top = top
+
+    def _toggle(self, user_id, movie_id, added):
+        liked = self.user_movies.setdefault(user_id, {})
+        was_counted = self._counted(user_id)
+        others = [other for other in liked if other != movie_id]
+        if added:
+            liked[movie_id] = None
+            self.movie_users.setdefault(movie_id, set()).add(user_id)
+        else:
+            liked.pop(movie_id, None)
+            self.movie_users.get(movie_id, set()).discard(user_id)
+
+        if was_counted != self._counted(user_id):
+            # the user crossed max_user_favorites: every row they touch
+            # changes, which is cheaper to recompute than to patch
+            for other in others + [movie_id]:
+                self._drop_row(other)
+        elif was_counted:
+            step = 1 if added else -1
+            row = self._rows.get(movie_id)
+            if row is not None:
+                for other in others:
+                    self._add_count(movie_id, row, other, step)
+            for other in others:
+                row = self._rows.get(other)
+                if row is not None:
+                    self._add_count(other, row, movie_id, step)
+
+        # the movie's favourite count is in every similarity to it
+        row = self._rows.get(movie_id)
+        if row is not None:
+            self._rank(movie_id, row)
+        for other in self._counted_in.get(movie_id, ()):
+            self._rescore(other, self._rows[other], movie_id)
+
+    def _delete(self, movie_id):
+        for user_id in self.movie_users.pop(movie_id, ()):
+            self.user_movies.get(user_id, {}).pop(movie_id, None)
+        self._drop_row(movie_id)
+        for other in self._counted_in.pop(movie_id, ()):
+            row = self._rows[other]
+            del row.counts[movie_id]
+            self._rescore(other, row, movie_id)
+
+    def connect_signals(self, sender):
+        """
+        Follow the favourite writes of ``sender``.
+
+        Args:
+            sender: The data manager whose signals update the rows;
+                other senders' writes are picked up by the next reload.
+        """
+        signals.favorite_toggled.connect(self._on_toggled, sender=sender)
+        signals.movie_deleted.connect(self._on_deleted, sender=sender)
+
+    def disconnect_signals(self):
+        """Stop following the data manager's writes."""
+        signals.favorite_toggled.disconnect(self._on_toggled)
+        signals.movie_deleted.disconnect(self._on_deleted)
+
+    def _on_toggled(self, sender, user_id, movie_id, added, **extra):
+        self._apply(self._toggle, user_id, movie_id, added)
+
+    def _on_deleted(self, sender, movie_id, **extra):
+        self._apply(self._delete, movie_id)
@@ -0,0 +1,31 @@
+from collections import namedtuple
+
+# Read-only rows for list views; cheaper than ORM instances and safe to
+# use after the session is gone.
+
+UserSummary = namedtuple(
+    "UserSummary", ["id", "name", "movie_count", "favorite_count"]
+)
+
+MovieRow = namedtuple(
+    "MovieRow", ["id", "title", "year", "rating", "poster", "user_id"]
+)
+
+# What a rendered movie card reads, see movie_card() in app.py.
+MovieCard = namedtuple(
+    "MovieCard",
+    ["id", "title", "year", "rating", "poster", "updated_at", "is_favorite"],
+)
+
+# An entry of the user picker.
+UserName = namedtuple("UserName", ["id", "name"])
+
+# An autocomplete match, see database/autocomplete.py
+Suggestion = namedtuple("Suggestion", ["id", "title", "year", "rating"])
+
+# A leaderboard entry: a Movie instance and its favourite count.
+RankedMovie = namedtuple("RankedMovie", ["movie", "favorites"])
+
+# Generations of some data_version scopes and the time of the latest
+# change among them, None if none of them was ever written.
+Version = namedtuple("Version", ["generations", "updated"])
@@ -0,0 +1,199 @@
+import re
+import unicodedata
+
+from sqlalchemy import func, literal_column, select, text
+
+from .models import Movie
+
+FTS_TABLE = "movie_fts"
+
+# External-content FTS5 index over movie.title. The triggers keep it in
+# sync with every write path, including raw SQL, so the data manager
+# never has to touch it directly. Bulk imports are the one exception,
+# see pause_search_index().
+SEARCH_INDEX_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title,
+        content='movie',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # holds a row while a bulk import indexes its rows in one statement
+    """
+    CREATE TABLE IF NOT EXISTS search_index_paused (
+        id INTEGER NOT NULL PRIMARY KEY
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movie_fts_ai AFTER INSERT ON movie
+    WHEN NOT EXISTS (SELECT 1 FROM search_index_paused)
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movie_fts_ad AFTER DELETE ON movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title)
+        VALUES ('delete', old.id, old.title);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movie_fts_au AFTER UPDATE OF title ON movie
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_fts = literal_column(FTS_TABLE)
+
+
+def fold(text):
+    """Lower-case ``text`` and strip diacritics, like the search index."""
+    if text.isascii():
+        return text.lower().replace("\n", " ")
+    decomposed = unicodedata.normalize(
+        "NFKD", text.lower().replace("\n", " ")
+    )
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def create_search_index(connection):
+    """
+    Create the FTS5 table and its sync triggers if they are missing.
+
+    Args:
+        connection: SQLAlchemy connection or session to execute on.
+    """
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    """
+    Create the index if needed and repopulate it from the movie table.
+
+    Args:
+        connection: SQLAlchemy connection or session to execute on.
+    """
+    create_search_index(connection)
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    )
+
+
+def pause_search_index(connection):
+    """
+    Stop indexing inserted movies row by row until the transaction ends.
+
+    Per-row FTS5 inserts from the trigger get very slow once the index
+    is large, while one ``INSERT ... SELECT`` over the new rows stays
+    fast. The pause is a row in ``search_index_paused`` written in the
+    caller's transaction, so other connections never observe it and a
+    rollback undoes it. Must be paired with :func:`resume_search_index`
+    before the same transaction commits.
+
+    Args:
+        connection: SQLAlchemy connection or session inside an open
+            write transaction.
+
+    Returns:
+        int: The highest movie id before the pause.
+    """
+    connection.execute(
+        text("INSERT OR IGNORE INTO search_index_paused (id) VALUES (1)")
+    )
+    return connection.execute(
+        text("SELECT coalesce(max(id), 0) FROM movie")
+    ).scalar()
+
+
+def resume_search_index(connection, after_id):
+    """
+    Index the movies inserted since :func:`pause_search_index` and
+    re-enable the insert trigger.
+
+    Args:
+        connection: The connection or session passed to
+            :func:`pause_search_index`.
+        after_id (int): Its return value.
+    """
+    connection.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE}(rowid, title) "
+            "SELECT id, title FROM movie WHERE id > :after_id"
+        ),
+        {"after_id": after_id},
+    )
+    connection.execute(text("DELETE FROM search_index_paused"))
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 prefix query.
+
+    Every word becomes a quoted prefix term (``"tit"*``), and all terms
+    must match, so ``"star wa"`` finds *Star Wars*.
+
+    Args:
+        query (str): User search input.
+
+    Returns:
+        str | None: The MATCH expression, or ``None`` if ``query`` has no
+        searchable words.
+    """
+    tokens = _TOKEN.findall(query or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_matches(query):
+    """
+    Build a subquery of movie ids matching ``query`` with their score.
+
+    Args:
+        query (str): User search input.
+
+    Returns:
+        sqlalchemy.Subquery | None: Columns ``movie_id`` and ``score``
+        (bm25, lower is more relevant), or ``None`` when ``query`` has
+        no searchable words.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return None
+    return (
+        select(
+            literal_column("rowid").label("movie_id"),
+            func.bm25(_fts).label("score"),
+        )
+        .select_from(text(FTS_TABLE))
+        .where(_fts.op("MATCH")(expression))
+        .subquery("search")
+    )
+
+
+def filter_by_title(statement, query):
+    """
+    Restrict a movie query to titles matching ``query``.
+
+    Falls back to a substring match when the input contains no words
+    the index can search for (e.g. only punctuation).
+
+    Args:
+        statement: ``Movie.query`` or a ``select()`` over :class:`Movie`.
+        query (str): User search input.
+
+    Returns:
+        The filtered statement.
+    """
+    matches = search_matches(query)
+    if matches is None:
+        return statement.filter(Movie.title.ilike(f"%{query}%"))
+    return statement.filter(Movie.id.in_(select(matches.c.movie_id)))
@@ -0,0 +1,1076 @@
+"""
+Per-user sharded storage: several SQLite files, one write lock each.
+
+This is a prototype of a storage backend, not a deployment option: no
+setting makes the web app serve from it. The views, the write queue,
+the catalogue snapshot, the recommender and the title index all read
+the single file through ``db.session``; switching them over means
+routing every one of them through :class:`DataManagerInterface` first.
+What exists here is the layout, the copy from a single file and a data
+manager answering the interface, for ``benchmarks/shard_bench.py``
+and scripts.
+
+A single database file serialises every write behind SQLite's one
+writer lock. A sharded layout splits the data by user instead, so
+writes of users on different shards commit in parallel:
+
+* ``map.sqlite3``, the shard map, holds the users, the list of shard
+  files and which shard each migrated movie lives in;
+* ``shard-00.sqlite3`` … hold the full schema of a single-file
+  database. A user's movies and favourites live in the shard picked by
+  :func:`shard_of_user`, together with their search postings and the
+  favourite counts of that shard's users.
+
+Single-user operations (adding, editing or deleting a movie, toggling
+favourites, a user's lists) touch the user's shard only. The ids of
+movies added to a layout encode their shard, ``id_base + k * shards +
+shard``, so locating a movie needs no lookup; only movies copied from
+the single file (ids up to ``id_base``) are found through the map.
+``k`` comes from a counter in the shard that only ever grows, so the
+id of a deleted movie is never handed out again.
+
+Global views are answered by scatter-gather on a thread pool: the same
+statement runs on every shard and the results are merged. Catalogue
+pages use the keyset query of :func:`database.queries.movies_page`, and
+since every shard returns its rows in keyset order a heap merge of the
+first ``page_size + 1`` rows of each is the exact page, cursors
+included. Relevance ordering is the exception: bm25 scores are computed
+per shard, so the merge across shards is approximate. The leaderboards
+sum per-shard favourite counts with the three-round threshold algorithm
+(TPUT), which is exact without reading every count.
+
+Generations (see :class:`DataVersion`) are bumped in the file a write
+commits to and summed over all files, so they still grow with every
+write. A movie deletion is the one write spanning shards. The movie is
+deleted in its shard together with a tombstone row; the favourites and
+counts of it in the other shards are swept afterwards and the tombstone
+dropped last. A sweep cut short leaves the tombstone behind, and
+:meth:`ShardedSQLiteDataManager.finish_deletes` (run when a layout is
+opened and before every deletion) completes it. A favourite added while
+its movie is being deleted is removed again by the writer, which checks
+the movie once more after its commit. SQLite does not enforce the
+foreign keys, so favourites may point at movies of other shards.
+
+The layout is created from an existing single-file database by
+:func:`shard_database` (``python manage.py shard``) and served by
+:class:`ShardedSQLiteDataManager`.
+"""
+import contextlib
+import functools
+import heapq
+import itertools
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.orm import sessionmaker
+
+from .datamanager_interface import DataManagerInterface
+from .engine import _pragma_hook
+from .migrations import upgrade
+from .models import DataVersion, Favorite, Movie, MoviePopularity, User, db
+from .pagination import (
+    RELEVANCE,
+    apply_keyset,
+    keyset_columns,
+    normalize_sort,
+    sort_key,
+)
+from .popularity import bucket, rebuild_popularity
+from . import queries, signals, trigrams
+from .records import MovieCard, RankedMovie, UserName, UserSummary
+from .search import filter_by_title, pause_search_index, resume_search_index
+from .sqlite_data_manager import CATALOGUE, FAVORITES, USERS, user_scope
+
+MAP_FILE = "map.sqlite3"
+SHARD_FILE = "shard-{:02d}.sqlite3"
+
+# Knuth's multiplicative hashing constant, 2**32 / golden ratio
+_HASH = 2654435761
+
+# Tables of the shard map, next to the user and data_version tables.
+_layout = MetaData()
+shard_table = Table(
+    "shard", _layout,
+    Column("number", Integer, primary_key=True),
+    Column("file", String(255), nullable=False),
+)
+layout_table = Table(
+    "shard_layout", _layout,
+    Column("name", String(50), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+# shard of every movie copied from the single file, see id_base
+movie_shard_table = Table(
+    "movie_shard", _layout,
+    Column("movie_id", Integer, primary_key=True),
+    Column("shard", Integer, nullable=False),
+    sqlite_with_rowid=False,
+)
+
+# Tables of every shard file, next to the single-file schema.
+_shard_layout = MetaData()
+# last k of the ids id_base + k * shards + shard, see _next_movie_id
+sequence_table = Table(
+    "movie_sequence", _shard_layout,
+    Column("name", String(50), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+# movies deleted whose favourites in other shards are not swept yet
+tombstone_table = Table(
+    "deleted_movie", _shard_layout,
+    Column("movie_id", Integer, primary_key=True),
+    sqlite_with_rowid=False,
+)
+
+
+def shard_of_user(user_id, shards):
+    """
+    Return the number of the shard holding a user's data.
+
+    Multiplicative hashing: stable across processes (unlike
+    ``hash()``) and spreads consecutive ids evenly.
+
+    Args:
+        user_id (int): User primary key.
+        shards (int): Number of shards in the layout.
+
+    Returns:
+        int: ``0 .. shards - 1``.
+    """
+    return (user_id * _HASH % 2**32) * shards >> 32
+
+
+def _url(path):
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def create_layout(directory, shards, id_base=0):
+    """
+    Create an empty sharded layout.
+
+    Every shard file gets the full, migrated schema; the map records
+    the shard files and ``id_base``.
+
+    Args:
+        directory (str): Where to create the files; created if needed.
+        shards (int): Number of shard files.
+        id_base (int): Highest movie id copied from a single file; new
+            movies get larger ids.
+
+    Returns:
+        list[str]: Paths of the map and the shard files.
+
+    Raises:
+        ValueError: If ``shards`` is smaller than one.
+        FileExistsError: If one of the files already exists.
+    """
+    if shards < 1:
+        raise ValueError("A sharded layout needs at least one shard.")
+    files = [SHARD_FILE.format(number) for number in range(shards)]
+    paths = [os.path.join(directory, name) for name in [MAP_FILE, *files]]
+    for path in paths:
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} already exists.")
+    os.makedirs(directory, exist_ok=True)
+
+    for path in paths[1:]:
+        engine = create_engine(_url(path))
+        db.metadata.create_all(engine)
+        upgrade(engine, log=lambda line: None)
+        with engine.begin() as connection:
+            _shard_layout.create_all(connection)
+            connection.execute(
+                insert(sequence_table).values(name="movie", value=0)
+            )
+        engine.dispose()
+
+    # the map last: a layout without one is never opened
+    engine = create_engine(_url(paths[0]))
+    with engine.begin() as connection:
+        User.__table__.create(connection)
+        DataVersion.__table__.create(connection)
+        _layout.create_all(connection)
+        connection.execute(insert(shard_table), [
+            {"number": number, "file": name}
+            for number, name in enumerate(files)
+        ])
+        connection.execute(
+            insert(layout_table).values(name="id_base", value=id_base)
+        )
+    engine.dispose()
+    return paths
+
+
+def shard_database(source, directory, shards, batch_size=5000, log=print):
+    """
+    Copy a single-file database into a new sharded layout.
+
+    Users and generations go to the map; each movie, favourite and
+    search posting to the shard of its user. Favourites of movies that
+    no longer exist are left out. The source is only read, so the app
+    can keep serving from it until the layout is switched to.
+
+    Args:
+        source (sqlalchemy.engine.Engine): Engine of the single file.
+        directory (str): Where to create the layout, see
+            :func:`create_layout`.
+        shards (int): Number of shard files.
+        batch_size (int): Rows per ``executemany`` call.
+        log (callable): Receives one progress line per step.
+
+    Returns:
+        Counter: Rows copied per table.
+    """
+    copied = Counter()
+    with source.connect() as reader:
+        id_base = reader.execute(
+            select(func.coalesce(func.max(Movie.id), 0))
+        ).scalar()
+        paths = create_layout(directory, shards, id_base)
+        engines = [create_engine(_url(path)) for path in paths]
+        with contextlib.ExitStack() as stack:
+            writers = [
+                stack.enter_context(engine.begin()) for engine in engines
+            ]
+            layout, targets = writers[0], writers[1:]
+
+            for table in (User.__table__, DataVersion.__table__):
+                rows = reader.execute(select(table)).mappings()
+                for batch in rows.partitions(batch_size):
+                    layout.execute(insert(table), [dict(r) for r in batch])
+                    copied[table.name] += len(batch)
+            log(f"Copied {copied['user']} users to the shard map.")
+
+            for target in targets:
+                pause_search_index(target)
+            rows = reader.execute(
+                select(Movie.__table__).order_by(Movie.id)
+            ).mappings()
+            for batch in rows.partitions(batch_size):
+                routed = defaultdict(list)
+                for row in batch:
+                    routed[shard_of_user(row["user_id"], shards)].append(
+                        dict(row)
+                    )
+                for number, movies in routed.items():
+                    targets[number].execute(insert(Movie.__table__), movies)
+                layout.execute(insert(movie_shard_table), [
+                    {"movie_id": movie["id"], "shard": number}
+                    for number, movies in routed.items() for movie in movies
+                ])
+                copied["movie"] += len(batch)
+            for target in targets:
+                resume_search_index(target, 0)
+                trigrams.index_new_movies(target, 0)
+            log(f"Copied {copied['movie']} movies and their search index.")
+
+            rows = reader.execute(
+                select(Favorite.__table__)
+                .where(exists().where(Movie.id == Favorite.movie_id))
+            ).mappings()
+            for batch in rows.partitions(batch_size):
+                routed = defaultdict(list)
+                for row in batch:
+                    routed[shard_of_user(row["user_id"], shards)].append(
+                        dict(row)
+                    )
+                for number, favorites in routed.items():
+                    targets[number].execute(
+                        insert(Favorite.__table__), favorites
+                    )
+                copied["favorite"] += len(batch)
+            for target in targets:
+                rebuild_popularity(target, movies_only=False)
+            log(f"Copied {copied['favorite']} favourites and their counts.")
+    for engine in engines:
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        engine.dispose()
+    log(f"Created {shards} shards in {directory}, id base {id_base}.")
+    return copied
+
+
+class _Database:
+    """One file of a layout: its engine and sessions."""
+
+    def __init__(self, path, pragmas, engine_options):
+        self.path = path
+        self.engine = create_engine(_url(path), **engine_options)
+        if pragmas:
+            event.listen(
+                self.engine, "connect", _pragma_hook(pragmas, read_only=False)
+            )
+        self.sessions = sessionmaker(self.engine, expire_on_commit=False)
+
+    def read(self, statement):
+        with self.sessions() as session:
+            return session.execute(statement).all()
+
+    def read_objects(self, statement):
+        with self.sessions() as session:
+            return session.execute(statement).scalars().all()
+
+    def transaction(self):
+        return self.sessions.begin()
+
+
+def _bump(session, *scopes, step=1):
+    for statement in queries.bump_generations(scopes, step=step):
+        session.execute(statement)
+
+
+def _set_favorite(session, user_id, movie_id, favorite):
+    # see SQLiteDataManager._set_favorite; the caller checked that the
+    # user and the movie exist, they live in other files
+    if favorite:
+        statement = queries.add_favorite(
+            user_id, movie_id, datetime.utcnow(), guard=False
+        )
+    else:
+        statement = queries.remove_favorite(user_id, movie_id)
+    created = session.execute(statement).first()
+    if created is None:
+        return False
+    for step_statement in queries.count_favorite(
+        movie_id, created[0], 1 if favorite else -1
+    ):
+        session.execute(step_statement)
+    return True
+
+
+class ShardedSQLiteDataManager(DataManagerInterface):
+    """
+    :class:`DataManagerInterface` over a sharded layout.
+
+    Methods take the same arguments and return the same results as
+    their :class:`SQLiteDataManager` counterparts and send the same
+    signals. Returned ORM objects are detached and fully loaded;
+    relationships are not lazy-loadable. Safe to share between threads.
+
+    Args:
+        directory (str): Layout created by :func:`shard_database` or
+            :func:`create_layout`.
+        pragmas (dict, optional): Connection pragmas of every file, as
+            in the engine profiles of :mod:`database.engine`.
+        **engine_options: Passed to ``create_engine`` for every file.
+
+    Raises:
+        FileNotFoundError: If ``directory`` holds no shard map.
+    """
+
+    def __init__(self, directory, pragmas=None, **engine_options):
+        path = os.path.join(directory, MAP_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No shard map at {path}.")
+        self.directory = directory
+        self.map = _Database(path, pragmas, engine_options)
+        files = self.map.read(
+            select(shard_table.c.file).order_by(shard_table.c.number)
+        )
+        self.shards = [
+            _Database(os.path.join(directory, file), pragmas, engine_options)
+            for (file,) in files
+        ]
+        self.id_base = self.map.read(
+            select(layout_table.c.value)
+            .where(layout_table.c.name == "id_base")
+        )[0][0]
+        self._executor = self._new_executor()
+        self.finish_deletes()
+
+    def _new_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=len(self.shards) + 1, thread_name_prefix="shard"
+        )
+
+    def after_fork(self):
+        """
+        Drop the thread pool and connections inherited from the parent.
+
+        To be called in a forked child before the manager is used.
+        """
+        self._executor = self._new_executor()
+        for database in (self.map, *self.shards):
+            database.engine.dispose(close=False)
+
+    def close(self):
+        """Stop the thread pool and close all pooled connections."""
+        self._executor.shutdown()
+        for database in (self.map, *self.shards):
+            database.engine.dispose()
+
+    def _gather(self, function, items):
+        """
+        Call ``function`` on every item in parallel.
+
+        Args:
+            function (callable): Takes one item, e.g. a shard.
+            items (list): Usually :attr:`shards`.
+
+        Returns:
+            list: The results in the order of ``items``.
+        """
+        if len(items) == 1:
+            return [function(items[0])]
+        return list(self._executor.map(function, items))
+
+    def _scatter(self, located, function):
+        """Call ``function(shard, movie_ids)`` per :meth:`_locate` entry."""
+        return self._gather(
+            lambda item: function(self.shards[item[0]], item[1]),
+            list(located.items()),
+        )
+
+    def _user_shard(self, user_id):
+        return self.shards[shard_of_user(user_id, len(self.shards))]
+
+    def _user_exists(self, user_id):
+        (row,) = self.map.read(select(exists().where(User.id == user_id)))
+        return row[0]
+
+    def _known_movie_ids(self, movie_ids):
+        """The ids of ``movie_ids`` that are movies of some shard."""
+        known = set()
+        for rows in self._scatter(
+            self._locate(movie_ids),
+            lambda shard, ids: shard.read(queries.existing_movie_ids(ids)),
+        ):
+            known.update(movie_id for (movie_id,) in rows)
+        return known
+
+    def _locate(self, movie_ids):
+        """
+        Group movie ids by the shard they live in.
+
+        Args:
+            movie_ids (Iterable[int]): Ids to locate.
+
+        Returns:
+            dict[int, list[int]]: Ids by shard number; copied movies
+            unknown to the map are left out.
+        """
+        located = defaultdict(list)
+        copied = []
+        for movie_id in movie_ids:
+            if movie_id > self.id_base:
+                number = (movie_id - self.id_base) % len(self.shards)
+                located[number].append(movie_id)
+            else:
+                copied.append(movie_id)
+        if copied:
+            rows = self.map.read(
+                select(movie_shard_table.c.movie_id, movie_shard_table.c.shard)
+                .where(queries.id_in(copied, movie_shard_table.c.movie_id))
+            )
+            for movie_id, number in rows:
+                located[number].append(movie_id)
+        return located
+
+    def _next_movie_id(self, session, number):
+        """
+        Return a movie id of shard ``number`` that was never used.
+
+        Increments the shard's counter in ``session``, so the id is
+        taken when the movie is committed and free again if it is not.
+        """
+        k = session.scalar(
+            update(sequence_table)
+            .where(sequence_table.c.name == "movie")
+            .values(value=sequence_table.c.value + 1)
+            .returning(sequence_table.c.value)
+        )
+        # ids above id_base are id_base + k * shards + number, k >= 1
+        return self.id_base + k * len(self.shards) + number
+
+    def _favorite_ids(self, user_id, movie_ids=None):
+        """Return the ids of ``user_id``'s favourites, among ``movie_ids``."""
+        statement = select(Favorite.movie_id).where(
+            Favorite.user_id == user_id
+        )
+        if movie_ids is not None:
+            statement = statement.where(
+                queries.id_in(movie_ids, Favorite.movie_id)
+            )
+        return {
+            movie_id for (movie_id,) in
+            self._user_shard(user_id).read(statement)
+        }
+
+    def _movies(self, movie_ids, user_id=None, cards=False,
+                favorite_ids=None):
+        """
+        Load movies by id from the shards they live in.
+
+        Args:
+            movie_ids (Iterable[int]): Ids to load; unknown ones are
+                skipped.
+            user_id (int, optional): Set ``is_favorite`` for this user.
+            cards (bool): Return :class:`MovieCard` rows instead of
+                ``Movie`` instances.
+            favorite_ids (set[int], optional): Set ``is_favorite`` on
+                these movies instead of looking up ``user_id``'s.
+
+        Returns:
+            dict[int, Movie | MovieCard]: The found movies by id.
+        """
+        movie_ids = set(movie_ids)
+        if favorite_ids is None and user_id is not None:
+            favorite_ids = self._favorite_ids(user_id, movie_ids)
+
+        def load(shard, ids):
+            statement = queries.movies_by_id(
+                ids, cards=cards,
+                favorite_ids=None if favorite_ids is None
+                else favorite_ids.intersection(ids),
+            )
+            if cards:
+                return list(map(MovieCard._make, shard.read(statement)))
+            return shard.read_objects(statement)
+
+        return {
+            movie.id: movie
+            for movies in self._scatter(self._locate(movie_ids), load)
+            for movie in movies
+        }
+
+    def _versions(self, scopes):
+        """Return ``(scope, generation, updated)`` summed over all files."""
+        statement = queries.versions(scopes)
+        found = {}
+        for rows in self._gather(
+            lambda database: database.read(statement),
+            [self.map, *self.shards],
+        ):
+            for scope, generation, updated in rows:
+                total, latest = found.get(scope, (0, None))
+                if latest is None or (updated and updated > latest):
+                    latest = updated
+                found[scope] = (total + generation, latest)
+        return [(scope, *found[scope]) for scope in found]
+
+    def get_generations(self, *scopes):
+        """Return the current generation of each scope, over all files."""
+        return queries.to_version(scopes, self._versions(scopes)).generations
+
+    def get_version(self, *scopes):
+        """Return the generations and last change time of ``scopes``."""
+        return queries.to_version(scopes, self._versions(scopes))
+
+    def get_all_users(self):
+        """Return every user in the system."""
+        return self.map.read_objects(select(User))
+
+    def get_user(self, user_id):
+        """Return one user by primary key, ``None`` if not found."""
+        with self.map.sessions() as session:
+            return session.get(User, user_id)
+
+    def get_user_summaries(self):
+        """
+        Return every active user with their movie and favourite counts.
+
+        The counts are aggregated per user in every shard in parallel
+        and joined to the users of the map.
+
+        Returns:
+            list[UserSummary]: One row per active user, ordered by id.
+        """
+        def counts(shard):
+            return (
+                shard.read(
+                    select(Movie.user_id, func.count())
+                    .group_by(Movie.user_id)
+                ),
+                shard.read(
+                    select(Favorite.user_id, func.count())
+                    .group_by(Favorite.user_id)
+                ),
+            )
+
+        movie_counts, favorite_counts = Counter(), Counter()
+        for movies, favorites in self._gather(counts, self.shards):
+            movie_counts.update(dict(movies))
+            favorite_counts.update(dict(favorites))
+        return [
+            UserSummary(
+                user_id, name, movie_counts[user_id], favorite_counts[user_id]
+            )
+            for user_id, name in self.map.read(queries.user_names())
+        ]
+
+    def get_user_names(self):
+        """Return the id and name of every active user, for pickers."""
+        return [UserName(*row) for row in self.map.read(queries.user_names())]
+
+    def get_movies(self, movie_ids):
+        """Return the movies with the given ids as ``{id: movie}``."""
+        return self._movies(movie_ids)
+
+    def get_movie_cards(self, movie_ids, user_id=None):
+        """Return the card columns of movies as ``{id: MovieCard}``."""
+        return self._movies(movie_ids, user_id, cards=True)
+
+    def get_user_movies(self, user_id):
+        """Return all movies that belong to a user, ordered by id."""
+        return self._user_shard(user_id).read_objects(
+            select(Movie).where(Movie.user_id == user_id).order_by(Movie.id)
+        )
+
+    def get_all_movies(self, query=None, sort_by=None, offset=0,
+                       limit=None):
+        """
+        Return the global movie catalogue with optional filters.
+
+        Every shard returns its first ``offset + limit`` matches in
+        order; the lists are merged and the window is cut from the
+        merge.
+
+        Args:
+            query (str, optional): Words matched as title prefixes.
+            sort_by (str, optional): ``"title"``, ``"year"`` or
+                ``"rating"``; anything else orders by ``id``.
+            offset (int): Movies to skip.
+            limit (int, optional): Maximum number of movies.
+
+        Returns:
+            list[Movie]: The filtered and sorted movies.
+        """
+        sort_by = normalize_sort(sort_by)
+        statement = select(Movie)
+        if query:
+            statement = filter_by_title(statement, query)
+        statement = apply_keyset(statement, sort_by, None)
+        stop = None if limit is None else offset + limit
+        if stop is not None:
+            statement = statement.limit(stop)
+        movies = self._gather(
+            lambda shard: shard.read_objects(statement), self.shards
+        )
+        _, descending = keyset_columns(sort_by)
+        merged = heapq.merge(
+            *movies, key=functools.partial(sort_key, sort_by),
+            reverse=descending,
+        )
+        return list(itertools.islice(merged, offset, stop))
+
+    def fuzzy_search(self, query, limit=20, user_id=None,
+                     exclude_favorites=False):
+        """
+        Find movies whose titles resemble ``query``, typos included.
+
+        Every shard selects its candidates from its own trigram index;
+        they are scored together, so the ranking is the same as on a
+        single file.
+        """
+        grams = trigrams.trigrams(query)
+        if not grams:
+            return []
+
+        def candidates(shard):
+            postings = dict(shard.read(trigrams.frequencies(grams)))
+            return shard.read(trigrams.candidates(grams, postings))
+
+        rows = itertools.chain.from_iterable(
+            self._gather(candidates, self.shards)
+        )
+        favorite_ids = None
+        if user_id is not None:
+            favorite_ids = self._favorite_ids(user_id)
+            if exclude_favorites:
+                rows = (row for row in rows if row[0] not in favorite_ids)
+        ids = trigrams.rank(query, rows, limit)
+        movies = self._movies(ids, favorite_ids=favorite_ids)
+        return [movies[movie_id] for movie_id in ids if movie_id in movies]
+
+    def get_favorite_movies(self, user_id, sort_by=None):
+        """Return every movie the user marked as favourite."""
+        return self._favorites(user_id, sort_by, cards=False)
+
+    def get_favorite_cards(self, user_id, sort_by=None):
+        """Return the card columns of every favourite of a user."""
+        return self._favorites(user_id, sort_by, cards=True)
+
+    def _favorites(self, user_id, sort_by, cards):
+        """Load a user's favourites and sort them like the keyset order."""
+        ids = self._favorite_ids(user_id)
+        movies = list(
+            self._movies(ids, cards=cards, favorite_ids=ids).values()
+        )
+        sort_by = normalize_sort(sort_by)
+        _, descending = keyset_columns(sort_by)
+        movies.sort(
+            key=functools.partial(sort_key, sort_by), reverse=descending
+        )
+        return movies
+
+    def get_movies_page(self, query=None, sort_by=None, after=None,
+                        before=None, page_size=None, user_id=None,
+                        exclude_favorites=False):
+        """
+        Return one keyset-paginated page of the movie catalogue.
+
+        Runs the single-file page query on every shard and merges the
+        rows on the keyset order, see the module docstring. The user's
+        favourites are read from their shard first and flagged (or
+        excluded) by id.
+        """
+        return self._page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites, cards=False,
+        )
+
+    def get_movie_cards_page(self, query=None, sort_by=None, after=None,
+                             before=None, page_size=None, user_id=None,
+                             exclude_favorites=False):
+        """Return one page of the catalogue as :class:`MovieCard` rows."""
+        return self._page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites, cards=True,
+        )
+
+    def _page(self, query, sort_by, after, before, page_size, user_id,
+              exclude_favorites, cards):
+        favorite_ids = None
+        if user_id is not None:
+            favorite_ids = self._favorite_ids(user_id)
+        page_query = queries.movies_page(
+            query, sort_by, after, before, page_size,
+            exclude_favorites=exclude_favorites, cards=cards,
+            favorite_ids=favorite_ids,
+        )
+        rows = self._gather(
+            lambda shard: shard.read(page_query.statement), self.shards
+        )
+        sort_by = page_query.sort_by
+
+        def key(row):
+            score = row[-1] if sort_by == RELEVANCE else None
+            return sort_key(sort_by, row if cards else row[0], score)
+
+        _, descending = keyset_columns(sort_by)
+        merged = heapq.merge(
+            *rows, key=key, reverse=descending != page_query.backwards
+        )
+        return queries.build_page(
+            page_query,
+            list(itertools.islice(merged, page_query.page_size + 1)),
+        )
+
+    def get_top_movies(self, window="week", limit=10):
+        """
+        Return the most favourited movies of a time window.
+
+        A movie's count is spread over the shards of the users who
+        favourited it. Three rounds of per-shard reads find the exact
+        top ``limit`` (the TPUT algorithm): the top ``limit`` of every
+        shard give a lower bound ``t`` of the last place's total; a
+        movie reaching ``t`` has at least ``t / shards`` favourites in
+        one shard, so every such movie is fetched next; their exact
+        totals are summed last.
+
+        Args:
+            window (str): ``"week"`` or ``"all"``.
+            limit (int): Maximum number of movies.
+
+        Returns:
+            list[RankedMovie]: ``(movie, favorites)`` pairs, most
+            favourited first, ties to the newer movie.
+
+        Raises:
+            ValueError: If ``window`` is unknown.
+        """
+        counts = select(
+            MoviePopularity.movie_id, MoviePopularity.favorites
+        ).where(
+            MoviePopularity.week == bucket(window),
+            MoviePopularity.favorites > 0,
+        )
+
+        def total(statement):
+            totals = Counter()
+            for rows in self._gather(
+                lambda shard: shard.read(statement), self.shards
+            ):
+                for movie_id, favorites in rows:
+                    totals[movie_id] += favorites
+            return totals
+
+        totals = total(
+            counts.order_by(
+                MoviePopularity.favorites.desc(),
+                MoviePopularity.movie_id.desc(),
+            ).limit(limit)
+        )
+        if len(self.shards) > 1 and totals:
+            ranked = sorted(totals.values(), reverse=True)
+            threshold = ranked[limit - 1] if len(ranked) >= limit else 1
+            # favorites >= threshold / shards, on the rank index
+            least = -(-threshold // len(self.shards))
+            candidates = set(totals) | set(total(counts.where(
+                MoviePopularity.favorites >= least
+            )))
+            totals = total(counts.where(
+                queries.id_in(candidates, MoviePopularity.movie_id)
+            ))
+        top = sorted(totals.items(), key=lambda item: (-item[1], -item[0]))
+        top = top[:limit]
+        movies = self._movies(movie_id for movie_id, _ in top)
+        return [
+            RankedMovie(movies[movie_id], favorites)
+            for movie_id, favorites in top if movie_id in movies
+        ]
+
+    def add_user(self, name):
+        """Create and persist a new user in the shard map."""
+        with self.map.transaction() as session:
+            user = User(name=name)
+            session.add(user)
+            _bump(session, USERS)
+        signals.user_added.send(self, user=user)
+        return user
+
+    def deactivate_user(self, user_id):
+        """Soft-delete a user; ``None`` if not found."""
+        with self.map.transaction() as session:
+            user = session.get(User, user_id)
+            if user:
+                user.is_active = False
+                _bump(session, USERS, user_scope(user_id))
+        if user:
+            signals.user_deactivated.send(self, user_id=user_id)
+        return user
+
+    def add_movie(self, user_id, title, year, rating, poster):
+        """Insert a new movie into its owner's shard."""
+        number = shard_of_user(user_id, len(self.shards))
+        with self.shards[number].transaction() as session:
+            movie = Movie(
+                id=self._next_movie_id(session, number),
+                title=title,
+                year=year,
+                rating=rating,
+                poster=poster,
+                user_id=user_id,
+            )
+            session.add(movie)
+            session.flush()
+            for statement in trigrams.add_postings(movie.id, title):
+                session.execute(statement)
+            _bump(session, CATALOGUE, USERS)
+        signals.movie_added.send(self, movie=movie)
+        return movie
+
+    def update_movie(self, movie_id, title, year, rating, poster):
+        """Update an existing movie; ``None`` if not found."""
+        located = self._locate([movie_id])
+        if not located:
+            return None
+        (number,) = located
+        with self.shards[number].transaction() as session:
+            old_title = session.scalar(
+                select(Movie.title).where(Movie.id == movie_id)
+            )
+            if old_title is None:
+                return None
+            if old_title != title:
+                session.execute(trigrams.remove_postings(movie_id, old_title))
+                for statement in trigrams.add_postings(movie_id, title):
+                    session.execute(statement)
+            movie = session.execute(
+                update(Movie)
+                .where(Movie.id == movie_id)
+                .values(title=title, year=year, rating=rating, poster=poster)
+                .returning(Movie)
+            ).scalar_one()
+            _bump(session, CATALOGUE)
+        signals.movie_updated.send(self, movie=movie)
+        return movie
+
+    def delete_movie(self, movie_id):
+        """
+        Delete a movie and every favourite of it.
+
+        The movie, its favourites in its own shard and a tombstone go
+        in one transaction with the generation bump; the favourites in
+        the other shards are swept next, see :meth:`finish_deletes`.
+        If the sweep fails the movie is deleted all the same and the
+        error is raised; the tombstone makes the next sweep finish it.
+
+        Returns:
+            bool: ``True`` if the movie existed and was deleted.
+        """
+        self.finish_deletes()
+        located = self._locate([movie_id])
+        if not located:
+            return False
+        (number,) = located
+        with self.shards[number].transaction() as session:
+            session.execute(
+                delete(Favorite).where(Favorite.movie_id == movie_id)
+            )
+            title = session.scalar(
+                delete(Movie).where(Movie.id == movie_id)
+                .returning(Movie.title)
+            )
+            if title is None:
+                return False
+            session.execute(queries.forget_popularity(movie_id))
+            session.execute(trigrams.remove_postings(movie_id, title))
+            session.execute(insert(tombstone_table).values(movie_id=movie_id))
+            _bump(session, CATALOGUE, USERS, FAVORITES)
+        try:
+            self._sweep(number, [movie_id])
+        finally:
+            signals.movie_deleted.send(self, movie_id=movie_id)
+        return True
+
+    def finish_deletes(self):
+        """
+        Sweep the favourites of deleted movies left in other shards.
+
+        Completes deletions whose sweep was cut short, e.g. by a crash
+        or a locked shard; a no-op when there are none.
+
+        Returns:
+            int: Number of deletions completed.
+        """
+        pending = self._gather(
+            lambda shard: shard.read(select(tombstone_table.c.movie_id)),
+            self.shards,
+        )
+        for number, rows in enumerate(pending):
+            if rows:
+                self._sweep(number, [movie_id for (movie_id,) in rows])
+        return sum(map(len, pending))
+
+    def _sweep(self, number, movie_ids):
+        """
+        Drop the favourites and counts of deleted movies of shard
+        ``number`` from the other shards, then their tombstones.
+        """
+        def forget(shard):
+            with shard.transaction() as session:
+                dropped = session.execute(
+                    delete(Favorite)
+                    .where(queries.id_in(movie_ids, Favorite.movie_id))
+                ).rowcount
+                session.execute(
+                    delete(MoviePopularity)
+                    .where(queries.id_in(movie_ids, MoviePopularity.movie_id))
+                )
+                if dropped:
+                    _bump(session, USERS, FAVORITES)
+
+        owner = self.shards[number]
+        self._gather(
+            forget, [shard for shard in self.shards if shard is not owner]
+        )
+        with owner.transaction() as session:
+            session.execute(
+                delete(tombstone_table)
+                .where(queries.id_in(movie_ids, tombstone_table.c.movie_id))
+            )
+
+    def _drop_orphans(self, user_id, movie_ids):
+        """
+        Remove favourites just added to movies deleted meanwhile.
+
+        A favourite written after its movie's deletion was swept would
+        stay behind otherwise; checking once more after the commit
+        closes that window.
+
+        Returns:
+            set[int]: The ids whose favourite was removed again.
+        """
+        if not movie_ids:
+            return set()
+        orphans = set(movie_ids) - self._known_movie_ids(movie_ids)
+        if orphans:
+            with self._user_shard(user_id).transaction() as session:
+                for movie_id in sorted(orphans):
+                    _set_favorite(session, user_id, movie_id, False)
+                _bump(session, USERS, FAVORITES, user_scope(user_id))
+        return orphans
+
+    def toggle_favorite(self, user_id, movie_id):
+        """
+        Flip a favourite in the user's shard; ``True`` if it is one,
+        ``None`` for an unknown user or movie.
+        """
+        if not (self._user_exists(user_id)
+                and self._known_movie_ids([movie_id])):
+            return None
+        with self._user_shard(user_id).transaction() as session:
+            added = not _set_favorite(session, user_id, movie_id, False)
+            changed = not added or _set_favorite(
+                session, user_id, movie_id, True
+            )
+            if changed:
+                _bump(session, USERS, FAVORITES, user_scope(user_id))
+        if added and self._drop_orphans(user_id, [movie_id]):
+            return None
+        if changed:
+            signals.favorite_toggled.send(
+                self, user_id=user_id, movie_id=movie_id, added=added
+            )
+        return added
+
+    def set_favorites(self, user_id, add=(), remove=()):
+        """
+        Add and remove many favourites of a user in one transaction.
+
+        The movies are looked up in their shards in parallel; the
+        favourites are written in the user's shard only.
+        """
+        add, remove = set(add), set(remove)
+        if add & remove:
+            raise ValueError("A movie cannot be both added and removed.")
+        known = self._known_movie_ids(add | remove)
+        if not self._user_exists(user_id):
+            # as the guarded insert of the single file: nothing written
+            return dict.fromkeys(known, False)
+        changed = {}
+        with self._user_shard(user_id).transaction() as session:
+            for movie_ids, favorite in ((add, True), (remove, False)):
+                for movie_id in sorted(movie_ids & known):
+                    changed[movie_id] = _set_favorite(
+                        session, user_id, movie_id, favorite
+                    )
+            written = [
+                movie_id for movie_id, done in changed.items() if done
+            ]
+            if written:
+                # one generation per signal sent below
+                _bump(
+                    session, USERS, FAVORITES, user_scope(user_id),
+                    step=len(written),
+                )
+        for movie_id in self._drop_orphans(
+            user_id, [movie_id for movie_id in written if movie_id in add]
+        ):
+            changed[movie_id] = False
+            written.remove(movie_id)
+        for movie_id in written:
+            signals.favorite_toggled.send(
+                self, user_id=user_id, movie_id=movie_id,
+                added=movie_id in add,
+            )
+        return changed
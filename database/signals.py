@@ -0,0 +1,32 @@
+"""
+Signals sent by the data managers after a write has been committed.
+
+Lets caches and background jobs follow changes to the data without the
+data manager knowing about them. Receivers run synchronously in the
+writing thread, so anything slow belongs on a worker thread. Every
+signal is sent with the data manager as sender::
+
+    from database.signals import movie_added
+
+    @movie_added.connect
+    def on_movie_added(sender, movie):
+        ...
+"""
+from blinker import Namespace
+
+_signals = Namespace()
+
+#: ``user``: the new :class:`User`.
+user_added = _signals.signal("user-added")
+#: ``user_id``: the deactivated user.
+user_deactivated = _signals.signal("user-deactivated")
+#: ``movie``: the new :class:`Movie`.
+movie_added = _signals.signal("movie-added")
+#: ``user_id``, ``count``: a bulk import committed ``count`` movies.
+movies_imported = _signals.signal("movies-imported")
+#: ``movie``: the :class:`Movie` with its new values.
+movie_updated = _signals.signal("movie-updated")
+#: ``movie_id``: the deleted movie.
+movie_deleted = _signals.signal("movie-deleted")
+#: ``user_id``, ``movie_id``, ``added``: ``False`` when it was removed.
+favorite_toggled = _signals.signal("favorite-toggled")
@@ -0,0 +1,548 @@
+"""
+Columnar in-memory copy of the movie table.
+
+An optional read path for the catalogue pages of
+:class:`SQLiteDataManager` (``get_movies_page``,
+``get_movie_cards_page`` and ``get_all_movies``), enabled with
+``CATALOGUE_SNAPSHOT=1``. Numbers live in typed ``array`` columns and
+titles as interned strings, and every sort mode keeps a permutation of
+row positions in the order of :mod:`database.pagination`, so a keyset
+page is a bisection into that permutation and a walk of one page.
+
+Searches still ask the full-text index which movies match and how well
+(one FTS5 query, no join), and excluding a user's favourites reads
+their ids from the favorite primary key; ordering, seeking and slicing
+happen in memory.
+
+Writes made through the data manager the snapshot follows arrive
+through :mod:`database.signals` and are applied in place: new rows are
+appended and inserted into each permutation by bisection, updates and
+deletes unlink a row and relink it. The snapshot remembers the
+catalogue generation it reflects; if the database moved on by anything
+it has not seen (another worker, a script), the next read reloads it
+from scratch. That check is one primary key lookup; ``max_age`` lets
+reads skip it for a while, at the price of seeing other processes'
+writes that much later.
+"""
+import itertools
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+from . import queries, signals
+from .pagination import (
+    RELEVANCE,
+    clamp_page_size,
+    decode_cursor,
+    normalize_sort,
+)
+from .records import MovieRow
+from .search import fold, search_matches
+
+log = logging.getLogger(__name__)
+
+# permutations kept sorted; anything else the reads accept is "id"
+ORDERS = ("id", "title", "year", "rating")
+# deleted rows are only dropped from the columns past this fraction
+COMPACT_ABOVE = 0.25
+# a filter matching fewer rows than 1/SORT_BELOW of the catalogue is
+# sorted on its own instead of being looked up along a permutation
+SORT_BELOW = 16
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# updated_at is held as microseconds since the epoch, this for NULL
+_EPOCH = datetime(1970, 1, 1)
+_NO_TIME = -2 ** 63
+
+
+def _to_micros(value):
+    if value is None:
+        return _NO_TIME
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    if value == _NO_TIME:
+        return None
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class CatalogueSnapshot:
+    """
+    Sorted, filterable copy of the movie table held in columns.
+
+    Args:
+        read (callable): Executes a ``select()`` and returns its result,
+            e.g. :meth:`SQLiteDataManager._read`.
+        scope (str): data_version scope bumped by every movie write.
+        max_age (float): Seconds a read may rely on the last generation
+            check; ``0`` checks on every read.
+    """
+
+    def __init__(self, read, scope, max_age=0):
+        self._read = read
+        self.scope = scope
+        self.max_age = max_age
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        # None until loaded and whenever a reload is due
+        self.generation = None
+        self._reset()
+
+    def _reset(self):
+        self.ids = array("q")
+        self.years = array("h")
+        self.ratings = array("d")
+        self.user_ids = array("q")
+        self.updated = array("q")
+        self.titles = []
+        self.folded = []
+        self.posters = []
+        self.alive = bytearray()
+        self.dead = 0
+        self._orders = {}
+        self._titles_blob = None
+
+    def _sort_key(self, order):
+        # the orders of database.pagination: the id breaks ties in the
+        # direction of the sort value, so every key is unique
+        ids = self.ids
+        if order == "title":
+            titles = self.titles
+            return lambda position: (titles[position], ids[position])
+        if order == "year":
+            years = self.years
+            return lambda position: (-years[position], -ids[position])
+        if order == "rating":
+            ratings = self.ratings
+            return lambda position: (-ratings[position], -ids[position])
+        return ids.__getitem__
+
+    # -- loading ---------------------------------------------------------
+
+    def _current_generation(self):
+        row = self._read(queries.generations((self.scope,))).first()
+        return row[1] if row else 0
+
+    def _append(self, rows):
+        added = []
+        for movie_id, title, year, rating, poster, user_id, updated in rows:
+            position = len(self.ids)
+            self.ids.append(movie_id)
+            self.years.append(year)
+            self.ratings.append(rating)
+            self.user_ids.append(user_id)
+            self.updated.append(_to_micros(updated))
+            self.titles.append(sys.intern(title))
+            self.folded.append(sys.intern(fold(title)))
+            self.posters.append(poster)
+            self.alive.append(1)
+            added.append(position)
+        self._titles_blob = None
+        return added
+
+    def _sort(self):
+        positions = [p for p in range(len(self.ids)) if self.alive[p]]
+        self._orders = {
+            order: array("i", sorted(positions, key=self._sort_key(order)))
+            for order in ORDERS
+        }
+
+    def load(self):
+        """Replace the snapshot with the current contents of the table."""
+        with self._lock:
+            # read first: a write racing the load only causes a reload
+            generation = self._current_generation()
+            self._reset()
+            self._append(self._read(queries.snapshot_rows()))
+            self._sort()
+            self.generation = generation
+            self._checked = time.monotonic()
+
+    def _refresh(self):
+        """Load the snapshot, or reload it if the database moved on."""
+        now = time.monotonic()
+        if self.generation is None:
+            self.load()
+        elif now - self._checked >= self.max_age:
+            self._checked = now
+            if self._current_generation() != self.generation:
+                self.load()
+
+    def _compact(self):
+        rows = [
+            (self.ids[p], self.titles[p], self.years[p], self.ratings[p],
+             self.posters[p], self.user_ids[p],
+             _from_micros(self.updated[p]))
+            for p in range(len(self.ids)) if self.alive[p]
+        ]
+        self._reset()
+        self._append(rows)
+        self._sort()
+
+    # -- incremental updates ---------------------------------------------
+
+    def _link(self, position):
+        for order, positions in self._orders.items():
+            insort(positions, position, key=self._sort_key(order))
+
+    def _unlink(self, position):
+        for order, positions in self._orders.items():
+            key = self._sort_key(order)
+            # keys end in the unique id, so this is the row itself
+            del positions[bisect_left(positions, key(position), key=key)]
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if self.generation is None:
+                return
+            try:
+                change(*args)
+            except Exception as e:
+                log.warning("Catalogue snapshot update failed: %s", e)
+                self.generation = None
+                return
+            # every signalled write bumped the generation once; writes
+            # of other processes leave the database ahead of this count
+            # and are noticed by the next check in _refresh()
+            self.generation += 1
+
+    def _position(self, movie_id):
+        # ids never decrease with the position, so bisection finds a row;
+        # a reused id (see _add_new) follows its deleted predecessor
+        position = bisect_right(self.ids, movie_id) - 1
+        if (position >= 0 and self.ids[position] == movie_id
+                and self.alive[position]):
+            return position
+        return None
+
+    def _max_id(self):
+        for position in range(len(self.ids) - 1, -1, -1):
+            if self.alive[position]:
+                return self.ids[position]
+        return 0
+
+    def _add_new(self):
+        # SQLite hands out the largest id again once its row is deleted,
+        # which is still above every other id in the snapshot
+        rows = self._read(queries.snapshot_rows(self._max_id()))
+        for position in self._append(rows):
+            self._link(position)
+
+    def _update(self, movie_id):
+        position = self._position(movie_id)
+        if position is None:
+            return
+        # read back the committed row, updated_at included
+        row = self._read(queries.snapshot_rows(movie_id=movie_id)).first()
+        if row is None:
+            return
+        _, title, year, rating, poster, _, updated = row
+        self._unlink(position)
+        self.years[position] = year
+        self.ratings[position] = rating
+        self.updated[position] = _to_micros(updated)
+        self.titles[position] = sys.intern(title)
+        self.folded[position] = sys.intern(fold(title))
+        self.posters[position] = poster
+        self._titles_blob = None
+        self._link(position)
+
+    def _delete(self, movie_id):
+        position = self._position(movie_id)
+        if position is None:
+            return
+        self._unlink(position)
+        self.alive[position] = 0
+        self.titles[position] = self.folded[position] = ""
+        self.posters[position] = None
+        self._titles_blob = None
+        self.dead += 1
+        if self.dead > len(self.ids) * COMPACT_ABOVE:
+            self._compact()
+
+    def _receivers(self):
+        return (
+            (signals.movie_added, self._on_added),
+            (signals.movies_imported, self._on_added),
+            (signals.movie_updated, self._on_updated),
+            (signals.movie_deleted, self._on_deleted),
+        )
+
+    def connect_signals(self, sender):
+        """
+        Follow the movie writes of ``sender``.
+
+        Args:
+            sender: The data manager whose signals update the snapshot;
+                held weakly, like the receivers.
+        """
+        for signal, receiver in self._receivers():
+            signal.connect(receiver, sender=sender)
+
+    def disconnect_signals(self):
+        """Stop following the data manager's writes."""
+        for signal, receiver in self._receivers():
+            signal.disconnect(receiver)
+
+    def _on_added(self, sender, **extra):
+        self._apply(self._add_new)
+
+    def _on_updated(self, sender, movie, **extra):
+        self._apply(self._update, movie.id)
+
+    def _on_deleted(self, sender, movie_id, **extra):
+        self._apply(self._delete, movie_id)
+
+    # -- reads -----------------------------------------------------------
+
+    def row(self, position):
+        """Return the :class:`MovieRow` at ``position``."""
+        return MovieRow(
+            self.ids[position], self.titles[position], self.years[position],
+            self.ratings[position], self.posters[position],
+            self.user_ids[position],
+        )
+
+    def _title_index(self):
+        # all folded titles in one string, so a word is located with
+        # str.find instead of a loop over titles; rebuilt after writes
+        if self._titles_blob is None:
+            starts = itertools.accumulate(
+                (len(title) + 1 for title in self.folded), initial=0
+            )
+            self._titles_blob = (
+                "\n".join(self.folded), array("q", starts)
+            )
+        return self._titles_blob
+
+    def _search(self, text, word_start=False):
+        blob, starts = self._title_index()
+        found = set()
+        index = blob.find(text)
+        while index != -1:
+            before = blob[index - 1] if index else " "
+            if not (word_start and (before.isalnum() or before == "_")):
+                found.add(bisect_right(starts, index) - 1)
+            index = blob.find(text, index + 1)
+        return found
+
+    def _matching(self, query, user_id):
+        """Positions of live rows passing the filters, as a set."""
+        tokens = _TOKEN.findall(fold(query or ""))
+        if tokens:
+            candidates = None
+            for token in tokens:
+                found = self._search(token, word_start=True)
+                candidates = found if candidates is None else (
+                    candidates & found
+                )
+        elif query:
+            candidates = self._search(fold(query))
+        else:
+            candidates = None
+        if user_id is not None:
+            owned = {
+                p for p, owner in enumerate(self.user_ids) if owner == user_id
+            }
+            candidates = owned if candidates is None else candidates & owned
+        return {p for p in candidates if self.alive[p]}
+
+    def movies(self, query=None, sort_by=None, user_id=None, offset=0,
+               limit=None):
+        """
+        Filter, sort and slice the catalogue in memory.
+
+        Checks the catalogue generation first (one primary key lookup,
+        at most every ``max_age`` seconds) and reloads the snapshot if
+        it is out of date.
+
+        Args:
+            query (str, optional): Words matched as title prefixes,
+                ignoring case and accents.
+            sort_by (str, optional): ``"title"``, ``"year"`` (newest
+                first) or ``"rating"`` (best first); anything else
+                orders by ``id``. Ties are broken by ``id``, in the
+                direction of the sort.
+            user_id (int, optional): Only movies owned by this user.
+            offset (int): Matching rows to skip.
+            limit (int, optional): Maximum rows to return.
+
+        Returns:
+            list[MovieRow]: The selected rows. Unfiltered slices cost
+            only their own length; a title filter scans all titles
+            once per word.
+        """
+        with self._lock:
+            self._refresh()
+            order = sort_by if sort_by in self._orders else "id"
+            positions = self._orders[order]
+            stop = offset + limit if limit is not None else None
+            if query or user_id is not None:
+                matching = self._matching(query, user_id)
+                if len(matching) * SORT_BELOW < len(positions):
+                    # few matches: sorting them beats walking the order
+                    ordered = sorted(matching, key=self._sort_key(order))
+                else:
+                    ordered = filter(matching.__contains__, positions)
+                selected = itertools.islice(ordered, offset, stop)
+            else:
+                selected = positions[offset:stop]
+            ids, titles, years = self.ids, self.titles, self.years
+            ratings, posters, user_ids = (
+                self.ratings, self.posters, self.user_ids
+            )
+            return [
+                MovieRow(ids[p], titles[p], years[p], ratings[p], posters[p],
+                         user_ids[p])
+                for p in selected
+            ]
+
+    def _search_scores(self, query):
+        """``{movie_id: bm25}`` of the full-text matches, or ``None``."""
+        matches = search_matches(query)
+        if matches is None:
+            return None
+        return dict(self._read(matches.select()).all())
+
+    def _bound(self, sort_by, key):
+        """A cursor key in the form of :meth:`_sort_key`'s keys."""
+        if sort_by in ("year", "rating"):
+            return (-key[0], -key[1])
+        if sort_by is None:
+            return key[0]
+        return tuple(key)
+
+    def page(self, query=None, sort_by=None, after=None, before=None,
+             page_size=None, user_id=None, exclude_favorites=False):
+        """
+        Return one keyset page of the catalogue as card rows.
+
+        Arguments, ordering and cursors are those of
+        :meth:`SQLiteDataManager.get_movie_cards_page`, so a cursor from
+        either path continues on the other. Checks the catalogue
+        generation first, like :meth:`movies`.
+
+        Returns:
+            Page: ``items`` as :class:`MovieCard` rows plus the cursors.
+        """
+        scores = self._search_scores(query) if query else None
+        sort_by = normalize_sort(sort_by, searching=scores is not None)
+        page_size = clamp_page_size(page_size)
+        after_key = decode_cursor(after, sort_by)
+        before_key = None if after_key else decode_cursor(before, sort_by)
+        backwards = before_key is not None
+        favorites = frozenset()
+        if user_id is not None:
+            favorites = frozenset(
+                self._read(queries.favorite_ids(user_id)).scalars()
+            )
+
+        with self._lock:
+            self._refresh()
+            ids = self.ids
+            if scores is not None:
+                found = (self._position(movie_id) for movie_id in scores)
+                candidates = {p for p in found if p is not None}
+            elif query:
+                # no words for the index: substring, like filter_by_title
+                candidates = {
+                    p for p in self._search(fold(query)) if self.alive[p]
+                }
+            else:
+                candidates = None
+            excluded = favorites if exclude_favorites else frozenset()
+            if excluded and candidates is not None:
+                candidates = {p for p in candidates if ids[p] not in excluded}
+
+            # positions in page order, and the check a position still
+            # has to pass while walking them, if any
+            wanted = None
+            if sort_by == RELEVANCE:
+                def key(position):
+                    return (scores[ids[position]], ids[position])
+
+                ordered = sorted(candidates, key=key)
+            else:
+                key = self._sort_key(sort_by or "id")
+                ordered = self._orders[sort_by or "id"]
+                if candidates is not None:
+                    if len(candidates) * SORT_BELOW < len(ordered):
+                        # few matches: sorting them beats walking the order
+                        ordered = sorted(candidates, key=key)
+                    else:
+                        wanted = candidates.__contains__
+
+            seek = before_key if backwards else after_key
+            if backwards:
+                end = bisect_left(
+                    ordered, self._bound(sort_by, seek), key=key
+                )
+                walk = (ordered[i] for i in range(end - 1, -1, -1))
+            else:
+                start = 0 if seek is None else bisect_right(
+                    ordered, self._bound(sort_by, seek), key=key
+                )
+                walk = (ordered[i] for i in range(start, len(ordered)))
+            if wanted is not None:
+                walk = filter(wanted, walk)
+            elif excluded and candidates is None:
+                walk = (p for p in walk if ids[p] not in excluded)
+            # one row more than the page tells whether another follows
+            rows = [
+                (ids[p], self.titles[p], self.years[p], self.ratings[p],
+                 self.posters[p], _from_micros(self.updated[p]),
+                 ids[p] in favorites,
+                 scores[ids[p]] if scores is not None else None)
+                for p in itertools.islice(walk, page_size + 1)
+            ]
+
+        page_query = queries.PageQuery(
+            None, sort_by, page_size, after_key, backwards, True
+        )
+        return queries.build_page(page_query, rows)
+
+    def __len__(self):
+        return len(self.ids) - self.dead
+
+    def memory_report(self):
+        """
+        Estimate the bytes held by each part of the snapshot.
+
+        Strings shared between rows (interned titles) are counted once.
+
+        Returns:
+            dict[str, int]: Bytes per column, of the sort permutations
+            (``orders``), of the title search string once built
+            (``search``) and the ``total``.
+        """
+        def strings(values):
+            unique = {id(value): value for value in values}
+            return sys.getsizeof(values) + sum(
+                sys.getsizeof(value) for value in unique.values()
+            )
+
+        with self._lock:
+            report = {
+                "ids": sys.getsizeof(self.ids),
+                "years": sys.getsizeof(self.years),
+                "ratings": sys.getsizeof(self.ratings),
+                "user_ids": sys.getsizeof(self.user_ids),
+                "updated": sys.getsizeof(self.updated),
+                "alive": sys.getsizeof(self.alive),
+                "titles": strings(self.titles + self.folded),
+                "posters": strings(self.posters),
+                "orders": sum(
+                    sys.getsizeof(o) for o in self._orders.values()
+                ),
+                "search": sum(
+                    sys.getsizeof(part) for part in self._titles_blob or ()
+                ),
+            }
+        report["total"] = sum(report.values())
+        return report
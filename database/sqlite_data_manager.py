@@ -1,8 +1,179 @@
+import functools
+from datetime import datetime
+
 from .datamanager_interface import DataManagerInterface
-from .models import db, User, Movie, Favorite
+from .engine import read_bind_arguments
+from .models import db, User, Movie
+from .pagination import RELEVANCE
+from . import queries, signals
+from .records import MovieCard, RankedMovie, UserName, UserSummary
+from .snapshot import CatalogueSnapshot
+from . import trigrams
+from .write_queue import GroupCommitWriter
+from .search import (
+    filter_by_title,
+    pause_search_index,
+    resume_search_index,
+    search_matches,
+)
+
+# data_version scopes, see DataVersion
+CATALOGUE = "catalogue"
+USERS = "users"
+FAVORITES = "favorites"
+
+
+def user_scope(user_id):
+    """Return the data_version scope of one user's favourites."""
+    return f"user:{user_id}"
 
 
 class SQLiteDataManager(DataManagerInterface):
+    def __init__(self):
+        # optional in-memory copy of the movie table, see enable_snapshot
+        self.snapshot = None
+        # optional group commit writer, see enable_write_queue
+        self.write_queue = None
+
+    def enable_snapshot(self, max_age=0):
+        """
+        Serve the catalogue reads from a :class:`CatalogueSnapshot`.
+
+        :meth:`get_movies_page`, :meth:`get_movie_cards_page` and
+        :meth:`get_all_movies` then order and page the catalogue in
+        memory. The snapshot is loaded on first use and follows this
+        data manager's writes incrementally.
+
+        Args:
+            max_age (float): Seconds between checks for writes made by
+                other processes, see :class:`CatalogueSnapshot`.
+
+        Returns:
+            CatalogueSnapshot: The attached snapshot; call its
+            ``disconnect_signals()`` when dropping it.
+        """
+        self.snapshot = CatalogueSnapshot(self._read, CATALOGUE, max_age)
+        self.snapshot.connect_signals(self)
+        return self.snapshot
+
+    def enable_write_queue(self, app, max_batch=64, max_delay=0.002):
+        """
+        Commit the single-row writes in groups on a writer thread.
+
+        ``add_user``, ``deactivate_user``, ``add_movie``,
+        ``update_movie``, ``delete_movie``, ``toggle_favorite`` and
+        ``set_favorites`` then queue their changes and wait until the
+        group holding them is committed. ``add_movies`` keeps its own
+        batched transactions.
+
+        Args:
+            app (flask.Flask): Application whose database is written.
+            max_batch (int): Most writes committed together.
+            max_delay (float): Seconds a group waits for more writes.
+
+        Returns:
+            GroupCommitWriter: The attached writer, started on the
+            first write.
+        """
+        self.write_queue = GroupCommitWriter(app, max_batch, max_delay)
+        return self.write_queue
+
+    def _write(self, mutation, *args):
+        """
+        Run ``mutation`` and commit it, through the write queue if set.
+
+        Args:
+            mutation (callable): Makes its changes in ``db.session``
+                and returns ``(result, notify)``, where ``notify``
+                sends the signals of the change or is ``None``.
+            *args: Passed to ``mutation``.
+
+        Returns:
+            The mutation's result, once committed and signalled.
+        """
+        if self.write_queue is not None:
+            return self.write_queue.submit(mutation, *args).result()
+        try:
+            result, notify = mutation(*args)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if notify is not None:
+            notify()
+        return result
+
+    @staticmethod
+    def _read(statement):
+        """
+        Execute a read-only statement, on the read engine if configured.
+
+        Args:
+            statement (sqlalchemy.Select): Query to run.
+
+        Returns:
+            sqlalchemy.Result: The query result.
+        """
+        return db.session.execute(
+            statement, bind_arguments=read_bind_arguments(db)
+        )
+
+    def _bump(self, *scopes, step=1):
+        """
+        Increment the generation of ``scopes`` in the current transaction.
+
+        Called by every mutating method right before it commits, so the
+        new generation becomes visible together with the change. Each
+        signal sent for the change accounts for one increment. On the
+        write queue's thread the bumps of a whole group are written
+        together, see :meth:`GroupCommitWriter.defer_bump`.
+
+        Args:
+            *scopes (str): Scopes affected by the pending change.
+            step (int): Increment, one per signal the change sends.
+        """
+        if (self.write_queue is not None
+                and self.write_queue.defer_bump(scopes, step)):
+            return
+        for statement in queries.bump_generations(scopes, step=step):
+            db.session.execute(statement)
+
+    def get_generations(self, *scopes):
+        """
+        Return the current generation of each scope.
+
+        Cache keys that include these values change with every write to
+        the data they were built from.
+
+        Args:
+            *scopes (str): Scopes to look up.
+
+        Returns:
+            tuple[int, ...]: Generations in the order of ``scopes``,
+            ``0`` for a scope that was never written.
+        """
+        rows = self._read(queries.generations(scopes))
+        generations = dict(rows.all())
+        return tuple(generations.get(scope, 0) for scope in scopes)
+
+    def get_version(self, *scopes):
+        """
+        Return the generations and last change time of ``scopes``.
+
+        One primary key lookup per scope, cheap enough to run before
+        deciding whether a page has to be rendered at all.
+
+        Args:
+            *scopes (str): Scopes to look up.
+
+        Returns:
+            Version: ``generations`` as from :meth:`get_generations` and
+            ``updated``, the time of the latest change or ``None``.
+        """
+        return queries.to_version(
+            scopes, self._read(queries.versions(scopes))
+        )
+
     def get_all_users(self):
         """
         Return every user in the system.
@@ -10,7 +181,77 @@ class SQLiteDataManager(DataManagerInterface):
         Returns:
             list[User]: List of user objects (maybe empty).
         """
-        return User.query.all()
+        return self._read(db.select(User)).scalars().all()
+
+    def get_user(self, user_id):
+        """
+        Return one user by primary key.
+
+        Args:
+            user_id (int): User primary key.
+
+        Returns:
+            User | None: The user, or ``None`` if not found.
+        """
+        return db.session.get(User, user_id)
+
+    def get_user_summaries(self):
+        """
+        Return every active user with their movie and favourite counts.
+
+        Both counts are aggregated per user in subqueries and joined in
+        a single statement, so no ``Movie`` rows are loaded.
+
+        Returns:
+            list[UserSummary]: One row per active user, ordered by id.
+        """
+        statement = queries.user_summaries()
+        return [
+            UserSummary(*row) for row in self._read(statement)
+        ]
+
+    def get_user_names(self):
+        """
+        Return the id and name of every active user, for pickers.
+
+        Returns:
+            list[UserName]: Ordered by id.
+        """
+        return [UserName(*row) for row in self._read(queries.user_names())]
+
+    def get_movies(self, movie_ids):
+        """
+        Return movies by primary key.
+
+        Args:
+            movie_ids (Iterable[int]): Ids to load; unknown ones are
+                skipped.
+
+        Returns:
+            dict[int, Movie]: The found movies by id.
+        """
+        statement = queries.movies_by_id(movie_ids)
+        return {movie.id: movie for movie in self._read(statement).scalars()}
+
+    def get_movie_cards(self, movie_ids, user_id=None):
+        """
+        Return the card columns of movies by primary key.
+
+        The read-only counterpart of :meth:`get_movies` for list views:
+        plain rows instead of identity-mapped ``Movie`` instances.
+
+        Args:
+            movie_ids (Iterable[int]): Ids to load; unknown ones are
+                skipped.
+            user_id (int, optional): Set ``is_favorite`` for this user.
+
+        Returns:
+            dict[int, MovieCard]: The found movies by id.
+        """
+        statement = queries.movies_by_id(movie_ids, user_id, cards=True)
+        return {
+            row.id: row for row in map(MovieCard._make, self._read(statement))
+        }
 
     def get_user_movies(self, user_id):
         """
@@ -23,7 +264,7 @@ class SQLiteDataManager(DataManagerInterface):
             list[Movie]: The user's movie list, or an empty list if
             the user does not exist.
         """
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         return user.movies if user else []
 
     def add_user(self, name):
@@ -36,10 +277,39 @@ class SQLiteDataManager(DataManagerInterface):
         Returns:
             User: The newly created user instance.
         """
+        return self._write(self._add_user, name)
+
+    def _add_user(self, name):
+        """Mutation of :meth:`add_user`, see :meth:`_write`."""
         user = User(name=name)
         db.session.add(user)
-        db.session.commit()
-        return user
+        self._bump(USERS)
+        return user, functools.partial(
+            signals.user_added.send, self, user=user
+        )
+
+    def deactivate_user(self, user_id):
+        """
+        Soft-delete a user by clearing their ``is_active`` flag.
+
+        Args:
+            user_id (int): Primary key of the user.
+
+        Returns:
+            User | None: The deactivated user, or ``None`` if not found.
+        """
+        return self._write(self._deactivate_user, user_id)
+
+    def _deactivate_user(self, user_id):
+        """Mutation of :meth:`deactivate_user`, see :meth:`_write`."""
+        user = db.session.get(User, user_id)
+        if not user:
+            return None, None
+        user.is_active = False
+        self._bump(USERS, user_scope(user_id))
+        return user, functools.partial(
+            signals.user_deactivated.send, self, user_id=user_id
+        )
 
     def add_movie(self, user_id, title, year, rating, poster):
         """
@@ -55,6 +325,12 @@ class SQLiteDataManager(DataManagerInterface):
         Returns:
             Movie: The newly created movie instance.
         """
+        return self._write(
+            self._add_movie, user_id, title, year, rating, poster
+        )
+
+    def _add_movie(self, user_id, title, year, rating, poster):
+        """Mutation of :meth:`add_movie`, see :meth:`_write`."""
         movie = Movie(
             title=title,
             year=year,
@@ -63,8 +339,87 @@ class SQLiteDataManager(DataManagerInterface):
             user_id=user_id
         )
         db.session.add(movie)
-        db.session.commit()
-        return movie
+        db.session.flush()
+        for statement in trigrams.add_postings(movie.id, title):
+            db.session.execute(statement)
+        self._bump(CATALOGUE, USERS)
+        return movie, functools.partial(
+            signals.movie_added.send, self, movie=movie
+        )
+
+    def add_movies(self, user_id, movies, batch_size=5000,
+                   batches_per_transaction=20):
+        """
+        Insert many already validated movies with batched executemany.
+
+        Rows bypass the ORM and are written with one Core ``INSERT``
+        per batch, committing every ``batches_per_transaction`` batches
+        so a large import runs in a handful of transactions. The search
+        index is updated once per transaction instead of per row. A
+        failure rolls back the open transaction only; batches committed
+        before it stay imported.
+
+        Args:
+            user_id (int): Owner of all imported movies.
+            movies (Iterable[tuple[str, int, float, str]]): ``(title,
+                year, rating, poster)`` rows, e.g. from
+                :func:`database.validation.validate_movie`. Consumed
+                lazily, so a generator keeps memory flat.
+            batch_size (int): Rows per ``executemany`` call.
+            batches_per_transaction (int): Batches per commit.
+
+        Returns:
+            int: Number of inserted movies.
+        """
+        insert_movie = Movie.__table__.insert()
+        inserted = 0
+        committed = 0
+        batches = 0
+        batch = []
+        indexed_up_to = None
+
+        def flush():
+            nonlocal batches, indexed_up_to
+            if indexed_up_to is None:
+                self._bump(CATALOGUE, USERS)
+                indexed_up_to = pause_search_index(db.session)
+            db.session.execute(insert_movie, batch)
+            batch.clear()
+            batches += 1
+            if batches % batches_per_transaction == 0:
+                commit()
+
+        def commit():
+            nonlocal indexed_up_to, committed
+            trigrams.index_new_movies(db.session, indexed_up_to)
+            resume_search_index(db.session, indexed_up_to)
+            db.session.commit()
+            indexed_up_to = None
+            signals.movies_imported.send(
+                self, user_id=user_id, count=inserted - committed
+            )
+            committed = inserted
+
+        try:
+            for title, year, rating, poster in movies:
+                batch.append({
+                    "title": title,
+                    "year": year,
+                    "rating": rating,
+                    "poster": poster,
+                    "user_id": user_id,
+                })
+                inserted += 1
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+            if indexed_up_to is not None:
+                commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return inserted
 
     def update_movie(self, movie_id, title, year, rating, poster):
         """
@@ -80,61 +435,91 @@ class SQLiteDataManager(DataManagerInterface):
         Returns:
             Movie | None: The updated movie, or ``None`` if not found.
         """
-        movie = Movie.query.get(movie_id)
-        if movie:
-            movie.title = title
-            movie.year = year
-            movie.rating = rating
-            movie.poster = poster
-            db.session.commit()
-        return movie
+        return self._write(
+            self._update_movie, movie_id, title, year, rating, poster
+        )
+
+    def _update_movie(self, movie_id, title, year, rating, poster):
+        """Mutation of :meth:`update_movie`, see :meth:`_write`."""
+        movie = db.session.get(Movie, movie_id)
+        if not movie:
+            return None, None
+        if title != movie.title:
+            db.session.execute(
+                trigrams.remove_postings(movie_id, movie.title)
+            )
+            for statement in trigrams.add_postings(movie_id, title):
+                db.session.execute(statement)
+        movie.title = title
+        movie.year = year
+        movie.rating = rating
+        movie.poster = poster
+        self._bump(CATALOGUE)
+        return movie, functools.partial(
+            signals.movie_updated.send, self, movie=movie
+        )
 
     def search_movies(self, query="", sort_by="title"):
         """
         Search for movies matching a query and sort order.
 
         Args:
-            query (str, optional): Search substring applied to titles.
+            query (str, optional): Words matched as title prefixes.
             sort_by (str): Sorting key (
             ``"title"``,
-            ``"year"`` or
-            ``"rating"``
+            ``"year"``,
+            ``"rating"`` or
+            ``"relevance"``
             ).
 
         Returns:
             list[Movie]: Matching movies.
         """
         query = query.strip().lower()
-        movies = Movie.query
+        movies = db.select(Movie)
+        matches = search_matches(query) if query else None
 
-        if query:
-            movies = movies.filter(Movie.title.ilike(f"%{query}%"))
+        if matches is not None:
+            movies = movies.join(matches, matches.c.movie_id == Movie.id)
+        elif query:
+            movies = filter_by_title(movies, query)
 
         if sort_by == "year":
             movies = movies.order_by(Movie.year.desc())
         elif sort_by == "rating":
             movies = movies.order_by(Movie.rating.desc())
+        elif sort_by == RELEVANCE and matches is not None:
+            movies = movies.order_by(matches.c.score.asc(), Movie.id.asc())
         else:
             movies = movies.order_by(Movie.title.asc())
 
-        return movies.all()
+        return self._read(movies).scalars().all()
 
-    def get_all_movies(self, query=None, sort_by=None):
+    def get_all_movies(self, query=None, sort_by=None, offset=0,
+                       limit=None):
         """
         Return the global movie catalogue with optional filters.
 
         Args:
-            query (str, optional): Case-insensitive substring filter on the
-                movie title.
+            query (str, optional): Words matched as title prefixes.
             sort_by (str, optional): ``"title"``, ``"year"`` or ``"rating"``.
+            offset (int): Movies to skip.
+            limit (int, optional): Maximum number of movies.
+
+        With :meth:`enable_snapshot` the rows come from memory.
 
         Returns:
-            list[Movie]: The filtered and/or sorted list of movies.
+            list[Movie] | list[MovieRow]: The filtered and/or sorted list
+            of movies, as :class:`MovieRow` when served by the snapshot.
         """
-        movies_query = Movie.query
+        if self.snapshot is not None:
+            return self.snapshot.movies(
+                query, sort_by, offset=offset, limit=limit
+            )
+        movies_query = db.select(Movie)
 
         if query:
-            movies_query = movies_query.filter(Movie.title.ilike(f"%{query}%"))
+            movies_query = filter_by_title(movies_query, query)
 
         if sort_by == "title":
             movies_query = movies_query.order_by(Movie.title.asc())
@@ -142,8 +527,153 @@ class SQLiteDataManager(DataManagerInterface):
             movies_query = movies_query.order_by(Movie.year.desc())
         elif sort_by == "rating":
             movies_query = movies_query.order_by(Movie.rating.desc())
+        if offset or limit is not None:
+            movies_query = movies_query.offset(offset).limit(limit)
+
+        return self._read(movies_query).scalars().all()
+
+    def fuzzy_search(self, query, limit=20, user_id=None,
+                     exclude_favorites=False):
+        """
+        Find movies whose titles resemble ``query``, typos included.
+
+        Uses the trigram index, see :mod:`database.trigrams`; only the
+        postings of the query's rarest trigrams are read.
+
+        Args:
+            query (str): Search input, e.g. ``"titanik"``.
+            limit (int): Maximum number of movies.
+            user_id (int, optional): Set ``is_favorite`` for this user.
+            exclude_favorites (bool): Leave out ``user_id``'s favourites.
+
+        Returns:
+            list[Movie]: Most similar first; empty if nothing reaches
+            :data:`database.trigrams.THRESHOLD`.
+        """
+        grams = trigrams.trigrams(query)
+        if not grams:
+            return []
+        postings = dict(self._read(trigrams.frequencies(grams)).all())
+        rows = self._read(trigrams.candidates(
+            grams, postings,
+            exclude_user_id=user_id if exclude_favorites else None,
+        ))
+        ids = trigrams.rank(query, rows, limit)
+        movies = {
+            movie.id: movie for movie in
+            self._read(queries.movies_by_id(ids, user_id)).scalars()
+        }
+        return [movies[movie_id] for movie_id in ids if movie_id in movies]
+
+    def get_favorite_movies(self, user_id, sort_by=None):
+        """
+        Return every movie the user marked as favourite.
+
+        Args:
+            user_id (int): User whose favourites to load.
+            sort_by (str, optional): ``"title"``, ``"year"`` or
+                ``"rating"``; anything else orders by ``id``.
+
+        Returns:
+            list[Movie]: The favourites, each with ``is_favorite`` set.
+        """
+        statement = queries.favorite_movies(user_id, sort_by)
+        return self._read(statement).scalars().all()
+
+    def get_favorite_cards(self, user_id, sort_by=None):
+        """
+        Return the card columns of every favourite of a user.
+
+        Read-only counterpart of :meth:`get_favorite_movies`.
+
+        Args:
+            user_id (int): User whose favourites to load.
+            sort_by (str, optional): As for :meth:`get_favorite_movies`.
+
+        Returns:
+            list[MovieCard]: The favourites, ``is_favorite`` set.
+        """
+        statement = queries.favorite_movies(user_id, sort_by, cards=True)
+        return [MovieCard._make(row) for row in self._read(statement)]
+
+    def get_movies_page(self, query=None, sort_by=None, after=None,
+                        before=None, page_size=None, user_id=None,
+                        exclude_favorites=False):
+        """
+        Return one keyset-paginated page of the movie catalogue.
+
+        Instead of ``OFFSET`` the query seeks past the last row of the
+        previous page on ``(sort value, id)``, so the cost of a page
+        depends on ``page_size`` only and pages stay stable while rows
+        are added or removed.
+
+        Args:
+            query (str, optional): Words matched as title prefixes through
+                the full-text index.
+            sort_by (str, optional): ``"title"``, ``"year"``, ``"rating"``
+                or, while searching, ``"relevance"``; anything else orders
+                by ``id``.
+            after (str, optional): Cursor of the page to continue after.
+            before (str, optional): Cursor of the page to go back from.
+                Ignored when ``after`` is given.
+            page_size (int, optional): Rows per page, clamped to
+                ``1..MAX_PAGE_SIZE``.
+            user_id (int, optional): User whose favourites are flagged on
+                each row through ``Movie.is_favorite``.
+            exclude_favorites (bool): Leave out that user's favourites,
+                e.g. because they are listed separately.
+
+        Returns:
+            Page: ``items`` plus opaque ``next_cursor``/``prev_cursor``
+            tokens, each ``None`` at the respective end of the catalogue.
+            With :meth:`enable_snapshot` the page is chosen in memory
+            and only its movies are loaded, by primary key.
+        """
+        if self.snapshot is not None:
+            page = self.snapshot.page(
+                query, sort_by, after, before, page_size, user_id,
+                exclude_favorites,
+            )
+            ids = [card.id for card in page.items]
+            movies = {
+                movie.id: movie for movie in
+                self._read(queries.movies_by_id(ids, user_id)).scalars()
+            }
+            return page._replace(items=[
+                movies[movie_id] for movie_id in ids if movie_id in movies
+            ])
+        page_query = queries.movies_page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites,
+        )
+        rows = self._read(page_query.statement).all()
+        return queries.build_page(page_query, rows)
 
-        return movies_query.all()
+    def get_movie_cards_page(self, query=None, sort_by=None, after=None,
+                             before=None, page_size=None, user_id=None,
+                             exclude_favorites=False):
+        """
+        Return one page of the catalogue as card rows.
+
+        Same query, arguments and cursors as :meth:`get_movies_page`,
+        but only the columns a movie card shows are selected and the
+        items are plain rows, so no ORM instance is built per movie.
+
+        Returns:
+            Page: ``items`` as :class:`MovieCard` rows plus the cursors;
+            built in memory with :meth:`enable_snapshot`.
+        """
+        if self.snapshot is not None:
+            return self.snapshot.page(
+                query, sort_by, after, before, page_size, user_id,
+                exclude_favorites,
+            )
+        page_query = queries.movies_page(
+            query, sort_by, after, before, page_size, user_id,
+            exclude_favorites, cards=True,
+        )
+        rows = self._read(page_query.statement).all()
+        return queries.build_page(page_query, rows)
 
     def delete_movie(self, movie_id):
         """
@@ -156,23 +686,157 @@ class SQLiteDataManager(DataManagerInterface):
             bool: ``True`` if the movie existed and was deleted,
             ``False`` otherwise.
         """
-        movie = Movie.query.get(movie_id)
-        if movie:
-            db.session.delete(movie)
-            db.session.commit()
-            return True
-        return False
+        return self._write(self._delete_movie, movie_id)
+
+    def _delete_movie(self, movie_id):
+        """Mutation of :meth:`delete_movie`, see :meth:`_write`."""
+        movie = db.session.get(Movie, movie_id)
+        if not movie:
+            return False, None
+        db.session.delete(movie)
+        db.session.execute(queries.forget_popularity(movie_id))
+        db.session.execute(trigrams.remove_postings(movie_id, movie.title))
+        self._bump(CATALOGUE, USERS, FAVORITES)
+        return True, functools.partial(
+            signals.movie_deleted.send, self, movie_id=movie_id
+        )
+
+    def get_top_movies(self, window="week", limit=10):
+        """
+        Return the most favourited movies of a time window.
+
+        Reads the materialised counts, so the cost does not grow with
+        the number of favourites.
+
+        Args:
+            window (str): ``"week"`` for favourites added this week
+                (Monday to Sunday, UTC), ``"all"`` for all time.
+            limit (int): Maximum number of movies.
+
+        Returns:
+            list[RankedMovie]: ``(movie, favorites)`` pairs, most
+            favourited first.
+
+        Raises:
+            ValueError: If ``window`` is unknown.
+        """
+        rows = self._read(queries.top_movies(window, limit))
+        return [RankedMovie(movie, favorites) for movie, favorites in rows]
+
+    @staticmethod
+    def _set_favorite(user_id, movie_id, favorite):
+        """
+        Add or remove one favourite in the current transaction.
+
+        A single ``INSERT ... ON CONFLICT DO NOTHING`` or ``DELETE ...
+        RETURNING``, so there is no read that a concurrent request
+        could invalidate; the popularity counts follow only a row that
+        was really written.
+
+        Args:
+            user_id (int): The user.
+            movie_id (int): The movie.
+            favorite (bool): ``True`` to add, ``False`` to remove.
+
+        Returns:
+            bool: Whether a row was inserted or deleted.
+        """
+        if favorite:
+            statement = queries.add_favorite(
+                user_id, movie_id, datetime.utcnow()
+            )
+        else:
+            statement = queries.remove_favorite(user_id, movie_id)
+        created = db.session.execute(statement).first()
+        if created is None:
+            return False
+        for step_statement in queries.count_favorite(
+            movie_id, created[0], 1 if favorite else -1
+        ):
+            db.session.execute(step_statement)
+        return True
 
     def toggle_favorite(self, user_id: int, movie_id: int):
-        fav = Favorite.query.filter_by(
-            user_id=user_id,
-            movie_id=movie_id
-        ).first()
-        if fav:
-            db.session.delete(fav)
+        """
+        Add a favourite, or remove it if the user already has it.
+
+        Args:
+            user_id (int): The user.
+            movie_id (int): The movie.
+
+        Returns:
+            bool | None: ``True`` if the movie is a favourite afterwards,
+            ``None`` if the user or the movie does not exist.
+        """
+        return self._write(self._toggle_favorite, user_id, movie_id)
+
+    def _toggle_favorite(self, user_id, movie_id):
+        """Mutation of :meth:`toggle_favorite`, see :meth:`_write`."""
+        # try the delete first: its RETURNING tells whether it existed
+        if self._set_favorite(user_id, movie_id, False):
             added = False
-        else:
-            db.session.add(Favorite(user_id=user_id, movie_id=movie_id))
+        elif self._set_favorite(user_id, movie_id, True):
             added = True
-        db.session.commit()
-        return added
+        elif db.session.scalar(queries.has_favorite(user_id, movie_id)):
+            # another request added it in between: nothing was written
+            return True, None
+        else:
+            # the guarded insert found no such user or movie
+            return None, None
+        self._bump(USERS, FAVORITES, user_scope(user_id))
+        return added, functools.partial(
+            signals.favorite_toggled.send,
+            self, user_id=user_id, movie_id=movie_id, added=added,
+        )
+
+    def set_favorites(self, user_id, add=(), remove=()):
+        """
+        Add and remove many favourites of a user in one transaction.
+
+        Both operations are idempotent: adding a favourite the user has
+        or removing one they do not have changes nothing. Unknown movie
+        ids are skipped, and nothing is added for an unknown user.
+
+        Args:
+            user_id (int): The user.
+            add (Iterable[int]): Movies to mark as favourite.
+            remove (Iterable[int]): Movies to unmark.
+
+        Returns:
+            dict[int, bool]: For every known movie in ``add`` or
+            ``remove``, whether its favourite row was written.
+
+        Raises:
+            ValueError: If a movie is in both ``add`` and ``remove``.
+        """
+        add, remove = set(add), set(remove)
+        if add & remove:
+            raise ValueError("A movie cannot be both added and removed.")
+        return self._write(self._set_favorites, user_id, add, remove)
+
+    def _set_favorites(self, user_id, add, remove):
+        """Mutation of :meth:`set_favorites`, see :meth:`_write`."""
+        # read in the write transaction, not from the read engine
+        known = set(db.session.scalars(
+            queries.existing_movie_ids(add | remove)
+        ))
+        changed = {}
+        for movie_ids, favorite in ((add, True), (remove, False)):
+            for movie_id in sorted(movie_ids & known):
+                changed[movie_id] = self._set_favorite(
+                    user_id, movie_id, favorite
+                )
+        written = [movie_id for movie_id, done in changed.items() if done]
+        if written:
+            self._bump(
+                USERS, FAVORITES, user_scope(user_id), step=len(written)
+            )
+
+        def notify():
+            for movie_id in written:
+                signals.favorite_toggled.send(
+                    self, user_id=user_id, movie_id=movie_id,
+                    added=movie_id in add,
+                )
+
+        return changed, notify
@@ -0,0 +1,239 @@
+"""
+Typo-tolerant title search over a persisted trigram index.
+
+Every title word is folded like the search index, padded as
+``"  word "`` and cut into overlapping three-character pieces; the
+distinct trigrams of a title are stored as postings in
+:class:`MovieTrigram`. A misspelt word still shares most of its
+trigrams with the intended one (``titanik`` and ``titanic`` share 6 of
+10), so the search ranks titles by trigram similarity instead of
+requiring an exact match.
+
+Similarity is the Jaccard index between the query's trigrams and those
+of the best run of as many consecutive title words as the query has,
+so a short query is not penalised for matching a long title. A title
+with similarity ``t`` shares at least ``ceil(t * len(query trigrams))``
+trigrams with the query, so it contains at least one of the
+``len(query trigrams) - that + 1`` rarest ones. Only the postings of
+the rarest trigrams are read, intersected in SQL (a title must appear
+in enough of the lists to still reach the threshold), and the few
+remaining candidates are scored in Python. The work depends on how
+rare the query's trigrams are, not on the size of the catalogue.
+"""
+import functools
+import math
+import re
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from .models import Favorite, Movie, MovieTrigram
+from .search import fold
+
+# lowest similarity a title must reach to be returned
+THRESHOLD = 0.3
+# bound on the titles scored per search
+MAX_CANDIDATES = 20000
+# postings read per search beyond the minimum that finds every match
+POSTINGS_BUDGET = 100000
+# postings written per executemany when (re)indexing many movies
+BATCH = 50000
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def words(text):
+    """Return the folded words of ``text``."""
+    return _TOKEN.findall(fold(text or ""))
+
+
+@functools.lru_cache(maxsize=65536)
+def word_trigrams(word):
+    """Return the trigrams of one folded word, padded at both ends."""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigrams(text):
+    """
+    Return the distinct trigrams of every word in ``text``.
+
+    Args:
+        text (str): A title or a search query.
+
+    Returns:
+        set[str]: Empty if ``text`` has no words.
+    """
+    return set().union(*map(word_trigrams, words(text)))
+
+
+def similarity(query, title):
+    """
+    Score how well ``title`` matches a possibly misspelt ``query``.
+
+    Args:
+        query (str): Search input.
+        title (str): Movie title.
+
+    Returns:
+        float: ``0`` (nothing in common) to ``1`` (the query's words
+        appear in the title in order).
+    """
+    return _score(trigrams(query), len(words(query)), title)[0]
+
+
+def _jaccard(wanted, grams):
+    shared = len(wanted & grams)
+    return shared / (len(wanted) + len(grams) - shared)
+
+
+def _score(wanted, size, title):
+    # (best window, whole title): the second ranks "Titanic" above
+    # "Titanic Returns" for "titanik"
+    parts = [word_trigrams(word) for word in words(title)]
+    if not wanted or not parts:
+        return 0.0, 0.0
+    whole = frozenset().union(*parts)
+    if len(parts) <= size:
+        return (_jaccard(wanted, whole),) * 2
+    best = max(
+        _jaccard(wanted, frozenset().union(*parts[start:start + size]))
+        for start in range(len(parts) - size + 1)
+    )
+    return best, _jaccard(wanted, whole)
+
+
+def add_postings(movie_id, title):
+    """Build the inserts indexing one movie's title, if it has words."""
+    rows = [{"trigram": gram, "movie_id": movie_id}
+            for gram in sorted(trigrams(title))]
+    return [insert(MovieTrigram).values(rows)] if rows else []
+
+
+def remove_postings(movie_id, title):
+    """Build the delete of the postings written for ``title``."""
+    return delete(MovieTrigram).where(
+        MovieTrigram.movie_id == movie_id,
+        MovieTrigram.trigram.in_(trigrams(title)),
+    )
+
+
+def index_new_movies(connection, after_id):
+    """
+    Write the postings of every movie with an id above ``after_id``.
+
+    Used after bulk inserts that bypass the data manager's per-movie
+    indexing.
+
+    Args:
+        connection: SQLAlchemy connection or session to execute on.
+        after_id (int): Highest movie id that is already indexed.
+
+    Returns:
+        int: Postings written.
+    """
+    rows = connection.execute(
+        select(Movie.id, Movie.title).where(Movie.id > after_id)
+    )
+    statement = insert(MovieTrigram).prefix_with("OR IGNORE")
+    batch, written = [], 0
+    for movie_id, title in rows:
+        batch.extend({"trigram": gram, "movie_id": movie_id}
+                     for gram in trigrams(title))
+        if len(batch) >= BATCH:
+            connection.execute(statement, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+        written += len(batch)
+    return written
+
+
+def rebuild_trigram_index(connection):
+    """
+    Repopulate the trigram index from the movie table.
+
+    Args:
+        connection: SQLAlchemy connection or session to execute on.
+
+    Returns:
+        int: Postings written.
+    """
+    connection.execute(text("DELETE FROM movie_trigram"))
+    return index_new_movies(connection, 0)
+
+
+def frequencies(grams):
+    """Select ``(trigram, postings)`` of the given trigrams."""
+    return (
+        select(MovieTrigram.trigram, func.count())
+        .where(MovieTrigram.trigram.in_(grams))
+        .group_by(MovieTrigram.trigram)
+    )
+
+
+def candidates(grams, postings, threshold=THRESHOLD, exclude_user_id=None):
+    """
+    Select ``(id, title)`` of the movies that may reach ``threshold``.
+
+    Args:
+        grams (set[str]): Trigrams of the query.
+        postings (dict[str, int]): Posting counts from
+            :func:`frequencies`; trigrams missing from it have none.
+        threshold (float): Lowest similarity that will be kept.
+        exclude_user_id (int, optional): Leave out this user's
+            favourites.
+    """
+    needed = max(1, math.ceil(threshold * len(grams)))
+    rarest = sorted(grams, key=lambda gram: (postings.get(gram, 0), gram))
+    # any len(grams) - needed + 1 of them catch every match; each more
+    # postings list read (while cheap) raises the overlap a candidate
+    # needs with the lists read, and so cuts the titles scored in Python
+    used = len(grams) - needed + 1
+    read = sum(postings.get(gram, 0) for gram in rarest[:used])
+    while used < len(grams) and (
+            read + postings.get(rarest[used], 0) <= POSTINGS_BUDGET):
+        read += postings.get(rarest[used], 0)
+        used += 1
+    overlap = needed - (len(grams) - used)
+    statement = (
+        select(Movie.id, Movie.title)
+        .where(Movie.id.in_(
+            select(MovieTrigram.movie_id)
+            .where(MovieTrigram.trigram.in_(rarest[:used]))
+            .group_by(MovieTrigram.movie_id)
+            .having(func.count() >= overlap)
+        ))
+        .limit(MAX_CANDIDATES)
+    )
+    if exclude_user_id is not None:
+        statement = statement.where(~exists().where(
+            Favorite.user_id == exclude_user_id,
+            Favorite.movie_id == Movie.id,
+        ))
+    return statement
+
+
+def rank(query, rows, limit, threshold=THRESHOLD):
+    """
+    Score :func:`candidates` rows and keep the best.
+
+    Args:
+        query (str): Search input.
+        rows (Iterable[tuple[int, str]]): ``(id, title)`` candidates.
+        limit (int): Movies to keep.
+        threshold (float): Lowest similarity kept.
+
+    Returns:
+        list[int]: Movie ids, most similar first; ties go to the title
+        with fewer other words, then to the lower id.
+    """
+    wanted, size = trigrams(query), len(words(query))
+    scored = []
+    for movie_id, title in rows:
+        best, whole = _score(wanted, size, title)
+        if best >= threshold:
+            scored.append((-best, -whole, movie_id))
+    scored.sort()
+    return [movie_id for _, _, movie_id in scored[:limit]]
@@ -0,0 +1,63 @@
+YEAR_MIN = 1888
+YEAR_MAX = 2100
+RATING_MIN = 0
+RATING_MAX = 10
+# lengths of Movie.title and Movie.poster
+TITLE_MAX_LENGTH = 100
+POSTER_MAX_LENGTH = 500
+
+
+class MovieValidationError(ValueError):
+    """Raised when movie input fails validation; the message is user-facing."""
+
+
+def validate_movie(title, year, rating, poster):
+    """
+    Parse and check the fields of a movie.
+
+    Shared by the add/edit forms and the bulk import so every write
+    path accepts exactly the same data. Values of the wrong type, as a
+    JSON import may contain, are rejected like malformed ones.
+
+    Args:
+        title (str): Movie title.
+        year (str | int): Release year.
+        rating (str | float): Rating on a 0–10 scale.
+        poster (str): Poster image URL.
+
+    Returns:
+        tuple[str, int, float, str]: The parsed ``(title, year, rating,
+        poster)``.
+
+    Raises:
+        MovieValidationError: With the message to show the user.
+    """
+    try:
+        year = int(year)
+        rating = float(rating)
+    except (TypeError, ValueError):
+        raise MovieValidationError(
+            "Year must be a number and rating must be a valid float."
+        )
+
+    if not isinstance(title, str) or not title.strip():
+        raise MovieValidationError("Title is required.")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise MovieValidationError(
+            f"Title must be at most {TITLE_MAX_LENGTH} characters."
+        )
+    if not YEAR_MIN <= year <= YEAR_MAX:
+        raise MovieValidationError(
+            f"Please enter a valid release year ({YEAR_MIN}–{YEAR_MAX})."
+        )
+    # written this way round so NaN is rejected too
+    if not RATING_MIN <= rating <= RATING_MAX:
+        raise MovieValidationError("Rating must be between 0 and 10.")
+    if not isinstance(poster, str) or not poster.startswith("http"):
+        raise MovieValidationError("Please enter a valid poster URL.")
+    if len(poster) > POSTER_MAX_LENGTH:
+        raise MovieValidationError(
+            f"Poster URL must be at most {POSTER_MAX_LENGTH} characters."
+        )
+
+    return title, year, rating, poster
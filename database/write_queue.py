@@ -0,0 +1,231 @@
+"""
+Group commit for the data manager's writes.
+
+An optional write path for :class:`SQLiteDataManager`, enabled with
+``WRITE_QUEUE=1``. Instead of every request committing on its own, and
+paying one fsync plus a turn at SQLite's single write lock each time,
+mutations are put on a queue and a dedicated writer thread runs them in
+groups: it takes whatever has queued up, waits at most ``max_delay``
+seconds for up to ``max_batch`` mutations, runs them one after the
+other in a single transaction and commits once.
+
+Callers block on a :class:`concurrent.futures.Future` that is resolved
+only after the group's commit, so a write that returned is exactly as
+durable as before; the group only shares the cost. Each mutation runs
+inside a ``SAVEPOINT``, so one that fails (say, a duplicate user name)
+is rolled back and raises in its own caller while the rest of the group
+commits. If the commit itself fails, every caller in the group gets the
+error. The generation bumps of a group are added up and written once
+before its commit instead of once per mutation.
+
+A writer that was idle commits a lone mutation right away; it only
+waits for company while the previous group had some, so single writes
+keep their latency and bursts are grouped.
+
+Signals are sent from the writer thread after the commit, in the order
+the mutations ran, and before their callers are released, so a caller
+reads its own write from every in-memory copy that follows them.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from sqlalchemy import text
+
+from . import queries
+from .models import db
+
+log = logging.getLogger(__name__)
+
+# put on the queue by close()
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """
+    Writer thread committing queued mutations in groups.
+
+    A mutation is a callable that makes its changes in ``db.session``
+    without committing and returns ``(result, notify)``: the value for
+    the caller and a callable sending its signals once committed (or
+    ``None``). It must not commit or roll back itself.
+
+    Args:
+        app (flask.Flask): Application whose database is written; the
+            writer thread runs in its own app context.
+        max_batch (int): Most mutations committed together.
+        max_delay (float): Seconds the writer waits for more mutations
+            once the first one of a group arrived.
+    """
+
+    def __init__(self, app, max_batch=64, max_delay=0.002):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # scope -> increments of the running mutation, see defer_bump
+        self._bumps = None
+        self._last_size = 0
+        # (groups, mutations) committed so far
+        self.groups = 0
+        self.committed = 0
+
+    def start(self):
+        """Start the writer thread unless it is running."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="write-queue", daemon=True
+                )
+                self._thread.start()
+            return self._thread
+
+    def submit(self, mutation, *args):
+        """
+        Queue a mutation, starting the writer on first use.
+
+        Args:
+            mutation (callable): See the class docstring.
+            *args: Passed to ``mutation``.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the mutation's result
+            after its group was committed.
+        """
+        future = Future()
+        self.start()
+        self._queue.put((future, mutation, args))
+        return future
+
+    def defer_bump(self, scopes, step=1):
+        """
+        Count a generation bump of the running mutation for the commit.
+
+        Args:
+            scopes (Iterable[str]): Scopes to increment.
+            step (int): Increment.
+
+        Returns:
+            bool: ``False`` when not called from a mutation on the writer
+            thread; the caller has to write the bump itself.
+        """
+        if (self._bumps is None
+                or threading.current_thread() is not self._thread):
+            return False
+        for scope in scopes:
+            self._bumps[scope] += step
+        return True
+
+    def close(self, timeout=None):
+        """Commit what is queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def after_fork(self):
+        """
+        Forget the writer thread and queue inherited from the parent.
+
+        Called in a forked child, where only the forking thread exists;
+        the next :meth:`submit` starts a writer of its own.
+        """
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._bumps = None
+        self._last_size = 0
+
+    def _collect(self):
+        # block for the first mutation, then take what arrives in time
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        group = [item]
+        # nobody wrote along with the last group: do not wait for more
+        delay = self.max_delay if self._last_size > 1 else 0.0
+        deadline = time.monotonic() + delay
+        while len(group) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            group.append(item)
+        self._last_size = len(group)
+        return group
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                group = self._collect()
+                if group is None:
+                    break
+                try:
+                    self._commit(group)
+                except Exception as e:
+                    # never leave a caller waiting
+                    log.exception("Write queue group failed")
+                    for future, _, _ in group:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    db.session.close()
+
+    def _commit(self, group):
+        session = db.session
+        done = []
+        bumps = Counter()
+        try:
+            # pysqlite only opens a transaction before DML, and releasing
+            # a SAVEPOINT outside one would commit it; IMMEDIATE also
+            # takes the write lock now instead of on the first write
+            session.execute(text("BEGIN IMMEDIATE"))
+            for future, mutation, args in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._bumps = Counter()
+                try:
+                    with session.begin_nested():
+                        result, notify = mutation(*args)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                finally:
+                    mutation_bumps, self._bumps = self._bumps, None
+                bumps.update(mutation_bumps)
+                # detached with their loaded values, safe to hand to the
+                # caller's thread
+                session.expunge_all()
+                done.append((future, result, notify))
+            for scope, step in bumps.items():
+                for statement in queries.bump_generations(
+                        (scope,), step=step):
+                    session.execute(statement)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            for future, _, _ in done:
+                future.set_exception(e)
+            raise
+        self.groups += 1
+        self.committed += len(done)
+        for future, result, notify in done:
+            if notify is not None:
+                try:
+                    notify()
+                except Exception:
+                    log.exception("Signal receiver failed after commit")
+            future.set_result(result)
@@ -1,21 +1,23 @@
-from app import app
+from app import SCRIPT_CONFIG, create_app
 from database import db
-from database.models import User, Movie
+from database.models import User
+from database.migrations import upgrade
+from database.sqlite_data_manager import SQLiteDataManager
+
+app = create_app(SCRIPT_CONFIG)
 
 with app.app_context():
     db.create_all()
+    upgrade(db.engine)
 
     if not User.query.first():
-        demo_user = User(name="Admin")
-        db.session.add(demo_user)
-        db.session.commit()
-
-        movie = Movie(
-            title="Titanic",
-            year=1997,
-            rating=7.9,
-            poster="https://m.media-amazon.com/images/M/MV5BZTE2ZjE1MmYtNzhiMC00ZDZkLWEzYjAtM2M2NTM0YjMzMzAyXkEyXkFqcGc@._V1_.jpg_CR0,108,582,582_SX85_.jpg",
-            user_id=demo_user.id
+        # through the data manager, which also writes the search postings
+        data_manager = SQLiteDataManager()
+        demo_user = data_manager.add_user("Admin")
+        data_manager.add_movie(
+            demo_user.id,
+            "Titanic",
+            1997,
+            7.9,
+            "https://m.media-amazon.com/images/M/MV5BZTE2ZjE1MmYtNzhiMC00ZDZkLWEzYjAtM2M2NTM0YjMzMzAyXkEyXkFqcGc@._V1_.jpg_CR0,108,582,582_SX85_.jpg",
         )
-        db.session.add(movie)
-        db.session.commit()
\ No newline at end of file
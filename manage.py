@@ -0,0 +1,171 @@
+"""
+Maintenance commands for an existing MoviWeb database.
+
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-search-index
+    python manage.py rebuild-popularity
+    python manage.py rebuild-trigram-index
+    python manage.py import-movies --user-id 1 movies.csv
+    python manage.py export movies --format ndjson --gzip -o movies.ndjson.gz
+    python manage.py shard --shards 8 database/shards
+"""
+import argparse
+import sys
+import time
+
+from app import SCRIPT_CONFIG, create_app
+from database import db
+from database.bulk_import import FORMATS, guess_format, import_movies
+from database import export
+from database.migrations import upgrade
+from database.popularity import rebuild_popularity
+from database.search import rebuild_search_index
+from database.sharding import shard_database
+from database.trigrams import rebuild_trigram_index
+from database.sqlite_data_manager import SQLiteDataManager
+
+
+def cmd_migrate(args):
+    """Bring the database schema up to the latest migration."""
+    db.create_all()
+    version = upgrade(db.engine)
+    print(f"Database is at schema version {version}.")
+
+
+def cmd_rebuild_search_index(args):
+    """Create the full-text title index if needed and repopulate it."""
+    rebuild_search_index(db.session)
+    db.session.commit()
+    print("Search index rebuilt.")
+
+
+def cmd_rebuild_popularity(args):
+    """Recount the favourite leaderboards from the favourite table."""
+    counted = rebuild_popularity(db.session)
+    db.session.commit()
+    print(f"Favourite counts rebuilt from {counted} favourites.")
+
+
+def cmd_rebuild_trigram_index(args):
+    """Recompute the fuzzy search postings from the movie table."""
+    written = rebuild_trigram_index(db.session)
+    db.session.commit()
+    print(f"Trigram index rebuilt with {written} postings.")
+
+
+def cmd_import_movies(args):
+    """Stream a CSV/JSONL file into the movie table for one user."""
+    fmt = args.format or guess_format(args.path)
+    if fmt is None:
+        sys.exit("Cannot tell the file format, pass --format.")
+
+    started = time.perf_counter()
+    with open(args.path, "rb") as stream:
+        report = import_movies(
+            SQLiteDataManager(), args.user_id, stream, fmt,
+            batch_size=args.batch_size,
+        )
+    elapsed = time.perf_counter() - started
+
+    rate = report.imported / elapsed if elapsed else 0
+    print(
+        f"Imported {report.imported} movies in {elapsed:.1f}s "
+        f"({rate:,.0f} rows/s), rejected {report.rejected}."
+    )
+    for line, reason in report.errors:
+        print(f"  line {line}: {reason}")
+
+
+def cmd_export(args):
+    """Stream an export to a file or stdout."""
+    stream = export.export_stream(
+        args.kind, args.format, user_id=args.user_id, compress=args.gzip
+    )
+    if args.output == "-":
+        target = sys.stdout.buffer
+        for chunk in stream:
+            target.write(chunk)
+        target.flush()
+    else:
+        with open(args.output, "wb") as target:
+            for chunk in stream:
+                target.write(chunk)
+
+
+def cmd_shard(args):
+    """Copy the database into a new per-user sharded layout."""
+    started = time.perf_counter()
+    shard_database(
+        db.engine, args.directory, args.shards, batch_size=args.batch_size
+    )
+    print(f"Done in {time.perf_counter() - started:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintenance commands for an existing MoviWeb database."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser(
+        "migrate",
+        help="apply pending schema migrations",
+    )
+    migrate.set_defaults(func=cmd_migrate)
+
+    rebuild = commands.add_parser(
+        "rebuild-search-index",
+        help="create and repopulate the FTS5 title index",
+    )
+    rebuild.set_defaults(func=cmd_rebuild_search_index)
+
+    popularity = commands.add_parser(
+        "rebuild-popularity",
+        help="recompute the materialised favourite counts",
+    )
+    popularity.set_defaults(func=cmd_rebuild_popularity)
+
+    trigram = commands.add_parser(
+        "rebuild-trigram-index",
+        help="recompute the trigram index behind fuzzy search",
+    )
+    trigram.set_defaults(func=cmd_rebuild_trigram_index)
+
+    importer = commands.add_parser(
+        "import-movies",
+        help="bulk import movies from a CSV or JSON Lines file",
+    )
+    importer.add_argument("path")
+    importer.add_argument("--user-id", type=int, required=True)
+    importer.add_argument("--format", choices=FORMATS)
+    importer.add_argument("--batch-size", type=int, default=5000)
+    importer.set_defaults(func=cmd_import_movies)
+
+    exporter = commands.add_parser(
+        "export",
+        help="stream movies or favourites as CSV or NDJSON",
+    )
+    exporter.add_argument("kind", choices=export.EXPORTS)
+    exporter.add_argument("--format", choices=export.FORMATS, default="csv")
+    exporter.add_argument("--user-id", type=int)
+    exporter.add_argument("--gzip", action="store_true")
+    exporter.add_argument("-o", "--output", default="-")
+    exporter.set_defaults(func=cmd_export)
+
+    shard = commands.add_parser(
+        "shard",
+        help="copy the database into per-user shard files",
+    )
+    shard.add_argument("directory")
+    shard.add_argument("--shards", type=int, default=8)
+    shard.add_argument("--batch-size", type=int, default=5000)
+    shard.set_defaults(func=cmd_shard)
+
+    args = parser.parse_args()
+    with create_app(SCRIPT_CONFIG).app_context():
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
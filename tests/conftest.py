@@ -0,0 +1,119 @@
+"""
+Shared fixtures: apps built by :func:`create_app` on a fresh, migrated
+SQLite file per test, and a small catalogue to page through.
+"""
+import pytest
+
+from app import create_app, services
+from database import db
+from database.migrations import upgrade
+
+# (title, year, rating) of the catalogue fixture; repeated years and
+# ratings exercise the id tiebreaker of the keyset pagination
+MOVIES = [
+    ("The Dark Knight", 2008, 9.0),
+    ("The Dark Knight Rises", 2012, 8.4),
+    ("Titanic", 1997, 7.9),
+    ("Alien", 1979, 8.5),
+    ("Aliens", 1986, 8.4),
+    ("Amélie", 2001, 8.3),
+    ("Blade Runner", 1982, 8.1),
+    ("Casablanca", 1942, 8.5),
+    ("Dark City", 1998, 7.6),
+    ("Heat", 1995, 8.3),
+    ("Inception", 2010, 8.8),
+    ("Jaws", 1975, 8.1),
+    ("Memento", 2000, 8.4),
+    ("Night of the Living Dead", 1968, 7.8),
+    ("Psycho", 1960, 8.5),
+    ("Rear Window", 1954, 8.5),
+    ("Se7en", 1995, 8.6),
+    ("The Thing", 1982, 8.2),
+    ("Up", 2009, 8.3),
+    ("Vertigo", 1958, 8.2),
+    ("Whiplash", 2014, 8.5),
+    ("Zodiac", 2007, 7.7),
+]
+
+
+def build_app(path, **config):
+    """Create an app on ``path`` with the schema of a migrated database."""
+    app = create_app({
+        "TESTING": True,
+        "SECRET_KEY": "test",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+        "POSTER_CACHE": False,
+        "METRICS_ENABLED": False,
+        **config,
+    })
+    with app.app_context():
+        db.create_all(bind_key=None)
+        upgrade(db.engine, log=lambda line: None)
+    return app
+
+
+def close_app(app):
+    shared = services(app)
+    shared.close()
+    if shared.data_manager.write_queue is not None:
+        shared.data_manager.write_queue.close()
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "movies.sqlite3"
+
+
+@pytest.fixture
+def make_app(database_path):
+    """Build apps on the test's database; all are closed afterwards."""
+    apps = []
+
+    def make(**config):
+        app = build_app(database_path, **config)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        close_app(app)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def dm(app):
+    """The app's data manager, inside an app context."""
+    with app.app_context():
+        yield services(app).data_manager
+        db.session.remove()
+
+
+@pytest.fixture
+def catalogue(dm):
+    """
+    Two users and :data:`MOVIES`, owned by the first.
+
+    Returns:
+        tuple[int, int, list[int]]: Both user ids and the movie ids in
+        insertion order.
+    """
+    alice = dm.add_user("alice").id
+    bob = dm.add_user("bob").id
+    movie_ids = [
+        dm.add_movie(alice, title, year, rating, "").id
+        for title, year, rating in MOVIES
+    ]
+    return alice, bob, movie_ids
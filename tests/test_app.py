@@ -0,0 +1,135 @@
+import gc
+import os
+import weakref
+
+import pytest
+
+from app import (
+    SCRIPT_CONFIG,
+    _apps,
+    create_app,
+    init_worker,
+    services,
+    warm_up,
+)
+from database import db
+from database.models import Favorite
+from tests.conftest import build_app, close_app
+
+
+def test_secret_key_is_required(monkeypatch, tmp_path):
+    monkeypatch.delenv("SECRET_KEY", raising=False)
+    monkeypatch.chdir(tmp_path)  # no .env to read it from
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+
+
+def test_config_overrides_the_environment(monkeypatch, make_app):
+    monkeypatch.setenv("EXPLORE_PAGE_SIZE", "7")
+    monkeypatch.setenv("LEADERBOARD_SIZE", "3")
+    app = make_app(LEADERBOARD_SIZE=9)
+    assert app.config["EXPLORE_PAGE_SIZE"] == 7
+    assert app.config["LEADERBOARD_SIZE"] == 9
+
+
+def test_script_config_builds_only_the_data_manager(make_app):
+    app = make_app(**SCRIPT_CONFIG)
+    shared = services(app)
+    assert shared.data_manager.write_queue is None
+    assert shared.data_manager.snapshot is None
+    assert shared.poster_cache is None
+    assert shared.recommender is None
+    assert shared.title_index is None
+    assert shared.metrics is None
+
+
+def test_apps_have_their_own_routes_and_services(make_app):
+    first, second = make_app(), make_app()
+    assert services(first) is not services(second)
+    for app in (first, second):
+        endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+        assert {"home", "explore_movies", "autocomplete"} <= endpoints
+        assert app.test_client().get("/").status_code == 200
+
+
+def test_warm_up_leaves_no_connection_open(app, catalogue):
+    warm_up(app)
+    shared = services(app)
+    assert shared.render_version
+    assert shared.recommender.generation is not None
+    with app.app_context():
+        assert all(
+            engine.pool.checkedout() == 0 and engine.pool.checkedin() == 0
+            for engine in db.engines.values()
+        )
+
+
+def test_warm_up_tolerates_a_database_without_schema(tmp_path, caplog):
+    app = create_app({
+        "TESTING": True,
+        "SECRET_KEY": "test",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'empty.db'}",
+        **SCRIPT_CONFIG,
+    })
+    try:
+        warm_up(app)
+        assert "Warm-up queries failed" in caplog.text
+    finally:
+        close_app(app)
+
+
+def test_init_worker_forgets_the_writer_thread(make_app, catalogue):
+    alice, _, movie_ids = catalogue
+    app = make_app(WRITE_QUEUE=True)
+    with app.app_context():
+        dm = services(app).data_manager
+        dm.toggle_favorite(alice, movie_ids[0])
+        inherited = dm.write_queue._thread
+        assert inherited.is_alive()
+        init_worker(app)
+        assert dm.write_queue._thread is None
+        # the next write starts a writer of its own
+        dm.toggle_favorite(alice, movie_ids[1])
+        assert dm.write_queue._thread not in (None, inherited)
+        # stand-in for the parent's writer, gone after a real fork
+        inherited.join(0)
+
+
+def test_discarded_apps_are_not_kept(tmp_path):
+    app = build_app(tmp_path / "other.sqlite3")
+    close_app(app)
+    reference = weakref.ref(app)
+    assert app in _apps
+    del app
+    gc.collect()
+    assert reference() is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_children_write_through_their_own_queue(make_app,
+                                                       catalogue):
+    alice, _, movie_ids = catalogue
+    app = make_app(WRITE_QUEUE=True)
+    with app.app_context():
+        dm = services(app).data_manager
+        dm.toggle_favorite(alice, movie_ids[0])
+        assert dm.write_queue._thread.is_alive()
+        pid = os.fork()
+        if pid == 0:
+            # the child: the writer thread above does not exist here
+            status = 1
+            try:
+                if dm.write_queue._thread is None:
+                    dm.toggle_favorite(alice, movie_ids[1])
+                    status = 0
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        db.session.remove()
+        favourites = {
+            f.movie_id for f in db.session.query(Favorite).filter_by(
+                user_id=alice
+            )
+        }
+    assert favourites == set(movie_ids[:2])
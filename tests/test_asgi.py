@@ -0,0 +1,157 @@
+import asyncio
+import importlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("asgiref")
+
+
+@pytest.fixture(scope="module")
+def asgi():
+    with pytest.MonkeyPatch.context() as patch:
+        # importing asgi.py builds the app of the environment
+        patch.setenv("SECRET_KEY", "test")
+        return importlib.import_module("asgi")
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def scope(method, url, headers=()):
+    path, _, query = url.partition("?")
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(n.encode(), v.encode()) for n, v in headers],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 5000),
+    }
+
+
+async def call(application, method, url, body=b"", headers=()):
+    """Serve one request; return the status, headers and body messages."""
+    # the body arrives in two messages
+    incoming = [
+        {"type": "http.request", "body": body[:3], "more_body": True},
+        {"type": "http.request", "body": body[3:]},
+    ]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope(method, url, headers), receive, send)
+    start, *messages = sent
+    assert start["type"] == "http.response.start"
+    assert messages[-1]["more_body"] is False
+    return start["status"], dict(start["headers"]), messages
+
+
+def serve(application, *args, **kwargs):
+    return asyncio.run(call(application, *args, **kwargs))
+
+
+def test_pages_are_served(asgi, app, executor, catalogue):
+    adapter = asgi.ThreadPoolWsgiToAsgi(app, executor)
+    status, headers, messages = serve(adapter, "GET", "/users")
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+    assert b"alice" in b"".join(m["body"] for m in messages)
+
+
+def test_request_bodies_reach_the_app(asgi, app, executor, catalogue):
+    _, bob, movie_ids = catalogue
+    adapter = asgi.ThreadPoolWsgiToAsgi(app, executor)
+    body = json.dumps({"add": movie_ids[:2]}).encode()
+    status, _, messages = serve(
+        adapter, "POST", f"/users/{bob}/favorites", body,
+        headers=[("Content-Type", "application/json"),
+                 ("Content-Length", str(len(body)))],
+    )
+    assert status == 200
+    assert json.loads(b"".join(m["body"] for m in messages)) == {
+        "changed": movie_ids[:2], "unknown": [],
+    }
+
+
+def test_requests_run_concurrently(asgi, executor):
+    # both requests must be inside the app at once to pass the barrier
+    barrier = threading.Barrier(2)
+
+    def wsgi_app(environ, start_response):
+        barrier.wait(timeout=5)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [environ["PATH_INFO"].encode(), b"!"]
+
+    adapter = asgi.ThreadPoolWsgiToAsgi(wsgi_app, executor)
+
+    async def both():
+        return await asyncio.gather(
+            call(adapter, "GET", "/a"), call(adapter, "GET", "/b")
+        )
+
+    responses = asyncio.run(both())
+    assert [
+        [m["body"] for m in messages] for _, _, messages in responses
+    ] == [[b"/a", b"!", b""], [b"/b", b"!", b""]]
+
+
+def test_async_views_run_on_the_event_loop(asgi, make_app, executor,
+                                           catalogue):
+    pytest.importorskip("aiosqlite")
+    app = make_app(ASYNC_DATA_MANAGER=True)
+    adapter = asgi.ThreadPoolWsgiToAsgi(app, executor)
+
+    async def pages():
+        return [
+            await call(adapter, "GET", "/explore?per_page=200")
+            for _ in range(2)
+        ]
+
+    for status, _, messages in asyncio.run(pages()):
+        assert status == 200
+        assert b"Casablanca" in b"".join(m["body"] for m in messages)
+    asyncio.run(app.extensions["moviweb"].page_data.dispose())
+
+
+def test_lifespan_is_acknowledged(asgi, executor):
+    adapter = asgi.ThreadPoolWsgiToAsgi(None, executor)
+    incoming = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(adapter({"type": "lifespan"}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+def test_environ_follows_pep_3333(asgi):
+    request = scope("GET", "/app/café?q=1", headers=[
+        ("Content-Type", "text/plain"), ("X-Tag", "a"), ("X-Tag", "b"),
+    ])
+    request["root_path"] = "/app"
+    environ = asgi.build_environ(request, None)
+    assert environ["SCRIPT_NAME"] == "/app"
+    assert environ["PATH_INFO"] == "/cafÃ©"
+    assert environ["QUERY_STRING"] == "q=1"
+    assert environ["CONTENT_TYPE"] == "text/plain"
+    assert environ["HTTP_X_TAG"] == "a,b"
+    assert environ["REMOTE_ADDR"] == "127.0.0.1"
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app import run_inline
+from database.async_data_manager import (
+    AsyncSQLiteDataManager,
+    AwaitableDataManager,
+    async_url,
+)
+from database.sqlite_data_manager import CATALOGUE, FAVORITES, USERS
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+
+@pytest.fixture
+def run(database_path):
+    """Run ``test(async_dm)`` on a new event loop with its own manager."""
+    def run(test):
+        async def main():
+            manager = AsyncSQLiteDataManager(f"sqlite:///{database_path}")
+            try:
+                return await test(manager)
+            finally:
+                await manager.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def test_async_url():
+    assert async_url("sqlite:///movies.sqlite3") == (
+        "sqlite+aiosqlite:///movies.sqlite3"
+    )
+    with pytest.raises(ValueError):
+        async_url("postgresql://localhost/movies")
+
+
+def test_reads_match_the_sync_manager(dm, catalogue, run):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(bob, add=movie_ids[:3])
+
+    async def read(manager):
+        page = await manager.get_movie_cards_page(
+            sort_by="rating", page_size=5, user_id=bob,
+            exclude_favorites=True,
+        )
+        return (
+            page,
+            await manager.get_user_summaries(),
+            await manager.get_favorite_cards(bob, sort_by="title"),
+            [m.id for m in await manager.fuzzy_search("titanik")],
+            [(m.id, n) for m, n in await manager.get_top_movies("all")],
+            await manager.get_version(CATALOGUE, USERS),
+        )
+
+    page, summaries, favorites, fuzzy, top, version = run(read)
+    assert page == dm.get_movie_cards_page(
+        sort_by="rating", page_size=5, user_id=bob, exclude_favorites=True,
+    )
+    assert summaries == dm.get_user_summaries()
+    assert favorites == dm.get_favorite_cards(bob, sort_by="title")
+    assert fuzzy == [m.id for m in dm.fuzzy_search("titanik")]
+    assert top == [(m.id, n) for m, n in dm.get_top_movies("all")]
+    assert version == dm.get_version(CATALOGUE, USERS)
+
+
+def test_writes_bump_the_generations(dm, catalogue, run):
+    alice, bob, movie_ids = catalogue
+    before = dm.get_generations(CATALOGUE, FAVORITES)
+
+    async def write(manager):
+        movie = await manager.add_movie(alice, "Paprika", 2006, 7.7, "")
+        toggled = await manager.toggle_favorite(bob, movie.id)
+        unknown = await manager.toggle_favorite(bob, 9999)
+        renamed = await manager.update_movie(
+            movie.id, "Paprika (2006)", 2006, 7.7, ""
+        )
+        deleted = await manager.delete_movie(movie_ids[0])
+        return movie.id, toggled, unknown, renamed.title, deleted
+
+    movie_id, toggled, unknown, title, deleted = run(write)
+    assert (toggled, unknown, title, deleted) == (
+        True, None, "Paprika (2006)", True,
+    )
+    assert [m.id for m in dm.get_favorite_movies(bob)] == [movie_id]
+    assert dm.get_movies([movie_ids[0]]) == {}
+    assert all(
+        b > a for a, b in zip(before, dm.get_generations(CATALOGUE,
+                                                         FAVORITES))
+    )
+
+
+def test_manager_is_bound_to_one_event_loop(database_path, catalogue):
+    manager = AsyncSQLiteDataManager(f"sqlite:///{database_path}")
+
+    async def first():
+        await manager.get_user_names()
+        await manager.dispose()
+
+    asyncio.run(first())
+    with pytest.raises(RuntimeError):
+        asyncio.run(manager.get_user_names())
+
+
+def test_awaitable_manager_runs_inline(dm, catalogue):
+    awaitable = AwaitableDataManager(dm)
+    names = run_inline(awaitable.get_user_names())
+    assert [user.name for user in names] == ["alice", "bob"]
+
+    async def sleeps():
+        await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError):
+        run_inline(sleeps())
@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import text
+
+from app import services
+from database import db
+from database.autocomplete import TitleIndex, normalize, suffixes
+from database.sqlite_data_manager import CATALOGUE, SQLiteDataManager
+
+
+@pytest.fixture
+def index(app, dm):
+    """A built index following ``dm``, reading like the app's."""
+    def read(statement):
+        with app.app_context():
+            return db.session.execute(statement).all()
+
+    index = TitleIndex(read, CATALOGUE, max_results=3, scan_limit=2,
+                       max_age=0)
+    index.connect_signals(dm)
+    yield index
+    index.disconnect_signals()
+
+
+def titles(suggestions):
+    return [suggestion.title for suggestion in suggestions]
+
+
+def brute_force(index, prefix, limit):
+    """The best ``limit`` movies for ``prefix``, from the titles."""
+    key = normalize(prefix)
+    found = [
+        movie_id for movie_id, (title, _, _) in index.movies.items()
+        if any(suffix.startswith(key) for suffix in suffixes(title))
+    ]
+    found.sort(key=lambda i: (-index.movies[i][2], -i))
+    return found[:limit]
+
+
+def test_titles_are_normalised_per_word():
+    assert normalize("  Amélie: Le Fabuleux  ") == "amelie le fabuleux"
+    assert suffixes("Frozen Heart: Origins") == [
+        "frozen heart origins", "heart origins", "origins",
+    ]
+
+
+def test_first_call_starts_the_build(index, catalogue):
+    assert index.complete("dark") is None
+    index.load_in_background().join(5)
+    assert titles(index.complete("dark")) == [
+        "The Dark Knight", "The Dark Knight Rises", "Dark City",
+    ]
+
+
+def test_prefixes_match_word_starts(index, catalogue):
+    index.load()
+    assert titles(index.complete("knight r")) == ["The Dark Knight Rises"]
+    assert titles(index.complete("AMÉ")) == ["Amélie"]
+    assert index.complete("ark") == []
+    assert index.complete("   ") == []
+    # limits above max_results are capped
+    assert len(index.complete("t", limit=50)) == 3
+    assert len(index.complete("t", limit=1)) == 1
+
+
+def test_writes_keep_the_ranked_prefixes_exact(index, dm, catalogue):
+    alice, _, movie_ids = catalogue
+    index.load()
+    assert index._top, "scan_limit=2 ranks the short prefixes"
+    generation = index.generation
+    dm.add_movie(alice, "The Terminator", 1984, 9.5, "")
+    dm.update_movie(movie_ids[0], "Knight and Day", 2010, 6.3, "")
+    dm.delete_movie(movie_ids[10])
+    assert index.generation == generation + 3
+    for prefix in ("t", "th", "the", "d", "k", "kn", "i", "a", "z"):
+        assert [s.id for s in index.complete(prefix)] == brute_force(
+            index, prefix, 3
+        ), prefix
+
+
+def test_imports_and_other_writers_rebuild_the_index(app, index, dm,
+                                                     catalogue):
+    alice, _, _ = catalogue
+    index.load()
+    dm.add_movies(alice, [("Paprika", 2006, 7.7, "")])
+    # an import is too large to patch in: the next read rebuilds
+    assert index.complete("papr") == []
+    index._loader.join(5)
+    assert titles(index.complete("papr")) == ["Paprika"]
+
+    with app.app_context():
+        SQLiteDataManager().add_movie(alice, "Perfect Blue", 1997, 8.0, "")
+    # answered from the current index while it rebuilds
+    assert index.complete("perf") == []
+    index._loader.join(5)
+    assert titles(index.complete("perf")) == ["Perfect Blue"]
+    assert len(index) == len(index.movies)
+
+
+def test_route_uses_the_index(client, app, catalogue):
+    title_index = services(app).title_index
+    client.get("/autocomplete?q=dark")
+    title_index.load_in_background().join(5)
+    response = client.get("/autocomplete?q=dark&limit=2")
+    assert response.json == {"suggestions": [
+        {"id": 1, "title": "The Dark Knight", "year": 2008, "rating": 9.0},
+        {"id": 2, "title": "The Dark Knight Rises", "year": 2012,
+         "rating": 8.4},
+    ]}
+    assert response.cache_control.max_age == 60
+
+
+def test_route_falls_back_to_the_search_index(make_app, catalogue):
+    app = make_app(AUTOCOMPLETE=False, AUTOCOMPLETE_MAX_RESULTS=2)
+    client = app.test_client()
+    assert services(app).title_index is None
+    response = client.get("/autocomplete?q=the")
+    assert [s["title"] for s in response.json["suggestions"]] == [
+        "The Dark Knight", "The Dark Knight Rises",
+    ]
+    assert client.get("/autocomplete?q=").json == {"suggestions": []}
+    with app.app_context():
+        db.session.execute(text("DELETE FROM movie"))
+        db.session.commit()
+    assert client.get("/autocomplete?q=the").json == {"suggestions": []}
@@ -0,0 +1,43 @@
+"""ETags of /explore and /users."""
+import pytest
+
+
+def revalidate(client, url):
+    """GET ``url`` and revalidate it; return the second status."""
+    etag = client.get(url).headers["ETag"]
+    return etag, client.get(url, headers={"If-None-Match": etag})
+
+
+@pytest.mark.parametrize("url", ["/explore", "/explore?user_id=2",
+                                 "/users"])
+def test_unchanged_pages_are_not_modified(client, catalogue, url):
+    etag, response = revalidate(client, url)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_new_movie_changes_the_etag_and_the_page(client, dm, catalogue):
+    alice, _, _ = catalogue
+    etag = client.get("/explore").headers["ETag"]
+    dm.add_movie(alice, "Paprika", 2006, 7.7, "")
+    response = client.get("/explore?per_page=200",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "Paprika" in response.get_data(as_text=True)
+
+
+def test_own_favourite_changes_the_user_page(client, dm, catalogue):
+    _, bob, movie_ids = catalogue
+    url = f"/explore?user_id={bob}"
+    etag = client.get(url).headers["ETag"]
+    dm.toggle_favorite(bob, movie_ids[0])
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_new_user_changes_the_users_page(client, dm, catalogue):
+    etag = client.get("/users").headers["ETag"]
+    dm.add_user("carol")
+    response = client.get("/users", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "carol" in response.get_data(as_text=True)
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import services
+from database import db
+from database.engine import READ_BIND, load_profile
+from tests.conftest import build_app, close_app
+
+
+def pragma(name):
+    return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_production_profile_sets_its_pragmas(make_app):
+    app = make_app(DATABASE_PROFILE="production")
+    with app.app_context():
+        assert pragma("journal_mode") == "wal"
+        assert pragma("busy_timeout") == 5000
+        # NORMAL
+        assert pragma("synchronous") == 1
+        assert app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] == 5
+
+
+def test_default_profile_keeps_sqlite_defaults(app):
+    with app.app_context():
+        assert pragma("journal_mode") == "delete"
+        assert app.config["SQLITE_PRAGMAS"] == {}
+
+
+def test_environment_overrides_single_values(monkeypatch):
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "1234")
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "2")
+    profile = load_profile("production")
+    assert profile["pragmas"]["busy_timeout"] == "1234"
+    assert profile["pragmas"]["journal_mode"] == "WAL"
+    assert profile["pool"]["pool_size"] == 2
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        load_profile("fastest")
+
+
+def test_read_bind_follows_the_configured_database(make_app,
+                                                   database_path):
+    # regression: the read bind was built from DATABASE_URL, so it
+    # opened another database than the one passed to create_app()
+    app = make_app(DATABASE_READ_ENGINE=True)
+    with app.app_context():
+        engine = db.engines[READ_BIND]
+        assert engine.url.database == str(database_path)
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("DELETE FROM user"))
+
+
+def test_reads_use_the_read_engine(make_app, catalogue):
+    app = make_app(DATABASE_READ_ENGINE=True)
+    statements = []
+    with app.app_context():
+        event.listen(
+            db.engines[READ_BIND], "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+        summaries = services(app).data_manager.get_user_summaries()
+    assert [s.name for s in summaries] == ["alice", "bob"]
+    assert statements
+
+
+def test_writes_read_their_own_transaction(make_app, tmp_path):
+    # regression: set_favorites looked the movies up on the read
+    # engine, which may lag behind the database it writes to
+    stale = build_app(tmp_path / "replica.sqlite3")
+    close_app(stale)
+    app = make_app(
+        DATABASE_READ_ENGINE=True,
+        DATABASE_READ_URL=f"sqlite:///{tmp_path / 'replica.sqlite3'}",
+    )
+    with app.app_context():
+        dm = services(app).data_manager
+        user_id = dm.add_user("alice").id
+        movie_id = dm.add_movie(user_id, "Heat", 1995, 8.3, "").id
+        assert dm.set_favorites(user_id, add=[movie_id]) == {movie_id: True}
+        db.session.remove()
@@ -0,0 +1,62 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from database.export import export_stream
+from tests.conftest import MOVIES
+
+
+def test_movies_as_csv(client, catalogue):
+    response = client.get("/export/movies.csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == (
+        "attachment; filename=movies.csv"
+    )
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["id", "title", "year", "rating", "poster", "user_id"]
+    assert [row[1] for row in rows[1:]] == [title for title, _, _ in MOVIES]
+
+
+def test_favourites_of_one_user_as_gzipped_ndjson(client, dm, catalogue):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:1])
+    dm.set_favorites(bob, add=movie_ids[1:3])
+    response = client.get(f"/export/favorites.ndjson?user_id={bob}&gzip=1")
+    assert response.mimetype == "application/gzip"
+    assert response.headers["Content-Disposition"].endswith(
+        f"user{bob}-favorites.ndjson.gz"
+    )
+    lines = gzip.decompress(response.data).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(r["user_id"], r["movie_id"]) for r in records] == [
+        (bob, movie_ids[1]), (bob, movie_ids[2]),
+    ]
+    # timestamps are written as ISO 8601
+    assert "T" in records[0]["created"]
+
+
+def test_unknown_exports_are_404(client):
+    assert client.get("/export/users.csv").status_code == 404
+    assert client.get("/export/movies.xml").status_code == 404
+
+
+def test_stream_yields_a_chunk_per_batch(dm, catalogue):
+    stream = export_stream("movies", "ndjson", batch_size=5)
+    chunks = list(stream)
+    assert len(chunks) == -(-len(MOVIES) // 5)
+    assert sum(chunk.count(b"\n") for chunk in chunks) == len(MOVIES)
+    compressed = b"".join(
+        export_stream("movies", "ndjson", compress=True, batch_size=5)
+    )
+    assert gzip.decompress(compressed) == b"".join(chunks)
+
+
+def test_stream_rejects_unknown_arguments():
+    with pytest.raises(ValueError):
+        export_stream("users", "csv")
+    with pytest.raises(ValueError):
+        export_stream("movies", "xml")
@@ -0,0 +1,102 @@
+import pytest
+from sqlalchemy import func, select
+
+from database import db
+from database.models import DataVersion, Favorite, MoviePopularity
+from database.popularity import ALL_TIME
+
+
+def counts():
+    return tuple(
+        db.session.scalar(select(func.count()).select_from(model))
+        for model in (Favorite, MoviePopularity, DataVersion)
+    )
+
+
+def all_time(movie_id):
+    return db.session.scalar(
+        select(MoviePopularity.favorites).where(
+            MoviePopularity.week == ALL_TIME,
+            MoviePopularity.movie_id == movie_id,
+        )
+    )
+
+
+def test_toggle_adds_and_removes(dm, catalogue):
+    _, bob, movie_ids = catalogue
+    assert dm.toggle_favorite(bob, movie_ids[0]) is True
+    assert [m.id for m in dm.get_favorite_movies(bob)] == [movie_ids[0]]
+    assert all_time(movie_ids[0]) == 1
+    assert dm.toggle_favorite(bob, movie_ids[0]) is False
+    assert dm.get_favorite_movies(bob) == []
+    assert all_time(movie_ids[0]) == 0
+
+
+def test_set_favorites_skips_unknown_movies(dm, catalogue):
+    _, bob, movie_ids = catalogue
+    changed = dm.set_favorites(bob, add=[movie_ids[0], 9999])
+    assert changed == {movie_ids[0]: True}
+    assert dm.set_favorites(bob, add=[movie_ids[0]]) == {
+        movie_ids[0]: False
+    }
+    with pytest.raises(ValueError):
+        dm.set_favorites(bob, add=[1], remove=[1])
+
+
+@pytest.mark.parametrize("unknown", ["movie", "user"])
+def test_toggle_of_unknown_ids_writes_nothing(dm, catalogue, unknown):
+    # regression: favourites, popularity rows and user:<id> generations
+    # were written for ids that do not exist
+    _, bob, movie_ids = catalogue
+    user_id, movie_id = (bob, 9999) if unknown == "movie" else (
+        999, movie_ids[0]
+    )
+    before = counts()
+    assert dm.toggle_favorite(user_id, movie_id) is None
+    assert counts() == before
+
+
+def test_set_favorites_of_unknown_user_writes_nothing(dm, catalogue):
+    _, _, movie_ids = catalogue
+    before = counts()
+    assert dm.set_favorites(999, add=movie_ids[:2]) == {
+        movie_ids[0]: False, movie_ids[1]: False,
+    }
+    assert counts() == before
+
+
+@pytest.mark.parametrize("accept", ["text/html", "application/json"])
+def test_route_answers_unknown_ids_with_404(client, dm, catalogue, accept):
+    _, bob, movie_ids = catalogue
+    before = counts()
+    for user_id, movie_id in ((bob, 9999), (999, movie_ids[0])):
+        response = client.post(
+            f"/favorite/{movie_id}", data={"user_id": user_id},
+            headers={"Accept": accept},
+        )
+        assert response.status_code == 404
+    assert counts() == before
+    assert [u.favorite_count for u in dm.get_user_summaries()] == [0, 0]
+
+
+def test_route_toggles_as_json(client, catalogue):
+    _, bob, movie_ids = catalogue
+    url = f"/favorite/{movie_ids[0]}"
+    headers = {"Accept": "application/json"}
+    response = client.post(url, data={"user_id": bob}, headers=headers)
+    assert response.json == {"movie_id": movie_ids[0], "favorite": True}
+    response = client.post(url, data={"user_id": bob}, headers=headers)
+    assert response.json["favorite"] is False
+    assert client.post(url, headers=headers).status_code == 400
+
+
+def test_bulk_route_reports_unknown_ids(client, catalogue):
+    _, bob, movie_ids = catalogue
+    response = client.post(
+        f"/users/{bob}/favorites", json={"add": [movie_ids[0], 9999]}
+    )
+    assert response.json["changed"] == [movie_ids[0]]
+    assert response.json["unknown"] == [9999]
+    assert client.post(
+        "/users/999/favorites", json={"add": [movie_ids[0]]}
+    ).status_code == 404
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import func, select
+
+from app import services
+from database import db
+from database.models import MovieTrigram
+from database.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from database.trigrams import similarity, trigrams
+from tests.conftest import build_app, close_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def titles(movies):
+    return [movie.title for movie in movies]
+
+
+def test_misspelt_titles_are_found(dm, catalogue):
+    assert titles(dm.fuzzy_search("titanik"))[:1] == ["Titanic"]
+    assert titles(dm.fuzzy_search("dark nite"))[:2] == [
+        "The Dark Knight", "The Dark Knight Rises"
+    ]
+    assert dm.fuzzy_search("zzzz qqqq") == []
+
+
+def test_similarity_prefers_closer_titles():
+    assert similarity("titanik", "Titanic") > similarity("titanik", "Heat")
+    assert similarity("Amelie", "Amélie") == 1
+
+
+def test_postings_follow_updates_and_deletes(dm, catalogue):
+    _, _, movie_ids = catalogue
+    dm.update_movie(movie_ids[2], "Poseidon", 2006, 5.6, "")
+    assert "Titanic" not in titles(dm.fuzzy_search("titanik"))
+    assert titles(dm.fuzzy_search("posiedon"))[:1] == ["Poseidon"]
+    dm.delete_movie(movie_ids[2])
+    assert db.session.scalar(
+        select(func.count()).select_from(MovieTrigram)
+        .where(MovieTrigram.movie_id == movie_ids[2])
+    ) == 0
+
+
+def test_bulk_imports_are_indexed(dm, catalogue):
+    alice, _, _ = catalogue
+    dm.add_movies(alice, [("Spirited Away", 2001, 8.6, "")], batch_size=1)
+    assert titles(dm.fuzzy_search("spirted awya"))[:1] == ["Spirited Away"]
+
+
+def test_favourites_can_be_left_out(dm, catalogue):
+    _, bob, movie_ids = catalogue
+    dm.toggle_favorite(bob, movie_ids[2])
+    assert "Titanic" not in titles(dm.fuzzy_search(
+        "titanik", user_id=bob, exclude_favorites=True
+    ))
+
+
+def test_explore_fuzzy_route(client, catalogue):
+    body = client.get("/explore?q=titanik&fuzzy=1").get_data(as_text=True)
+    assert "Titanic" in body
+
+
+def test_explore_clamps_the_page_size(app, client, catalogue, monkeypatch):
+    # regression: the fuzzy branch passed per_page through unclamped
+    limits = []
+    data_manager = services(app).data_manager
+    search = data_manager.fuzzy_search
+
+    def fuzzy_search(query, limit=20, **kwargs):
+        limits.append(limit)
+        return search(query, limit, **kwargs)
+
+    monkeypatch.setattr(data_manager, "fuzzy_search", fuzzy_search)
+    client.get("/explore?q=titanik&fuzzy=1&per_page=100000")
+    client.get("/explore?q=titanik&fuzzy=1&per_page=-5")
+    assert limits == [MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE]
+
+
+def test_init_db_seeds_an_indexed_movie(tmp_path):
+    # regression: the demo movie was added through the ORM, bypassing
+    # the trigram postings, so fuzzy search missed it on a fresh install
+    path = tmp_path / "fresh.sqlite3"
+    env = dict(
+        os.environ, DATABASE_URL=f"sqlite:///{path}", SECRET_KEY="test"
+    )
+    subprocess.run(
+        [sys.executable, "init_db.py"], cwd=ROOT, env=env, check=True,
+        capture_output=True,
+    )
+    app = build_app(path)
+    try:
+        with app.app_context():
+            assert db.session.scalar(
+                select(func.count()).select_from(MovieTrigram)
+            ) == len(trigrams("Titanic"))
+            found = services(app).data_manager.fuzzy_search("titanik")
+            assert titles(found) == ["Titanic"]
+    finally:
+        close_app(app)
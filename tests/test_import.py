@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+
+from database.bulk_import import import_movies
+from database.validation import MovieValidationError, validate_movie
+
+POSTER = "https://example.com/poster.jpg"
+
+
+def upload(client, user_id, content, filename, **form):
+    return client.post(
+        f"/users/{user_id}/import",
+        data={"file": (io.BytesIO(content.encode()), filename), **form},
+        content_type="multipart/form-data",
+    )
+
+
+def jsonl(*records):
+    return "".join(
+        (record if isinstance(record, str) else json.dumps(record)) + "\n"
+        for record in records
+    )
+
+
+def test_valid_fields_are_parsed():
+    assert validate_movie("Heat", "1995", "8.3", POSTER) == (
+        "Heat", 1995, 8.3, POSTER
+    )
+
+
+@pytest.mark.parametrize("title, year, rating, poster", [
+    ("", 2000, 5, POSTER),
+    ("   ", 2000, 5, POSTER),
+    (["x"], 2000, 5, POSTER),
+    (42, 2000, 5, POSTER),
+    ("x" * 101, 2000, 5, POSTER),
+    ("Heat", "soon", 5, POSTER),
+    ("Heat", 1700, 5, POSTER),
+    ("Heat", 2000, "nan", POSTER),
+    ("Heat", 2000, 11, POSTER),
+    ("Heat", 2000, 5, "ftp://example.com/x.jpg"),
+    ("Heat", 2000, 5, ["http://example.com"]),
+    ("Heat", 2000, 5, "https://" + "x" * 500),
+])
+def test_invalid_fields_are_rejected(title, year, rating, poster):
+    with pytest.raises(MovieValidationError):
+        validate_movie(title, year, rating, poster)
+
+
+def test_jsonl_upload_reports_rejected_rows(client, dm, catalogue):
+    _, bob, _ = catalogue
+    content = jsonl(
+        {"title": "Paprika", "year": 2006, "rating": 7.7,
+         "poster": POSTER},
+        "not json",
+        # regression: a non-string title passed validation and failed
+        # the insert with a 500
+        {"title": ["x"], "year": 2000, "rating": 5, "poster": POSTER},
+        {"title": "x" * 101, "year": 2000, "rating": 5, "poster": POSTER},
+        {"title": "Perfect Blue", "year": 1997, "rating": 8.0,
+         "poster": POSTER},
+        ["a", "list"],
+    )
+    response = upload(client, bob, content, "movies.jsonl")
+    assert response.status_code == 200
+    report = response.json
+    assert report["imported"] == 2
+    assert report["rejected"] == 4
+    assert [error["line"] for error in report["errors"]] == [2, 3, 4, 6]
+    assert {m.title for m in dm.get_user_movies(bob)} == {
+        "Paprika", "Perfect Blue"
+    }
+
+
+def test_csv_upload(client, dm, catalogue):
+    _, bob, _ = catalogue
+    content = (
+        "title,year,rating,poster\n"
+        f"Paprika,2006,7.7,{POSTER}\n"
+        f",2006,7.7,{POSTER}\n"
+    )
+    report = upload(client, bob, content, "movies.csv").json
+    assert (report["imported"], report["rejected"]) == (1, 1)
+    assert report["errors"] == [{"line": 3, "reason": "Title is required."}]
+    assert [m.title for m in dm.get_user_movies(bob)] == ["Paprika"]
+
+
+def test_upload_errors(client, catalogue):
+    _, bob, _ = catalogue
+    assert upload(client, bob, "", "movies.txt").status_code == 400
+    assert upload(
+        client, bob, "", "movies.txt", format="xml"
+    ).status_code == 400
+    assert client.post(f"/users/{bob}/import").status_code == 400
+    assert upload(client, 999, "", "movies.csv").status_code == 404
+
+
+def test_rows_are_inserted_in_batches(dm, catalogue):
+    _, bob, _ = catalogue
+    records = [
+        {"title": f"Movie {number}", "year": 2000, "rating": 5,
+         "poster": POSTER}
+        for number in range(7)
+    ]
+    report = import_movies(
+        dm, bob, io.StringIO(jsonl(*records)), "jsonl", batch_size=3
+    )
+    assert (report.imported, report.rejected) == (7, 0)
+    assert len(dm.get_user_movies(bob)) == 7
+    with pytest.raises(ValueError):
+        import_movies(dm, bob, io.StringIO(""), "xml")
@@ -0,0 +1,100 @@
+import logging
+import re
+
+import pytest
+
+from app import services
+from database.metrics import Registry
+
+
+@pytest.fixture
+def measured(make_app, catalogue):
+    return make_app(METRICS_ENABLED=True)
+
+
+def scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    return dict(
+        line.rsplit(" ", 1) for line in response.get_data(as_text=True)
+        .splitlines() if not line.startswith("#")
+    )
+
+
+def test_server_timing_reports_queries_and_templates(measured):
+    header = measured.test_client().get("/explore").headers["Server-Timing"]
+    match = re.fullmatch(
+        r'db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=[\d.]+, '
+        r"total;dur=[\d.]+",
+        header,
+    )
+    assert match and int(match.group(1)) > 0
+
+
+def test_metrics_count_requests_queries_and_methods(measured):
+    client = measured.test_client()
+    client.get("/explore")
+    client.get("/explore")
+    samples = scrape(client)
+    request = 'route="/explore",method="GET"'
+    assert samples[f'moviweb_requests_total{{{request},status="200"}}'] == "2"
+    assert samples[
+        f'moviweb_request_duration_seconds_count{{{request}}}'
+    ] == "2"
+    assert samples[
+        f'moviweb_request_duration_seconds_bucket{{{request},le="+Inf"}}'
+    ] == "2"
+    assert int(samples["moviweb_sql_queries_total"]) > 0
+    assert samples[
+        'moviweb_datamanager_calls_total{method="get_movie_cards_page"}'
+    ] == "1"
+    # the second page came from the response cache
+    assert samples["moviweb_response_cache_hits_total"] == "1"
+
+
+def test_data_manager_errors_are_counted(measured):
+    data_manager = services(measured).data_manager
+    with measured.app_context(), pytest.raises(ValueError):
+        data_manager.set_favorites(1, add=[1], remove=[1])
+    samples = scrape(measured.test_client())
+    assert samples[
+        'moviweb_datamanager_errors_total{method="set_favorites"}'
+    ] == "1"
+
+
+def test_slow_queries_are_logged(make_app, caplog):
+    app = make_app(METRICS_ENABLED=True, SLOW_QUERY_MS=1e-6)
+    with caplog.at_level(logging.WARNING, logger="moviweb.sql.slow"):
+        app.test_client().get("/users")
+    assert any("FROM user" in r.getMessage() for r in caplog.records)
+    samples = scrape(app.test_client())
+    assert int(samples["moviweb_sql_slow_queries_total"]) > 0
+
+
+def test_slow_query_log_can_be_turned_off(make_app, caplog):
+    app = make_app(METRICS_ENABLED=True, SLOW_QUERY_MS=0)
+    with caplog.at_level(logging.WARNING, logger="moviweb.sql.slow"):
+        app.test_client().get("/users")
+    assert not caplog.records
+
+
+def test_disabled_metrics(client):
+    assert client.get("/metrics").status_code == 404
+    assert "Server-Timing" not in client.get("/users").headers
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram(
+        "latency", "Latency.", ("route",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "/")
+    assert registry.render().splitlines()[2:] == [
+        'latency_bucket{route="/",le="0.1"} 1',
+        'latency_bucket{route="/",le="1.0"} 2',
+        'latency_bucket{route="/",le="+Inf"} 3',
+        'latency_sum{route="/"} 5.55',
+        'latency_count{route="/"} 3',
+    ]
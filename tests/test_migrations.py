@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from database.migrations import MIGRATIONS, get_schema_version, upgrade
+from database.trigrams import trigrams
+
+LATEST = MIGRATIONS[-1][0]
+
+# the tables of a database created before the first migration
+LEGACY_SCHEMA = (
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, '
+    "name VARCHAR(100) NOT NULL UNIQUE, is_active BOOLEAN)",
+    "CREATE TABLE movie (id INTEGER PRIMARY KEY, "
+    "title VARCHAR(100) NOT NULL, year INTEGER NOT NULL, "
+    "rating FLOAT NOT NULL, poster VARCHAR(500), favorite BOOLEAN, "
+    'user_id INTEGER NOT NULL REFERENCES "user" (id))',
+    'CREATE TABLE favorite (user_id INTEGER NOT NULL REFERENCES "user" '
+    "(id), movie_id INTEGER NOT NULL REFERENCES movie (id), "
+    "created DATETIME, PRIMARY KEY (user_id, movie_id))",
+    "INSERT INTO \"user\" VALUES (1, 'alice', 1), (2, 'bob', 1)",
+    "INSERT INTO movie VALUES (1, 'Titanic', 1997, 7.9, '', 0, 1), "
+    "(2, 'Heat', 1995, 8.3, '', 0, 1)",
+    "INSERT INTO favorite VALUES (1, 1, '2024-01-01 10:00:00'), "
+    "(2, 1, '2024-01-02 10:00:00'), (2, 2, NULL)",
+)
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def query(engine, sql):
+    with engine.connect() as connection:
+        return connection.execute(text(sql)).all()
+
+
+def test_upgrade_brings_a_legacy_database_to_the_latest_version(legacy):
+    applied = []
+    assert upgrade(legacy, log=applied.append) == LATEST
+    assert len(applied) == len(MIGRATIONS)
+    with legacy.connect() as connection:
+        assert get_schema_version(connection) == LATEST
+    tables = set(inspect(legacy).get_table_names())
+    assert {"movie_fts", "data_version", "movie_popularity",
+            "movie_trigram"} <= tables
+    columns = {c["name"] for c in inspect(legacy).get_columns("movie")}
+    assert "updated_at" in columns
+
+
+def test_upgrade_indexes_existing_rows(legacy):
+    upgrade(legacy, log=lambda line: None)
+    assert query(
+        legacy, "SELECT rowid FROM movie_fts WHERE movie_fts MATCH 'tita*'"
+    ) == [(1,)]
+    counts = dict(query(
+        legacy,
+        "SELECT movie_id, favorites FROM movie_popularity WHERE week = -1",
+    ))
+    assert counts == {1: 2, 2: 1}
+    postings = query(
+        legacy, "SELECT count(*) FROM movie_trigram WHERE movie_id = 1"
+    )
+    assert postings == [(len(trigrams("Titanic")),)]
+
+
+def test_upgrade_is_idempotent(legacy):
+    upgrade(legacy, log=lambda line: None)
+    applied = []
+    assert upgrade(legacy, log=applied.append) == LATEST
+    assert applied == []
+
+
+def test_interrupted_step_can_run_again(legacy):
+    upgrade(legacy, log=lambda line: None)
+    # as if migration 4 had created its table but not bumped the version
+    with legacy.begin() as connection:
+        connection.execute(text("PRAGMA user_version = 3"))
+    assert upgrade(legacy, log=lambda line: None) == LATEST
+
+
+def test_data_version_is_created_from_the_model(legacy):
+    upgrade(legacy, log=lambda line: None)
+    columns = {
+        c["name"]: c for c in inspect(legacy).get_columns("data_version")
+    }
+    assert list(columns) == ["scope", "generation", "updated"]
+    assert not columns["generation"]["nullable"]
+    assert inspect(legacy).get_pk_constraint("data_version")[
+        "constrained_columns"
+    ] == ["scope"]
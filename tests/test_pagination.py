@@ -0,0 +1,144 @@
+import base64
+import json
+
+import pytest
+
+from database.pagination import (
+    InvalidCursor,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+)
+from tests.conftest import MOVIES
+
+ORDERINGS = {
+    None: lambda movie: movie[0],
+    "title": lambda movie: (movie[1], movie[0]),
+    "year": lambda movie: (-movie[2], -movie[0]),
+    "rating": lambda movie: (-movie[3], -movie[0]),
+}
+
+
+def token(payload):
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def expected_ids(movie_ids, sort_by):
+    rows = [(i, *movie) for i, movie in zip(movie_ids, MOVIES)]
+    return [row[0] for row in sorted(rows, key=ORDERINGS[sort_by])]
+
+
+def walk(dm, sort_by, page_size, backwards=False, **kwargs):
+    """Collect the ids of every page, following the cursors."""
+    pages = []
+    page = dm.get_movies_page(sort_by=sort_by, page_size=page_size, **kwargs)
+    if backwards:
+        while page.next_cursor:
+            page = dm.get_movies_page(
+                sort_by=sort_by, page_size=page_size,
+                after=page.next_cursor, **kwargs,
+            )
+    while True:
+        pages.append([movie.id for movie in page.items])
+        cursor = page.prev_cursor if backwards else page.next_cursor
+        if cursor is None:
+            break
+        page = dm.get_movies_page(
+            sort_by=sort_by, page_size=page_size, **kwargs,
+            **{"before" if backwards else "after": cursor},
+        )
+    if backwards:
+        pages.reverse()
+    return [movie_id for ids in pages for movie_id in ids]
+
+
+@pytest.mark.parametrize("sort_by", list(ORDERINGS))
+def test_pages_cover_the_catalogue_in_order(dm, catalogue, sort_by):
+    _, _, movie_ids = catalogue
+    assert walk(dm, sort_by, 5) == expected_ids(movie_ids, sort_by)
+
+
+@pytest.mark.parametrize("sort_by", list(ORDERINGS))
+def test_previous_pages_mirror_the_next_pages(dm, catalogue, sort_by):
+    assert walk(dm, sort_by, 4, backwards=True) == walk(dm, sort_by, 4)
+
+
+def test_first_and_last_page_have_no_outer_cursor(dm, catalogue):
+    first = dm.get_movies_page(page_size=10)
+    assert first.prev_cursor is None and first.next_cursor
+    last = dm.get_movies_page(page_size=10, after=first.next_cursor)
+    last = dm.get_movies_page(page_size=10, after=last.next_cursor)
+    assert len(last.items) == len(MOVIES) - 20
+    assert last.next_cursor is None and last.prev_cursor
+
+
+def test_pages_stay_stable_when_rows_are_added(dm, catalogue):
+    alice, _, _ = catalogue
+    first = dm.get_movies_page(sort_by="title", page_size=5)
+    dm.add_movie(alice, "Aardvark", 2020, 5.0, "")
+    second = dm.get_movies_page(
+        sort_by="title", page_size=5, after=first.next_cursor
+    )
+    titles = [movie.title for movie in first.items + second.items]
+    assert "Aardvark" not in titles
+    assert titles == sorted(titles)
+
+
+def test_search_pages_by_relevance(dm, catalogue):
+    _, _, movie_ids = catalogue
+    one_page = dm.get_movies_page(
+        query="dark", sort_by="relevance", page_size=10
+    )
+    matching = {
+        movie_id for movie_id, (title, _, _) in zip(movie_ids, MOVIES)
+        if "dark" in title.lower()
+    }
+    assert {movie.id for movie in one_page.items} == matching
+    assert walk(dm, "relevance", 1, query="dark") == [
+        movie.id for movie in one_page.items
+    ]
+
+
+def test_excluded_favourites_are_skipped(dm, catalogue):
+    _, bob, movie_ids = catalogue
+    dm.set_favorites(bob, add=movie_ids[:3])
+    ids = walk(dm, None, 5, user_id=bob, exclude_favorites=True)
+    assert ids == movie_ids[3:]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("title", ["Heat", 10])
+    assert decode_cursor(cursor, "title") == ["Heat", 10]
+    assert decode_cursor(None, "title") is None
+
+
+def test_cursor_of_another_sort_mode_restarts():
+    assert decode_cursor(encode_cursor("title", ["Heat", 10]), "year") is None
+
+
+@pytest.mark.parametrize("sort_by, cursor", [
+    (None, "not base64 ~~"),
+    (None, token([None, [True]])),
+    (None, token([None, [2 ** 63]])),
+    ("title", token(["title", [1997, 3]])),
+    ("title", token(["title", ["Heat"]])),
+    ("year", token(["year", [1997.5, 3]])),
+    ("rating", token(["rating", [{"a": 1}, 3]])),
+    ("relevance", token(["relevance", [-1.5, "3"]])),
+])
+def test_hand_edited_cursors_are_rejected(sort_by, cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, sort_by)
+
+
+def test_explore_answers_a_bad_cursor_with_400(client, catalogue):
+    bad = token(["title", [{"a": 1}, 3]])
+    assert client.get(f"/explore?sort=title&after={bad}").status_code == 400
+    good = encode_cursor("title", ["Heat", 10])
+    assert client.get(f"/explore?sort=title&after={good}").status_code == 200
+
+
+def test_page_size_is_clamped():
+    assert clamp_page_size(None) == clamp_page_size(0) == 24
+    assert clamp_page_size(10_000) == 200
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, update
+
+from database import db
+from database.models import Favorite, MoviePopularity
+from database.popularity import (
+    ALL_TIME,
+    bucket,
+    rebuild_popularity,
+    week_of,
+)
+
+
+def popularity():
+    return sorted(db.session.execute(select(
+        MoviePopularity.week, MoviePopularity.movie_id,
+        MoviePopularity.favorites,
+    )).all())
+
+
+def test_weeks_start_on_monday():
+    assert week_of(datetime(1970, 1, 5)) == 0
+    assert week_of(datetime(1970, 1, 11, 23, 59)) == 0
+    assert week_of(datetime(1970, 1, 12)) == 1
+    assert bucket("all") == ALL_TIME
+    assert bucket("week", datetime(1970, 1, 20)) == 2
+    with pytest.raises(ValueError):
+        bucket("month")
+
+
+def test_top_movies_follow_the_counts(dm, catalogue):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:2])
+    dm.set_favorites(bob, add=movie_ids[1:3])
+    top = dm.get_top_movies("all", 2)
+    # ties go to the newer movie
+    assert [(m.movie.id, m.favorites) for m in top] == [
+        (movie_ids[1], 2), (movie_ids[2], 1),
+    ]
+    assert [m.movie.id for m in dm.get_top_movies("week", 3)] == [
+        movie_ids[1], movie_ids[2], movie_ids[0],
+    ]
+    dm.toggle_favorite(alice, movie_ids[1])
+    assert [m.favorites for m in dm.get_top_movies("all", 3)] == [1, 1, 1]
+    with pytest.raises(ValueError):
+        dm.get_top_movies("month")
+
+
+def test_removal_counts_against_the_week_it_was_added(dm, catalogue):
+    _, bob, movie_ids = catalogue
+    dm.toggle_favorite(bob, movie_ids[0])
+    # the favourite was added in an earlier week
+    db.session.execute(
+        update(Favorite).values(created=datetime(2020, 1, 8))
+    )
+    rebuild_popularity(db.session)
+    db.session.commit()
+    dm.toggle_favorite(bob, movie_ids[0])
+    assert dm.get_top_movies("all") == []
+    assert dm.get_top_movies("week") == []
+    assert all(count == 0 for _, _, count in popularity())
+
+
+def test_deleted_movies_leave_the_leaderboards(dm, catalogue):
+    alice, _, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:2])
+    dm.delete_movie(movie_ids[0])
+    assert [m.movie.id for m in dm.get_top_movies("all")] == [movie_ids[1]]
+    assert {movie_id for _, movie_id, _ in popularity()} == {movie_ids[1]}
+
+
+def test_rebuild_matches_the_incremental_counts(dm, catalogue):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:5])
+    dm.set_favorites(bob, add=movie_ids[3:8])
+    dm.set_favorites(alice, remove=movie_ids[:2])
+    incremental = [row for row in popularity() if row[2]]
+    assert rebuild_popularity(db.session) == 8
+    assert popularity() == incremental
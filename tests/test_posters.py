@@ -0,0 +1,222 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import services
+from database.posters import (
+    HTTPFetcher,
+    PosterCache,
+    PosterFetchError,
+    sniff_image,
+    url_key,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 32
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script>'
+URL = "https://images.example/poster.png"
+
+
+@pytest.fixture
+def server():
+    """Local server answering ``/<name>`` with a canned response."""
+    responses = {
+        "png": ("image/png", PNG),
+        "svg": ("image/svg+xml", SVG),
+        "fake-png": ("image/png", SVG),
+        "html": ("text/html", b"<html></html>"),
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            mimetype, body = responses[self.path.lstrip("/")]
+            self.send_response(200)
+            self.send_header("Content-Type", mimetype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    fetched = {URL: (PNG, "image/png")}
+    cache = PosterCache(
+        str(tmp_path / "posters"), fetcher=lambda url: fetched[url]
+    )
+    yield cache
+    cache.shutdown()
+
+
+@pytest.fixture
+def poster_app(make_app, tmp_path):
+    app = make_app(POSTER_CACHE=True, POSTER_CACHE_DIR=str(tmp_path / "p"))
+    services(app).poster_cache.fetcher = lambda url: (PNG, "image/png")
+    return app
+
+
+def test_only_raster_images_are_recognised():
+    assert sniff_image(PNG) == "image/png"
+    assert sniff_image(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+    assert sniff_image(b"GIF89a...") == "image/gif"
+    assert sniff_image(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_image(b"RIFF\0\0\0\0WAVEfmt ") is None
+    assert sniff_image(SVG) is None
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/poster.jpg",
+    "http://10.0.0.1/poster.jpg",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/poster.jpg",
+    "http://localhost/poster.jpg",
+    "ftp://images.example/poster.jpg",
+    "file:///etc/passwd",
+])
+def test_fetcher_refuses_non_public_targets(url):
+    with pytest.raises(PosterFetchError):
+        HTTPFetcher(timeout=1)(url)
+
+
+def test_fetcher_refuses_the_local_server_by_default(server):
+    with pytest.raises(PosterFetchError, match="not a public address"):
+        HTTPFetcher(timeout=1)(f"{server}/png")
+
+
+def test_fetcher_accepts_raster_images(server):
+    fetch = HTTPFetcher(timeout=5, public_only=False)
+    assert fetch(f"{server}/png") == (PNG, "image/png")
+
+
+@pytest.mark.parametrize("name", ["svg", "fake-png", "html"])
+def test_fetcher_rejects_other_content(server, name):
+    # regression: any image/* type was stored and served, SVG included
+    with pytest.raises(PosterFetchError):
+        HTTPFetcher(timeout=5, public_only=False)(f"{server}/{name}")
+
+
+def test_fetcher_rejects_oversized_bodies(server):
+    with pytest.raises(PosterFetchError, match="larger"):
+        HTTPFetcher(timeout=5, max_bytes=8, public_only=False)(
+            f"{server}/png"
+        )
+
+
+def test_cache_stores_by_content(cache):
+    stored = cache.fetch(URL)
+    assert cache.lookup(URL) == stored
+    assert stored.mimetype == "image/png"
+    with open(stored.path, "rb") as f:
+        assert f.read() == PNG
+    assert cache.lookup("https://images.example/other.png") is None
+
+
+def test_cache_rejects_svg_and_ignores_old_svg_entries(cache, tmp_path):
+    cache.fetcher = lambda url: (SVG, "image/png")
+    with pytest.raises(PosterFetchError):
+        cache.fetch(URL)
+    cache.fetcher = lambda url: (PNG, "image/png")
+    cache.fetch(URL)
+    # an entry written before SVGs were refused
+    key = url_key(URL)
+    path = tmp_path / "posters" / "urls" / key[:2] / key
+    digest = path.read_text().split()[0]
+    path.write_text(f"{digest} image/svg+xml")
+    assert cache.lookup(URL) is None
+
+
+def test_thumbnails_are_generated(cache):
+    image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    image.new("RGB", (800, 1200), "red").save(buffer, "PNG")
+    cache.fetcher = lambda url: (buffer.getvalue(), "image/png")
+    cache.fetch(URL)
+    thumbnail = cache.lookup(URL, width=300)
+    assert thumbnail.mimetype == "image/jpeg"
+    assert image.open(thumbnail.path).size == (320, 480)
+    assert cache.lookup(URL).mimetype == "image/png"
+
+
+def test_eviction_keeps_the_cache_under_budget(tmp_path):
+    images = {
+        f"https://images.example/{n}.png": (PNG + bytes([n]), "image/png")
+        for n in range(5)
+    }
+    cache = PosterCache(
+        str(tmp_path), max_bytes=len(PNG) * 3, fetcher=images.__getitem__,
+        widths=(),
+    )
+    for url in images:
+        cache.fetch(url)
+    assert cache.size() <= len(PNG) * 3
+    cache.shutdown()
+
+
+def test_miss_serves_the_placeholder(poster_app, catalogue):
+    alice, _, _ = catalogue
+    with poster_app.app_context():
+        movie = services(poster_app).data_manager.add_movie(
+            alice, "Paprika", 2006, 7.7, URL
+        )
+        services(poster_app).poster_cache.lookup = lambda *args: None
+    response = poster_app.test_client().get(f"/posters/{movie.id}")
+    # regression: a miss redirected to the user-supplied URL
+    assert response.status_code == 200
+    assert "Location" not in response.headers
+    assert response.mimetype == "image/svg+xml"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "default-src 'none'" in response.headers[
+        "Content-Security-Policy"
+    ]
+    assert response.cache_control.no_store
+
+
+def test_hit_serves_the_cached_image(poster_app, catalogue):
+    alice, _, _ = catalogue
+    with poster_app.app_context():
+        movie = services(poster_app).data_manager.add_movie(
+            alice, "Paprika", 2006, 7.7, URL
+        )
+    services(poster_app).poster_cache.fetch(URL)
+    client = poster_app.test_client()
+    response = client.get(f"/posters/{movie.id}")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.data == PNG
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "sandbox" in response.headers["Content-Security-Policy"]
+    etag = response.headers["ETag"]
+    assert client.get(
+        f"/posters/{movie.id}", headers={"If-None-Match": etag}
+    ).status_code == 304
+    assert client.get("/posters/999").status_code == 404
+
+
+def test_cache_follows_only_its_own_data_manager(make_app, tmp_path,
+                                                 catalogue):
+    alice, _, _ = catalogue
+    apps = [
+        make_app(POSTER_CACHE=True, POSTER_CACHE_DIR=str(tmp_path / name))
+        for name in ("a", "b")
+    ]
+    requested = {id(app): [] for app in apps}
+    for app in apps:
+        services(app).poster_cache.prefetch = requested[id(app)].append
+    first, second = apps
+    with first.app_context():
+        services(first).data_manager.add_movie(alice, "Heat", 1995, 8.3, URL)
+    assert requested == {id(first): [URL], id(second): []}
+    services(first).close()
+    with first.app_context():
+        services(first).data_manager.add_movie(alice, "Up", 2009, 8.3, URL)
+    assert requested[id(first)] == [URL]
@@ -0,0 +1,248 @@
+import math
+import random
+import threading
+
+import pytest
+
+from app import services
+from database import db
+from database.recommendations import Recommender
+from database.sqlite_data_manager import FAVORITES, SQLiteDataManager
+
+
+@pytest.fixture
+def recommender(app, dm):
+    """A recommender following ``dm``, reading like the app's."""
+    def read(statement):
+        with app.app_context():
+            return db.session.execute(statement).all()
+
+    recommender = Recommender(read, FAVORITES, top_k=3, max_age=0)
+    recommender.connect_signals(dm)
+    yield recommender
+    recommender.disconnect_signals()
+
+
+def fresh(recommender):
+    """A recommender loaded from scratch with the same settings."""
+    other = Recommender(
+        recommender._read, FAVORITES, top_k=recommender.top_k,
+        max_user_favorites=recommender.max_user_favorites,
+    )
+    other.load()
+    return other
+
+
+def cosine(favorites, movie_id):
+    """Brute-force similarities of ``movie_id`` over ``{user: set}``."""
+    fans = {}
+    for user_id, movies in favorites.items():
+        for other in movies:
+            fans.setdefault(other, set()).add(user_id)
+    scores = {}
+    for other, users in fans.items():
+        shared = len(users & fans.get(movie_id, set()))
+        if other != movie_id and shared:
+            scores[other] = shared / math.sqrt(
+                len(users) * len(fans[movie_id])
+            )
+    return scores
+
+
+def assert_rows_consistent(recommender):
+    """Cached rows and the reverse index agree with a fresh load."""
+    expected = fresh(recommender)
+    for movie_id, row in recommender._rows.items():
+        assert {k: v for k, v in row.counts.items() if v} == (
+            expected._row(movie_id).counts
+        )
+        assert [m for _, m in row.top] == [
+            m for _, m in expected._row(movie_id).top
+        ]
+        for other in row.counts:
+            assert movie_id in recommender._counted_in[other]
+    for other, rows in recommender._counted_in.items():
+        assert all(other in recommender._rows[m].counts for m in rows)
+
+
+def test_neighbours_are_ranked_by_cosine_similarity(dm, catalogue,
+                                                    recommender):
+    alice, bob, movie_ids = catalogue
+    carol = dm.add_user("carol").id
+    favorites = {
+        alice: set(movie_ids[0:3]),
+        bob: set(movie_ids[0:2]) | {movie_ids[5]},
+        carol: {movie_ids[0], movie_ids[5], movie_ids[6]},
+    }
+    for user_id, movies in favorites.items():
+        dm.set_favorites(user_id, add=movies)
+    scores = cosine(favorites, movie_ids[0])
+    best = sorted(((s, m) for m, s in scores.items()), reverse=True)[:3]
+    assert recommender.neighbours(movie_ids[0]) == pytest.approx(best)
+    assert recommender.neighbours(movie_ids[20]) == []
+
+
+def test_because_you_liked_skips_seen_movies(dm, catalogue, recommender):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[0:4])
+    dm.set_favorites(bob, add=movie_ids[0:2])
+    rows = recommender.because_you_liked(bob, seeds=2, limit=5)
+    # the first seed found both; equal scores go to the higher id
+    assert rows == [(movie_ids[1], [movie_ids[3], movie_ids[2]])]
+
+
+def test_toggles_patch_the_cached_rows(dm, catalogue, recommender):
+    alice, bob, movie_ids = catalogue
+    users = [alice, bob] + [dm.add_user(f"user{i}").id for i in range(4)]
+    rng = random.Random(7)
+    recommender.load()
+    generation = recommender.generation
+    for step in range(120):
+        dm.toggle_favorite(rng.choice(users), rng.choice(movie_ids[:8]))
+        if step % 10 == 0:
+            # cache some rows, so there is something to patch
+            for movie_id in movie_ids[:8]:
+                recommender.neighbours(movie_id)
+    # every toggle was applied in place, none caused a reload
+    assert recommender.generation == generation + 120
+    assert recommender._rows
+    assert_rows_consistent(recommender)
+
+
+def test_deletes_drop_the_movie_from_every_row(dm, catalogue, recommender):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:3])
+    dm.set_favorites(bob, add=movie_ids[:3])
+    for movie_id in movie_ids[:3]:
+        recommender.neighbours(movie_id)
+    dm.delete_movie(movie_ids[1])
+    assert movie_ids[1] not in recommender._counted_in
+    assert [m for _, m in recommender.neighbours(movie_ids[0])] == [
+        movie_ids[2]
+    ]
+    assert_rows_consistent(recommender)
+
+
+def test_heavy_users_are_not_counted(dm, catalogue, recommender):
+    alice, bob, movie_ids = catalogue
+    recommender.max_user_favorites = 3
+    dm.set_favorites(bob, add=movie_ids[:2])
+    recommender.neighbours(movie_ids[0])
+    dm.set_favorites(alice, add=movie_ids[:3])
+    assert len(recommender.neighbours(movie_ids[0])) == 2
+    # the fourth favourite takes alice out of the counts
+    dm.toggle_favorite(alice, movie_ids[3])
+    assert [m for _, m in recommender.neighbours(movie_ids[0])] == [
+        movie_ids[1]
+    ]
+    assert_rows_consistent(recommender)
+
+
+def test_rows_are_evicted_with_their_reverse_entries(dm, catalogue,
+                                                     recommender):
+    alice, _, movie_ids = catalogue
+    recommender.max_rows = 2
+    dm.set_favorites(alice, add=movie_ids[:4])
+    for movie_id in movie_ids[:4]:
+        recommender.neighbours(movie_id)
+    assert list(recommender._rows) == movie_ids[2:4]
+    assert all(
+        rows <= set(movie_ids[2:4])
+        for rows in recommender._counted_in.values()
+    )
+
+
+def test_other_writers_trigger_a_background_reload(app, dm, catalogue,
+                                                   recommender):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:2])
+    recommender.neighbours(movie_ids[0])
+    reading = threading.Event()
+    release = threading.Event()
+    read = recommender._read
+
+    def slow_read(statement):
+        rows = read(statement)
+        if threading.current_thread().name == "recommender":
+            reading.set()
+            release.wait(5)
+        return rows
+
+    recommender._read = slow_read
+    # another process: this recommender gets no signal
+    with app.app_context():
+        SQLiteDataManager().set_favorites(bob, add=movie_ids[:2])
+    # the read starts the reload and is answered from the old maps
+    assert len(recommender.neighbours(movie_ids[0])) == 1
+    assert reading.wait(5)
+    loader = recommender._loader
+    assert recommender.neighbours(movie_ids[0])[0][0] == pytest.approx(1.0)
+    # a toggle signalled during the reload is kept
+    dm.toggle_favorite(alice, movie_ids[2])
+    release.set()
+    loader.join(5)
+    assert recommender.user_movies[bob] == dict.fromkeys(movie_ids[:2])
+    assert movie_ids[2] in recommender.user_movies[alice]
+    assert recommender.generation == recommender._current_generation()
+
+
+def test_recommendations_are_shown_on_the_first_page(client, dm, catalogue):
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(alice, add=movie_ids[:3])
+    dm.set_favorites(bob, add=movie_ids[:1])
+    body = client.get(f"/explore?user_id={bob}").get_data(as_text=True)
+    assert "Because you liked The Dark Knight" in body
+    body = client.get(f"/explore?user_id={bob}&q=dark").get_data(
+        as_text=True
+    )
+    assert "Because you liked" not in body
+
+
+def test_warm_up_reads_the_favourites(app, catalogue):
+    from app import warm_up
+
+    warm_up(app)
+    assert services(app).recommender.generation is not None
+
+
+def test_recommendations_follow_other_users_favourites(client, dm,
+                                                       catalogue):
+    # regression: the first page of a user shows recommendations built
+    # from everyone's favourites, so another user's toggle must not be
+    # answered with a stale 304
+    alice, bob, movie_ids = catalogue
+    dm.set_favorites(bob, add=movie_ids[:2])
+    url = f"/explore?user_id={bob}"
+    etag = client.get(url).headers["ETag"]
+    dm.toggle_favorite(alice, movie_ids[0])
+    assert client.get(
+        url, headers={"If-None-Match": etag}
+    ).status_code == 200
+
+
+def test_later_pages_ignore_other_users_favourites(client, dm, catalogue):
+    alice, bob, movie_ids = catalogue
+    first = client.get(f"/explore?user_id={bob}&per_page=5")
+    assert first.status_code == 200
+    page = dm.get_movie_cards_page(page_size=5, user_id=bob,
+                                   exclude_favorites=True)
+    url = f"/explore?user_id={bob}&per_page=5&after={page.next_cursor}"
+    etag = client.get(url).headers["ETag"]
+    dm.toggle_favorite(alice, movie_ids[0])
+    assert client.get(
+        url, headers={"If-None-Match": etag}
+    ).status_code == 304
+
+
+def test_without_recommendations_other_favourites_are_ignored(
+        make_app, catalogue):
+    app = make_app(RECOMMENDATIONS=False)
+    client = app.test_client()
+    alice, bob, movie_ids = catalogue
+    url = f"/explore?user_id={bob}"
+    etag = client.get(url).headers["ETag"]
+    with app.app_context():
+        services(app).data_manager.toggle_favorite(alice, movie_ids[0])
+    assert client.get(
+        url, headers={"If-None-Match": etag}
+    ).status_code == 304
@@ -0,0 +1,45 @@
+from app import services
+from database.cache import LRUCache, NullCache, make_cache
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {
+        "hits": 3, "misses": 1, "hit_ratio": 0.75, "size": 2,
+    }
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("database.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_size_zero_disables_caching():
+    cache = make_cache(0)
+    assert isinstance(cache, NullCache)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_fragments_follow_the_generations(app, client, dm, catalogue):
+    _, _, movie_ids = catalogue
+    cache = services(app).response_cache
+    client.get("/explore?per_page=200")
+    client.get("/explore?per_page=200")
+    assert cache.hits == 1
+    dm.update_movie(movie_ids[0], "Renamed Knight", 2008, 9.0, "")
+    body = client.get("/explore?per_page=200").get_data(as_text=True)
+    assert "Renamed Knight" in body
+    assert cache.hits == 1
+    assert client.get("/cache/stats").json["hits"] == 1
@@ -0,0 +1,66 @@
+from sqlalchemy import text
+
+from database import db
+from database.search import FTS_TABLE, match_expression
+
+
+def search(dm, query):
+    page = dm.get_movies_page(query=query, sort_by="title", page_size=200)
+    return [movie.title for movie in page.items]
+
+
+def test_added_movies_are_searchable(dm, catalogue):
+    assert search(dm, "dark kni") == [
+        "The Dark Knight", "The Dark Knight Rises"
+    ]
+
+
+def test_search_ignores_case_and_accents(dm, catalogue):
+    assert search(dm, "AMELIE") == ["Amélie"]
+
+
+def test_update_trigger_reindexes_the_title(dm, catalogue):
+    _, _, movie_ids = catalogue
+    dm.update_movie(movie_ids[0], "The Bright Knight", 2008, 9.0, "")
+    assert search(dm, "bright") == ["The Bright Knight"]
+    assert search(dm, "dark knight") == ["The Dark Knight Rises"]
+
+
+def test_delete_trigger_drops_the_title(dm, catalogue):
+    _, _, movie_ids = catalogue
+    dm.delete_movie(movie_ids[2])
+    assert search(dm, "titanic") == []
+
+
+def test_raw_sql_writes_are_indexed(dm, catalogue):
+    alice, _, _ = catalogue
+    db.session.execute(text(
+        "INSERT INTO movie (title, year, rating, poster, user_id) "
+        "VALUES ('Paprika', 2006, 7.7, '', :user_id)"
+    ), {"user_id": alice})
+    db.session.commit()
+    assert search(dm, "papri") == ["Paprika"]
+
+
+def test_bulk_import_indexes_every_batch(dm, catalogue):
+    alice, _, _ = catalogue
+    rows = [(f"Imported {n}", 2000, 5.0, "") for n in range(25)]
+    assert dm.add_movies(alice, rows, batch_size=4,
+                         batches_per_transaction=2) == 25
+    assert len(search(dm, "imported")) == 25
+    # the triggers are live again after the import
+    dm.add_movie(alice, "Imported Late", 2001, 5.0, "")
+    assert len(search(dm, "imported")) == 26
+
+
+def test_index_matches_the_table(dm, catalogue):
+    # integrity-check of an external content table fails on any drift
+    db.session.execute(text(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) "
+        "VALUES ('integrity-check', 1)"
+    ))
+
+
+def test_match_expression_quotes_user_input():
+    assert match_expression('dark "knight') == '"dark"* "knight"*'
+    assert match_expression("  ") is None
@@ -0,0 +1,212 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from database.sharding import (
+    SHARD_FILE,
+    ShardedSQLiteDataManager,
+    _Database,
+    create_layout,
+    shard_database,
+    shard_of_user,
+)
+from database.sqlite_data_manager import FAVORITES, USERS
+
+SORTS = [None, "title", "year", "rating"]
+
+
+@pytest.fixture
+def single(dm, catalogue):
+    """The catalogue plus users with favourites spread over the shards."""
+    alice, bob, movie_ids = catalogue
+    dm.add_movie(bob, "Bob's Movie", 2020, 6.5, "")
+    for number in range(6):
+        user_id = dm.add_user(f"fan {number}").id
+        dm.set_favorites(user_id, add=movie_ids[number:number + 4])
+    dm.set_favorites(bob, add=movie_ids[:2])
+    return dm
+
+
+@pytest.fixture(params=[1, 3])
+def layout(request, single, database_path, tmp_path):
+    """The directory and shard count of the sharded catalogue."""
+    source = create_engine(f"sqlite:///{database_path}")
+    directory = tmp_path / f"shards-{request.param}"
+    shard_database(source, directory, request.param, log=lambda line: None)
+    source.dispose()
+    return directory, request.param
+
+
+@pytest.fixture
+def sharded(layout):
+    manager = ShardedSQLiteDataManager(str(layout[0]))
+    yield manager
+    manager.close()
+
+
+def walk(manager, sort_by, **kwargs):
+    ids, cursor = [], None
+    while True:
+        page = manager.get_movie_cards_page(
+            sort_by=sort_by, after=cursor, page_size=5, **kwargs
+        )
+        ids += [movie.id for movie in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("sort_by", SORTS)
+def test_pages_match_the_single_file(single, sharded, sort_by):
+    assert walk(sharded, sort_by) == walk(single, sort_by)
+
+
+def test_search_and_favourite_exclusion_match(single, sharded, catalogue):
+    _, bob, _ = catalogue
+    for kwargs in ({"query": "dark"}, {"user_id": bob,
+                                       "exclude_favorites": True}):
+        assert walk(sharded, "title", **kwargs) == walk(
+            single, "title", **kwargs
+        )
+
+
+def test_aggregates_match_the_single_file(single, sharded):
+    assert sharded.get_user_summaries() == single.get_user_summaries()
+    top = [(m.movie.id, m.favorites) for m in single.get_top_movies("all")]
+    assert [
+        (m.movie.id, m.favorites) for m in sharded.get_top_movies("all")
+    ] == top
+    assert [m.id for m in sharded.fuzzy_search("dark nite")] == [
+        m.id for m in single.fuzzy_search("dark nite")
+    ]
+
+
+def test_writes_land_in_the_user_shard(layout, sharded, catalogue):
+    directory, shards = layout
+    _, bob, movie_ids = catalogue
+    before = sharded.get_generations(USERS, FAVORITES)
+    movie = sharded.add_movie(bob, "New One", 2024, 7.0, "")
+    assert sharded.toggle_favorite(bob, movie.id) is True
+    assert movie.id in {m.id for m in sharded.get_favorite_movies(bob)}
+    assert sharded.toggle_favorite(bob, movie_ids[0]) is False
+    after = sharded.get_generations(USERS, FAVORITES)
+    assert all(b > a for a, b in zip(before, after))
+    holders = []
+    for number in range(shards):
+        path = directory / SHARD_FILE.format(number)
+        with sqlite3.connect(path) as connection:
+            if connection.execute(
+                "SELECT 1 FROM favorite WHERE user_id = ? AND movie_id = ?",
+                (bob, movie.id),
+            ).fetchone():
+                holders.append(number)
+        connection.close()
+    assert holders == [shard_of_user(bob, shards)]
+
+
+def test_delete_drops_favourites_in_every_shard(sharded, catalogue):
+    _, _, movie_ids = catalogue
+    assert sharded.delete_movie(movie_ids[3])
+    assert sharded.get_movies([movie_ids[3]]) == {}
+    assert all(
+        movie.movie.id != movie_ids[3]
+        for movie in sharded.get_top_movies("all", 50)
+    )
+    assert sum(u.favorite_count for u in sharded.get_user_summaries()) == (
+        6 * 4 + 2 - 4
+    )
+
+
+def test_ids_of_deleted_movies_are_not_reused(layout, sharded, catalogue):
+    _, bob, _ = catalogue
+    first = sharded.add_movie(bob, "First", 2024, 7.0, "").id
+    assert sharded.delete_movie(first)
+    second = sharded.add_movie(bob, "Second", 2024, 7.0, "").id
+    assert second > first
+    assert sharded._locate([second]) == {
+        shard_of_user(bob, layout[1]): [second]
+    }
+    # a reopened layout continues the sequence
+    reopened = ShardedSQLiteDataManager(str(layout[0]))
+    assert reopened.add_movie(bob, "Third", 2024, 7.0, "").id > second
+    reopened.close()
+
+
+def test_an_interrupted_delete_is_finished_later(layout, sharded,
+                                                 catalogue, monkeypatch):
+    if layout[1] == 1:
+        pytest.skip("a single shard deletes in one transaction")
+    _, _, movie_ids = catalogue
+    favourites = sum(u.favorite_count for u in sharded.get_user_summaries())
+    transaction = _Database.transaction
+    calls = []
+
+    def locked_after_the_owner(database):
+        # the owner's commit goes through, the other shards are locked
+        calls.append(database)
+        if len(calls) > 1:
+            raise sqlite3.OperationalError("database is locked")
+        return transaction(database)
+
+    monkeypatch.setattr(_Database, "transaction", locked_after_the_owner)
+    with pytest.raises(sqlite3.OperationalError):
+        sharded.delete_movie(movie_ids[3])
+    monkeypatch.undo()
+    assert sharded.get_movies([movie_ids[3]]) == {}
+    assert sharded.finish_deletes() == 1
+    assert sharded.finish_deletes() == 0
+    # the favourites of fans 0-3 in every shard are gone
+    assert sum(u.favorite_count for u in sharded.get_user_summaries()) == (
+        favourites - 4
+    )
+    assert all(
+        movie.movie.id != movie_ids[3]
+        for movie in sharded.get_top_movies("all", 50)
+    )
+
+
+@pytest.mark.parametrize("write", ["toggle", "set"])
+def test_favourites_of_a_movie_deleted_meanwhile_are_removed(
+        sharded, catalogue, write):
+    _, bob, movie_ids = catalogue
+    known = sharded._known_movie_ids
+
+    def deleted_after_the_check(ids):
+        # another worker deletes the movie between check and write
+        found = known(ids)
+        sharded._known_movie_ids = known
+        sharded.delete_movie(movie_ids[5])
+        return found
+
+    sharded._known_movie_ids = deleted_after_the_check
+    if write == "toggle":
+        assert sharded.toggle_favorite(bob, movie_ids[5]) is None
+    else:
+        assert sharded.set_favorites(bob, add=[movie_ids[5]]) == {
+            movie_ids[5]: False
+        }
+    assert movie_ids[5] not in sharded._favorite_ids(bob)
+
+
+def test_unknown_ids_are_refused(sharded, catalogue):
+    _, bob, movie_ids = catalogue
+    assert sharded.toggle_favorite(bob, 9999) is None
+    assert sharded.toggle_favorite(999, movie_ids[0]) is None
+    assert sharded.set_favorites(999, add=[movie_ids[0]]) == {
+        movie_ids[0]: False
+    }
+
+
+def test_shard_of_user_is_stable_and_in_range():
+    placed = [shard_of_user(user_id, 8) for user_id in range(1, 1000)]
+    assert placed == [shard_of_user(user_id, 8) for user_id in range(1, 1000)]
+    assert set(placed) == set(range(8))
+
+
+def test_layout_refuses_existing_files(tmp_path):
+    create_layout(tmp_path, 2)
+    with pytest.raises(FileExistsError):
+        create_layout(tmp_path, 2)
+    with pytest.raises(ValueError):
+        create_layout(tmp_path / "none", 0)
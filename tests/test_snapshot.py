@@ -0,0 +1,185 @@
+import itertools
+
+import pytest
+from sqlalchemy import text
+
+from app import services
+from database import db
+from database.pagination import InvalidCursor
+from database.sqlite_data_manager import SQLiteDataManager
+from tests.conftest import MOVIES
+
+SORTS = [None, "title", "year", "rating", "relevance"]
+
+
+@pytest.fixture
+def snapshot_app(make_app):
+    return make_app(CATALOGUE_SNAPSHOT=True, CATALOGUE_SNAPSHOT_MAX_AGE=0)
+
+
+@pytest.fixture
+def sdm(snapshot_app):
+    """The snapshot-backed data manager, inside an app context."""
+    with snapshot_app.app_context():
+        yield services(snapshot_app).data_manager
+        db.session.remove()
+
+
+@pytest.fixture
+def sql():
+    """A data manager without a snapshot on the same database."""
+    return SQLiteDataManager()
+
+
+def walk(dm, **kwargs):
+    """Every page of a query forward, then back from the last one."""
+    pages = [dm.get_movie_cards_page(page_size=5, **kwargs)]
+    while pages[-1].next_cursor:
+        pages.append(dm.get_movie_cards_page(
+            page_size=5, after=pages[-1].next_cursor, **kwargs
+        ))
+    page = pages[-1]
+    while page.prev_cursor:
+        page = dm.get_movie_cards_page(
+            page_size=5, before=page.prev_cursor, **kwargs
+        )
+        pages.append(page)
+    return pages
+
+
+@pytest.mark.parametrize("sort_by", SORTS)
+@pytest.mark.parametrize("query", ["", "dark", "the d", "a", "?"])
+def test_pages_match_sql(sdm, sql, catalogue, sort_by, query):
+    alice, bob, movie_ids = catalogue
+    sdm.set_favorites(bob, add=movie_ids[::3])
+    for user_id, exclude in ((None, False), (bob, False), (bob, True)):
+        arguments = dict(
+            query=query, sort_by=sort_by, user_id=user_id,
+            exclude_favorites=exclude,
+        )
+        assert walk(sdm, **arguments) == walk(sql, **arguments)
+
+
+def test_cursors_work_across_both_paths(sdm, sql, catalogue):
+    first = sql.get_movie_cards_page(sort_by="rating", page_size=4)
+    second = sdm.get_movie_cards_page(
+        sort_by="rating", page_size=4, after=first.next_cursor
+    )
+    assert second == sql.get_movie_cards_page(
+        sort_by="rating", page_size=4, after=first.next_cursor
+    )
+    with pytest.raises(InvalidCursor):
+        sdm.get_movie_cards_page(sort_by="rating", after="garbage")
+
+
+def test_entity_pages_load_only_the_page(sdm, sql, catalogue):
+    _, bob, movie_ids = catalogue
+    sdm.set_favorites(bob, add=movie_ids[:2])
+    page = sdm.get_movies_page(sort_by="title", page_size=6, user_id=bob)
+    expected = sql.get_movies_page(sort_by="title", page_size=6, user_id=bob)
+    assert [(m.id, m.is_favorite) for m in page.items] == [
+        (m.id, m.is_favorite) for m in expected.items
+    ]
+    assert page.next_cursor == expected.next_cursor
+
+
+def test_writes_are_applied_in_place(sdm, sql, catalogue):
+    alice, _, movie_ids = catalogue
+    snapshot = sdm.snapshot
+    sdm.get_movie_cards_page()
+    loads = snapshot.generation
+
+    added = sdm.add_movie(alice, "Arrival", 2016, 7.9, "").id
+    sdm.update_movie(movie_ids[2], "Titanic II", 2030, 1.0, "")
+    sdm.delete_movie(movie_ids[0])
+    sdm.add_movies(alice, [("Paprika", 2006, 7.7, "")])
+
+    # four signals, no reload
+    assert snapshot.generation == loads + 4
+    assert len(snapshot) == len(MOVIES) + 1
+    for sort_by in SORTS[:4]:
+        assert walk(sdm, sort_by=sort_by) == walk(sql, sort_by=sort_by)
+    ids = [card.id for card in sdm.get_movie_cards_page(
+        query="titanic").items]
+    assert ids == [movie_ids[2]]
+    newest = sdm.get_movie_cards_page(sort_by="year", page_size=2).items
+    assert [card.id for card in newest] == [movie_ids[2], added]
+
+
+def test_deletes_are_compacted(sdm, sql, catalogue):
+    _, _, movie_ids = catalogue
+    for movie_id in movie_ids[:10]:
+        sdm.delete_movie(movie_id)
+    assert sdm.snapshot.dead < len(MOVIES) * 0.25
+    for sort_by in SORTS[:4]:
+        assert walk(sdm, sort_by=sort_by) == walk(sql, sort_by=sort_by)
+
+
+def test_writes_of_other_processes_trigger_a_reload(sdm, sql, catalogue):
+    _, _, movie_ids = catalogue
+    sdm.get_movie_cards_page()
+    # like another worker: no signal reaches this snapshot
+    sql.update_movie(movie_ids[1], "Knight Falls", 2012, 9.9, "")
+    first = sdm.get_movie_cards_page(sort_by="rating", page_size=1)
+    assert [card.title for card in first.items] == ["Knight Falls"]
+
+
+def test_max_age_defers_the_generation_check(make_app, sql, catalogue):
+    app = make_app(CATALOGUE_SNAPSHOT=True,
+                   CATALOGUE_SNAPSHOT_MAX_AGE=3600)
+    with app.app_context():
+        dm = services(app).data_manager
+        dm.get_movie_cards_page()
+        with db.engine.begin() as connection:
+            connection.execute(text("UPDATE movie SET title = 'X'"))
+        assert "X" not in {c.title for c in dm.get_movie_cards_page().items}
+
+
+def test_snapshot_follows_only_its_own_data_manager(make_app, sql,
+                                                    catalogue):
+    alice, _, _ = catalogue
+    apps = [make_app(CATALOGUE_SNAPSHOT=True) for _ in range(2)]
+    snapshots = [services(app).data_manager.snapshot for app in apps]
+    for app in apps:
+        with app.app_context():
+            services(app).data_manager.get_movie_cards_page()
+    generations = [snapshot.generation for snapshot in snapshots]
+    with apps[0].app_context():
+        services(apps[0]).data_manager.add_movie(alice, "Up", 2009, 8.3, "")
+    assert [s.generation for s in snapshots] == [
+        generations[0] + 1, generations[1]
+    ]
+    services(apps[0]).close()
+    with apps[0].app_context():
+        services(apps[0]).data_manager.add_movie(alice, "Ran", 1985, 8.2, "")
+    assert snapshots[0].generation == generations[0] + 1
+
+
+def test_explore_is_served_from_the_snapshot(snapshot_app, sdm, catalogue):
+    _, bob, movie_ids = catalogue
+    sdm.set_favorites(bob, add=movie_ids[:1])
+    client = snapshot_app.test_client()
+    body = client.get(
+        f"/explore?user_id={bob}&q=dark&sort=relevance&per_page=50"
+    ).get_data(as_text=True)
+    assert "The Dark Knight Rises" in body and "Dark City" in body
+    assert len(sdm.snapshot) == len(MOVIES)
+
+
+def test_get_all_movies(sdm, catalogue):
+    rows = sdm.get_all_movies("dark", sort_by="year", limit=2)
+    assert [row.title for row in rows] == [
+        "The Dark Knight Rises", "The Dark Knight"
+    ]
+    assert [row.title for row in sdm.get_all_movies(offset=20)] == [
+        title for title, _, _ in MOVIES[20:]
+    ]
+
+
+def test_memory_report(sdm, catalogue):
+    sdm.get_movie_cards_page()
+    report = sdm.snapshot.memory_report()
+    assert report["total"] == sum(
+        size for name, size in report.items() if name != "total"
+    )
+    assert all(size > 0 for size in itertools.islice(report.values(), 8))
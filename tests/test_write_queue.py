@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import services
+from database import signals
+from database.sqlite_data_manager import FAVORITES, user_scope
+
+
+@pytest.fixture
+def queued(make_app, catalogue):
+    """An app with the write queue on the catalogue's database."""
+    app = make_app(WRITE_QUEUE=True, WRITE_QUEUE_MAX_DELAY_MS=20)
+    with app.app_context():
+        yield services(app).data_manager
+
+
+def in_threads(count, target):
+    errors = []
+
+    def run(number):
+        try:
+            target(number)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(number,))
+        for number in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_concurrent_writes_are_committed_in_groups(queued, catalogue):
+    alice, bob, movie_ids = catalogue
+    before = queued.get_generations(FAVORITES, user_scope(bob))
+    results = {}
+
+    def toggle(number):
+        results[number] = queued.toggle_favorite(bob, movie_ids[number])
+
+    in_threads(len(movie_ids), toggle)
+    assert set(results.values()) == {True}
+    assert {m.id for m in queued.get_favorite_movies(bob)} == set(movie_ids)
+    after = queued.get_generations(FAVORITES, user_scope(bob))
+    # one bump per write, also when they were committed together
+    assert [b - a for a, b in zip(before, after)] == [len(movie_ids)] * 2
+    writer = queued.write_queue
+    assert writer.committed == len(movie_ids)
+    assert writer.groups <= writer.committed
+
+
+def test_failed_write_does_not_fail_its_group(queued, catalogue):
+    failures = []
+
+    def add(number):
+        try:
+            queued.add_user("alice" if number == 0 else f"user {number}")
+        except IntegrityError:
+            failures.append(number)
+
+    in_threads(6, add)
+    assert failures == [0]
+    names = {user.name for user in queued.get_all_users()}
+    assert {f"user {number}" for number in range(1, 6)} <= names
+
+
+def test_signals_are_sent_after_the_commit(queued, catalogue):
+    _, bob, movie_ids = catalogue
+    seen = []
+
+    def receiver(sender, user_id, movie_id, added):
+        # the favourite is visible to other connections by now
+        seen.append(movie_id in {
+            m.id for m in sender.get_favorite_movies(user_id)
+        })
+
+    signals.favorite_toggled.connect(receiver, sender=queued)
+    try:
+        queued.toggle_favorite(bob, movie_ids[0])
+    finally:
+        signals.favorite_toggled.disconnect(receiver)
+    assert seen == [True]
+
+
+def test_unknown_ids_are_refused_through_the_queue(queued, catalogue):
+    _, bob, _ = catalogue
+    before = queued.get_generations(FAVORITES, user_scope(bob))
+    assert queued.toggle_favorite(bob, 9999) is None
+    assert queued.get_generations(FAVORITES, user_scope(bob)) == before
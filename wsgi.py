@@ -0,0 +1,17 @@
+"""
+WSGI entry point.
+
+Usage:
+    pip install gunicorn
+    gunicorn --preload -w 4 wsgi:app
+
+``--preload`` builds and warms up the app once in the master (see
+:func:`app.warm_up`), so workers fork with the code imported, the
+templates compiled and the main queries' SQL cached. Each worker opens
+its own connections and threads after the fork, see
+:func:`app.init_worker`.
+"""
+from app import create_app, warm_up
+
+app = create_app()
+warm_up(app)